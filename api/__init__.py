@@ -1,41 +1,67 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
-import uuid
+import re
 import time
-from os.path import join as path_join
 
-# Путь к директории для хранения сессионных данных
-STORAGE_DIR = "/tmp/init_data"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+from api import _session_token
+from api._codec import dumps, encode_response, loads, send_format_headers
+from api._etag import content_etag, etag_matches, id_etag, immutable_cache_control, send_not_modified
+from api._ingest import RequestBodyError, request_content_length, staged_json_object
+from api._metrics import instrument, phase
+from api._ratelimit import admit
+from api._storage import new_id, record_store
 
 # Время жизни данных (в секундах)
 DATA_TTL = 3600  # 1 час
 
+# Хранилище сессионных данных
+SESSION_STORE = record_store("init_data", ttl=DATA_TTL)
+
+# Путь запроса сессии по ID (UUID сессии в хранилище или подписанный токен)
+SESSION_PATH = re.compile(r'/api/init/([A-Za-z0-9_.-]+)$')
+
+
+def session_etag(session_id):
+    """ETag сессии: её данные не меняются, поэтому он определяется ID"""
+    if _session_token.is_token(session_id):
+        # Токен слишком длинный для заголовка, используется его хэш
+        return content_etag(session_id.encode('ascii'))
+    return id_etag(session_id)
+
+@instrument("/api/init")
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         if self.path.startswith('/api/init'):
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            # Лимит частоты проверяется до чтения тела; user_id в запросе необязателен
+            user_id = None
+            if '?' in self.path:
+                query = self.path.split('?')[1]
+                params = dict(param.split('=', 1) for param in query.split('&') if '=' in param)
+                user_id = params.get('user_id')
+            if not admit(self, user_id):
+                return
             
             try:
-                # Парсим данные запроса
-                data = json.loads(post_data.decode('utf-8'))
+                created_at = int(time.time())
+                expires_at = created_at + DATA_TTL
                 
-                # Добавляем информацию о времени создания и истечения срока
-                data["created_at"] = int(time.time())
-                data["expires_at"] = int(time.time()) + DATA_TTL
-                
-                # Генерируем уникальную сессию
-                session_id = str(uuid.uuid4())
-                
-                # Очищаем старые данные
-                self._cleanup_old_data()
-                
-                # Сохраняем данные во временном хранилище
-                file_path = path_join(STORAGE_DIR, f"{session_id}.json")
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False)
+                if (_session_token.enabled()
+                        and request_content_length(self) <= _session_token.SESSION_TOKEN_MAX_BODY):
+                    # Небольшие данные возвращаются внутри подписанного токена и не сохраняются
+                    session_id = self._issue_session_token(created_at, expires_at)
+                else:
+                    # Генерируем уникальную сессию
+                    session_id = new_id()
+                    
+                    # Очищаем старые данные
+                    self._cleanup_old_data()
+                    
+                    # Тело запроса пишется во временный файл кусками; время создания и
+                    # истечения срока дописываются в конец объекта без его разбора
+                    with staged_json_object(self, SESSION_STORE) as body:
+                        body.append_fields({"created_at": created_at, "expires_at": expires_at})
+                        with phase("storage"):
+                            SESSION_STORE.put_file(session_id, body.file, expires_at)
                 
                 # Отправляем ID сессии
                 self.send_response(200)
@@ -46,6 +72,15 @@ class handler(BaseHTTPRequestHandler):
                 response = json.dumps({"success": True, "session_id": session_id})
                 self.wfile.write(response.encode('utf-8'))
                 
+            except RequestBodyError as e:
+                self.send_response(e.status)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({"error": str(e), "success": False})
+                self.wfile.write(response.encode('utf-8'))
+                
             except Exception as e:
                 self.send_response(500)
                 self.send_header('Content-type', 'application/json')
@@ -65,10 +100,7 @@ class handler(BaseHTTPRequestHandler):
     
     def do_GET(self):
         # Получение начальных данных по ID сессии
-        import re
-        
-        pattern = re.compile(r'/api/init/([a-f0-9-]+)$')
-        match = pattern.match(self.path)
+        match = SESSION_PATH.match(self.path)
         
         if match:
             session_id = match.group(1)
@@ -91,9 +123,25 @@ class handler(BaseHTTPRequestHandler):
     
     def _handle_get_init_data(self, session_id):
         try:
-            file_path = path_join(STORAGE_DIR, f"{session_id}.json")
+            # Данные сессии не меняются, поэтому для ответа 304 достаточно
+            # убедиться, что сессия существует и ещё не устарела
+            etag = session_etag(session_id)
+            current_time = int(time.time())
+            if etag_matches(self, etag):
+                expires_at = self._session_expires_at(session_id)
+                if expires_at is not None and current_time <= expires_at:
+                    send_not_modified(self, etag, immutable_cache_control(expires_at, current_time))
+                    return
             
-            if not os.path.exists(file_path):
+            if _session_token.is_token(session_id):
+                # Данные внутри ID: хранилище не нужно
+                payload = self._read_session_token(session_id)
+            else:
+                with phase("storage"):
+                    record = SESSION_STORE.get(session_id)
+                payload = record.payload if record is not None else None
+            
+            if payload is None:
                 self.send_response(404)
                 self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
@@ -103,14 +151,14 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(response.encode('utf-8'))
                 return
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with phase("parse"):
+                data = loads(payload)
             
             # Проверка срока действия
-            current_time = int(time.time())
             if current_time > data.get("expires_at", 0):
-                # Удаляем просроченный файл
-                os.remove(file_path)
+                # Удаляем просроченную сессию (у токена удалять нечего)
+                if not _session_token.is_token(session_id):
+                    SESSION_STORE.delete(session_id)
                 
                 self.send_response(410)  # Gone
                 self.send_header('Content-type', 'application/json')
@@ -121,14 +169,17 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(response.encode('utf-8'))
                 return
             
+            with phase("write"):
+                body, content_type, encoding = encode_response(self, {"success": True, "data": data})
+            
             # Отправляем данные клиенту
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding, etag)
+            self.send_header('Cache-Control', immutable_cache_control(data.get("expires_at", 0), current_time))
             self.end_headers()
             
-            response = json.dumps({"success": True, "data": data})
-            self.wfile.write(response.encode('utf-8'))
+            self.wfile.write(body)
             
         except Exception as e:
             self.send_response(500)
@@ -139,35 +190,55 @@ class handler(BaseHTTPRequestHandler):
             response = json.dumps({"error": str(e), "success": False})
             self.wfile.write(response.encode('utf-8'))
     
+    def _issue_session_token(self, created_at, expires_at):
+        """Токен с данными из тела запроса. Если токен получается длиннее
+        SESSION_TOKEN_MAX_LENGTH, данные сохраняются в хранилище и возвращается
+        обычный ID сессии"""
+        content_length = request_content_length(self)
+        with phase("parse"):
+            try:
+                data = loads(self.rfile.read(content_length))
+            except ValueError:
+                data = None
+        if not isinstance(data, dict):
+            raise RequestBodyError(400, "Request body is not a valid JSON object")
+        data["created_at"] = created_at
+        data["expires_at"] = expires_at
+        payload = dumps(data)
+        
+        token = _session_token.issue(payload, expires_at)
+        if token is not None:
+            return token
+        
+        session_id = new_id()
+        self._cleanup_old_data()
+        with phase("storage"):
+            SESSION_STORE.put(session_id, payload, expires_at)
+        return session_id
+    
+    def _read_session_token(self, token):
+        """Данные сессии из токена (None, если подпись неверна)"""
+        try:
+            with phase("parse"):
+                payload, _ = _session_token.read(token)
+        except _session_token.InvalidToken:
+            self.log_message("Rejected session token with invalid signature")
+            return None
+        return payload
+    
+    def _session_expires_at(self, session_id):
+        if _session_token.is_token(session_id):
+            try:
+                return _session_token.expires_at(session_id)
+            except _session_token.InvalidToken:
+                return None
+        return SESSION_STORE.expires_at(session_id)
+    
     def _cleanup_old_data(self):
+        """Инкрементальная очистка просроченных сессий по индексу"""
         try:
-            current_time = int(time.time())
-            
-            for filename in os.listdir(STORAGE_DIR):
-                if not filename.endswith('.json'):
-                    continue
-                
-                file_path = path_join(STORAGE_DIR, filename)
-                
-                try:
-                    # Проверяем метаданные в файле
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # Если срок действия истек, удаляем файл
-                    if current_time > data.get("expires_at", 0):
-                        os.remove(file_path)
-                        
-                except Exception:
-                    # Если произошла ошибка при чтении файла,
-                    # проверяем время создания файла и удаляем, если он старше TTL
-                    try:
-                        file_stat = os.stat(file_path)
-                        if current_time - file_stat.st_mtime > DATA_TTL:
-                            os.remove(file_path)
-                    except Exception:
-                        pass
-                        
+            with phase("cleanup"):
+                SESSION_STORE.sweep()
         except Exception:
             # Игнорируем ошибки в процессе очистки
-            pass
\ No newline at end of file
+            pass
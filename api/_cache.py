@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+# Максимальное количество записей в кэше ответов
+CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+# Максимальный суммарный размер закэшированных тел ответов (в байтах)
+CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Закэшированный ответ: версия файла, разобранные данные, готовое тело ответа, его ETag
+# и уже сжатые варианты тела по кодировкам
+CacheEntry = namedtuple("CacheEntry", ["version", "data", "body", "etag", "variants"])
+
+
+# Директории, уже созданные этим процессом
+_created_directories = set()
+
+
+def ensure_directory(directory):
+    """Создаёт директорию хранилища при первой записи в неё, а не при импорте
+    модуля: на холодном старте функции, которая только читает, это лишние системные вызовы"""
+    if directory not in _created_directories:
+        os.makedirs(directory, exist_ok=True)
+        _created_directories.add(directory)
+
+
+def file_version(file_path):
+    """Версия файла для проверки актуальности кэша, None если файла нет"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def read_versioned(file_path):
+    """Читает файл целиком и возвращает (версия, содержимое) для одного и того же открытия"""
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size), f.read()
+
+
+class _Variants(dict):
+    """Сжатые варианты тела записи кэша: добавляются под блокировкой кэша
+    и учитываются в его размере"""
+
+    def __init__(self, cache, key):
+        super().__init__()
+        self._cache = cache
+        self._key = key
+
+    def __setitem__(self, encoding, encoded):
+        self._cache._add_variant(self._key, self, encoding, encoded)
+
+
+def _entry_size(entry):
+    return len(entry.body) + sum(len(encoded) for encoded in entry.variants.values())
+
+
+class ResponseCache:
+    """Ограниченный LRU-кэш разобранных данных и сериализованных ответов.
+
+    Запись считается актуальной, пока версия файла (inode, mtime и размер) совпадает
+    с той, при которой она была сохранена. В max_bytes входят и тела ответов,
+    и их сжатые варианты.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key, version):
+        """Как get, но без учёта в статистике и без изменения порядка LRU"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            return entry
+
+    def put(self, key, version, data, body, etag=None):
+        entry = CacheEntry(version, data, body, etag, _Variants(self, key))
+        with self._lock:
+            self._discard(key)
+            if len(body) > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self._size += len(body)
+            self._evict()
+        return entry
+
+    def _add_variant(self, key, variants, encoding, encoded):
+        with self._lock:
+            previous = variants.get(encoding)
+            dict.__setitem__(variants, encoding, encoded)
+            # Вариант записи, уже вытесненной из кэша, в размере не учитывается
+            entry = self._entries.get(key)
+            if entry is not None and entry.variants is variants:
+                self._size += len(encoded) - (len(previous) if previous is not None else 0)
+                self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= _entry_size(evicted)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= _entry_size(entry)
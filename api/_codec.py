@@ -0,0 +1,166 @@
+"""Кодирование тел запросов и ответов.
+
+JSON разбирается прямо из байтов и сериализуется сразу в байты: через orjson,
+если он установлен, иначе через стандартный json. Для запросов между
+сервисами (например, от бота) поддерживается MessagePack: тело запроса
+с Content-Type: application/msgpack разбирается им, а ответ кодируется им,
+если клиент прислал его в Accept. Без пакета msgpack такие запросы получают
+415, а ответы остаются в JSON.
+"""
+import functools
+import json
+import os
+
+# JSON_CODEC=json отключает orjson: его импорт (вместе с uuid и zoneinfo)
+# добавляет несколько миллисекунд к холодному старту каждой функции
+if os.environ.get("JSON_CODEC", "orjson") == "orjson":
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+else:
+    orjson = None
+
+from api._compress import encode_body, send_encoding_headers
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+
+# Названия MessagePack, которые встречаются у клиентов
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+class DecodeError(ValueError):
+    """Тело запроса не разбирается в заявленном формате"""
+
+
+@functools.lru_cache(maxsize=None)
+def _msgpack():
+    # Импортируется при первом запросе в MessagePack, а не при холодном старте
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def loads(data):
+    """Разбирает JSON из bytes в UTF-8 (без BOM), как orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    # json.loads из bytes угадывает кодировку и принял бы UTF-16, UTF-32 и BOM,
+    # а тела некоторых запросов сохраняются и отдаются как есть
+    return json.loads(data.decode('utf-8'))
+
+
+def dumps(obj):
+    """Сериализует в JSON (bytes, UTF-8)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # Целые больше 64 бит и нестроковые ключи orjson не сериализует
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _media_type(header):
+    return (header or "").partition(";")[0].strip().lower()
+
+
+def body_format(request_handler):
+    """Формат тела запроса по Content-Type: MSGPACK_TYPE или JSON_TYPE (по умолчанию)"""
+    return MSGPACK_TYPE if _media_type(request_handler.headers.get('Content-Type')) in MSGPACK_TYPES else JSON_TYPE
+
+
+def check_body_format(request_handler):
+    """Проверяет, что тело запроса можно разобрать; иначе сам отвечает 415 и возвращает False"""
+    if body_format(request_handler) == JSON_TYPE or _msgpack() is not None:
+        return True
+
+    request_handler.send_response(415)
+    request_handler.send_header('Content-type', 'application/json')
+    request_handler.send_header('Access-Control-Allow-Origin', '*')
+    request_handler.send_header('Accept-Post', JSON_TYPE)
+    request_handler.send_header('Connection', 'close')
+    request_handler.end_headers()
+    request_handler.close_connection = True
+
+    response = json.dumps({"error": "MessagePack is not supported by this server", "success": False})
+    request_handler.wfile.write(response.encode('utf-8'))
+    return False
+
+
+def decode_body(request_handler, data):
+    """Разбирает тело запроса (bytes) в формате из Content-Type; DecodeError, если не удалось"""
+    if body_format(request_handler) == MSGPACK_TYPE:
+        try:
+            return _msgpack().unpackb(data)
+        except ValueError as e:
+            raise DecodeError(f"Invalid MessagePack: {str(e) or type(e).__name__}") from e
+    try:
+        return loads(data)
+    except ValueError as e:
+        raise DecodeError(f"Invalid JSON: {str(e)}") from e
+
+
+def response_format(request_handler):
+    """Формат ответа по заголовку Accept: MSGPACK_TYPE, если клиент предпочитает
+    его JSON и msgpack установлен, иначе JSON_TYPE"""
+    accept = request_handler.headers.get('Accept')
+    if not accept or "msgpack" not in accept:
+        return JSON_TYPE
+
+    weights = {}
+    for item in accept.split(","):
+        media_type, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[media_type.strip().lower()] = weight
+
+    msgpack_weight = max(weights.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    json_weight = weights.get(JSON_TYPE, weights.get("application/*", weights.get("*/*", 0.0)))
+    if msgpack_weight > 0 and msgpack_weight >= json_weight and _msgpack() is not None:
+        return MSGPACK_TYPE
+    return JSON_TYPE
+
+
+def encode_response(request_handler, response, body=None, variants=None):
+    """Сериализует и сжимает ответ в формате, который принимает клиент.
+
+    body и variants — уже сериализованный в JSON тот же ответ и словарь его
+    сжатых вариантов (например, из записи кэша ответов): для JSON они
+    используются как есть, для MessagePack ответ кодируется заново.
+    Возвращает (тело, Content-Type, кодировка или None).
+    """
+    content_type = response_format(request_handler)
+    if content_type == MSGPACK_TYPE:
+        body, variants = _msgpack().packb(response), None
+    elif body is None:
+        body = dumps(response)
+    body, encoding = encode_body(request_handler, body, variants)
+    return body, content_type, encoding
+
+
+def _format_etag(etag, content_type):
+    # Представления в MessagePack получают свой ETag (с суффиксом, как сжатые)
+    if etag and content_type == MSGPACK_TYPE:
+        return f'{etag[:-1]}-msgpack"'
+    return etag
+
+
+def format_etag(request_handler, etag):
+    """ETag представления в том формате, который выберет для ответа encode_response"""
+    return _format_etag(etag, response_format(request_handler))
+
+
+def send_format_headers(request_handler, content_type, encoding, etag=None):
+    """Отправляет Content-Type и заголовки, зависящие от формата и кодировки ответа"""
+    request_handler.send_header('Content-type', content_type)
+    request_handler.send_header('Vary', 'Accept')
+    send_encoding_headers(request_handler, encoding, _format_etag(etag, content_type))
@@ -0,0 +1,94 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Ответы меньше этого размера (в байтах) не сжимаются
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+
+# Уровни сжатия: ответы небольшие, поэтому выбираем скорость
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Поддерживаемые кодировки в порядке предпочтения сервера
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding):
+    """Выбирает кодировку по заголовку Accept-Encoding (None — без сжатия)"""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best = None
+    best_weight = 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def response_encoding(request_handler, size):
+    """Кодировка для тела ответа размером size байт (None — без сжатия)"""
+    if size < COMPRESS_MIN_SIZE:
+        return None
+    return negotiate_encoding(request_handler.headers.get('Accept-Encoding'))
+
+
+def encode_body(request_handler, body, variants=None):
+    """Сжимает тело ответа, если клиент это поддерживает и тело достаточно большое.
+
+    variants — словарь для хранения уже сжатых вариантов (например, из записи
+    кэша ответов), чтобы одно и то же тело не сжималось на каждый запрос.
+    Возвращает (тело, кодировка или None).
+    """
+    encoding = response_encoding(request_handler, len(body))
+    if encoding is None:
+        return body, None
+
+    if variants is None:
+        return compress(body, encoding), encoding
+
+    encoded = variants.get(encoding)
+    if encoded is None:
+        encoded = compress(body, encoding)
+        variants[encoding] = encoded
+    return encoded, encoding
+
+
+def encoded_etag(etag, encoding):
+    """ETag сжатого представления: у разных кодировок должны быть разные сильные ETag"""
+    if not etag or encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def send_encoding_headers(request_handler, encoding, etag=None):
+    """Отправляет заголовки, зависящие от выбранной кодировки"""
+    request_handler.send_header('Vary', 'Accept-Encoding')
+    if encoding is not None:
+        request_handler.send_header('Content-Encoding', encoding)
+    if etag:
+        request_handler.send_header('ETag', encoded_etag(etag, encoding))
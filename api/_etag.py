@@ -0,0 +1,111 @@
+import hashlib
+import os
+
+from api._codec import format_etag
+from api._compress import SUPPORTED_ENCODINGS, encoded_etag
+
+# Суффикс файла, в котором рядом с данными хранится их ETag
+ETAG_SUFFIX = ".etag"
+
+# Cache-Control для ответов, собранных только из неизменяемых значений по умолчанию
+DEFAULT_CACHE_CONTROL = "public, no-cache"
+
+# Cache-Control для пользовательских данных, которые могут измениться в любой момент
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def immutable_cache_control(expires_at, current_time):
+    """Cache-Control для неизменяемых данных, живущих до expires_at"""
+    return f"private, max-age={max(0, int(expires_at) - int(current_time))}, immutable"
+
+
+def id_etag(record_id):
+    """ETag неизменяемой записи: её содержимое однозначно определяется ID"""
+    return f'"{record_id}"'
+
+
+def content_etag(payload):
+    """Сильный ETag по содержимому (bytes)"""
+    return '"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+
+
+def combine_etags(*etags):
+    """ETag ответа, собранного из нескольких частей с известными ETag"""
+    return content_etag("|".join(etag or "" for etag in etags).encode('utf-8'))
+
+
+def write_with_etag(file_path, payload):
+    """Атомарно записывает данные (bytes) и сохраняет их ETag рядом с файлом.
+
+    Вместе с ETag сохраняется версия файла (inode, mtime и размер), чтобы при
+    чтении можно было убедиться, что ETag относится к текущему содержимому.
+    """
+    etag = content_etag(payload)
+    tmp_path = f"{file_path}.{os.urandom(16).hex()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    stat = os.stat(tmp_path)
+    
+    sidecar_path = file_path + ETAG_SUFFIX
+    sidecar_tmp_path = f"{sidecar_path}.{os.urandom(16).hex()}.tmp"
+    with open(sidecar_tmp_path, 'w', encoding='utf-8') as f:
+        f.write(f"{stat.st_ino} {stat.st_mtime_ns} {stat.st_size} {etag}")
+    os.replace(sidecar_tmp_path, sidecar_path)
+    
+    # Переименование сохраняет inode и mtime, поэтому версия в ETag-файле совпадёт
+    os.replace(tmp_path, file_path)
+    return etag
+
+
+def stored_etag(file_path, version):
+    """ETag, сохранённый при записи файла, или None, если он устарел или отсутствует"""
+    if version is None:
+        return None
+    try:
+        with open(file_path + ETAG_SUFFIX, 'r', encoding='utf-8') as f:
+            inode, mtime_ns, size, etag = f.read().split(" ", 3)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (int(inode), int(mtime_ns), int(size)) != version:
+        return None
+    return etag
+
+
+def _matching_candidate(request_handler, etag):
+    header = request_handler.headers.get('If-None-Match')
+    if not header or not etag:
+        return None
+    # Сжатые представления того же содержимого отличаются суффиксом кодировки
+    # внутри кавычек; представление в другом формате (-msgpack) не совпадает
+    variants = {etag}.union(encoded_etag(etag, encoding) for encoding in SUPPORTED_ENCODINGS)
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate in variants:
+            return candidate
+    return None
+
+
+def etag_matches(request_handler, etag, negotiated=True):
+    """Проверяет заголовок If-None-Match запроса на совпадение с ETag.
+
+    Если negotiated, ответ отдаётся в формате по Accept (см. api._codec), и
+    сравнивается ETag представления в этом формате.
+    """
+    if negotiated:
+        etag = format_etag(request_handler, etag)
+    return _matching_candidate(request_handler, etag) is not None
+
+
+def send_not_modified(request_handler, etag, cache_control=PRIVATE_CACHE_CONTROL, negotiated=True):
+    if negotiated:
+        etag = format_etag(request_handler, etag)
+    # Возвращаем тот ETag, который прислал клиент (он может относиться к сжатому представлению)
+    candidate = _matching_candidate(request_handler, etag)
+    request_handler.send_response(304)
+    request_handler.send_header('ETag', etag if candidate in (None, "*") else candidate)
+    request_handler.send_header('Cache-Control', cache_control)
+    request_handler.send_header('Vary', 'Accept, Accept-Encoding' if negotiated else 'Accept-Encoding')
+    request_handler.send_header('Access-Control-Allow-Origin', '*')
+    request_handler.end_headers()
@@ -0,0 +1,98 @@
+import os
+import time
+from os.path import join as path_join
+
+from api._cache import ensure_directory
+
+# Поддиректория хранилища, в которой лежит индекс сроков хранения
+INDEX_DIRNAME = ".expiry"
+
+# Ширина временной корзины индекса (в секундах)
+BUCKET_SECONDS = 60
+
+# Сколько записей максимум удаляется за один запрос
+SWEEP_LIMIT = 64
+
+
+class ExpiryIndex:
+    """Индекс сроков хранения, разбитый на временные корзины.
+
+    Каждая корзина — файл в STORAGE_DIR/.expiry, имя которого равно времени
+    окончания корзины, а содержимое — имена файлов данных (по одному на строку).
+    Очистка смотрит только на корзины, срок которых уже истёк, и не читает
+    сами данные.
+    """
+
+    def __init__(self, storage_dir, bucket_seconds=BUCKET_SECONDS, remove=None):
+        self.storage_dir = storage_dir
+        self.index_dir = path_join(storage_dir, INDEX_DIRNAME)
+        self.bucket_seconds = bucket_seconds
+        # remove(filename, current_time) позволяет не удалять файл, срок которого продлили
+        self.remove = remove or self._remove
+
+    def _remove(self, filename, current_time):
+        try:
+            os.remove(path_join(self.storage_dir, filename))
+        except FileNotFoundError:
+            pass
+
+    def add(self, filename, expires_at):
+        """Регистрирует файл данных в корзине, содержащей его срок истечения"""
+        bucket_end = -(-int(expires_at) // self.bucket_seconds) * self.bucket_seconds
+        bucket_path = path_join(self.index_dir, str(bucket_end))
+        ensure_directory(self.index_dir)
+        # Короткая запись с O_APPEND не перемешивается с параллельными записями
+        fd = os.open(bucket_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, f"{filename}\n".encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def sweep(self, current_time=None, limit=SWEEP_LIMIT):
+        """Удаляет не более limit просроченных файлов, возвращает их количество"""
+        if current_time is None:
+            current_time = int(time.time())
+
+        expired_buckets = []
+        try:
+            names = os.listdir(self.index_dir)
+        except FileNotFoundError:
+            # В хранилище ещё ничего не записывали
+            return 0
+        for name in names:
+            if name.isdigit() and int(name) < current_time:
+                expired_buckets.append(int(name))
+        expired_buckets.sort()
+
+        removed = 0
+        for bucket_end in expired_buckets:
+            if removed >= limit:
+                break
+
+            bucket_path = path_join(self.index_dir, str(bucket_end))
+            # Забираем корзину переименованием, чтобы параллельные запросы
+            # не обрабатывали её одновременно
+            claimed_path = f"{bucket_path}.{os.urandom(16).hex()}"
+            try:
+                os.rename(bucket_path, claimed_path)
+            except FileNotFoundError:
+                continue
+
+            with open(claimed_path, 'r', encoding='utf-8') as f:
+                filenames = [line.strip() for line in f if line.strip()]
+
+            while filenames and removed < limit:
+                filename = filenames.pop()
+                self.remove(filename, current_time)
+                removed += 1
+
+            # Необработанный остаток возвращаем в корзину для следующих запросов
+            if filenames:
+                fd = os.open(bucket_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    os.write(fd, "".join(f"{name}\n" for name in filenames).encode('utf-8'))
+                finally:
+                    os.close(fd)
+            os.remove(claimed_path)
+
+        return removed
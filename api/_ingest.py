@@ -0,0 +1,133 @@
+"""Потоковый приём JSON-объектов из тела POST-запроса.
+
+Тело читается кусками по READ_CHUNK_SIZE и сразу пишется во временный файл
+хранилища, по ходу чтения считается SHA-256. Затем файл один раз
+разбирается парсером на C, чтобы убедиться, что тело — корректный
+JSON-объект. Слишком большое тело отклоняется по Content-Length до чтения.
+"""
+import contextlib
+import hashlib
+import json
+import os
+
+from api._codec import loads
+from api._metrics import phase
+
+# Максимальный размер тела POST-запроса (в байтах)
+MAX_BODY_SIZE = int(os.environ.get("MAX_BODY_SIZE", str(4 * 1024 * 1024)))
+
+# Размер куска, которым читается тело
+READ_CHUNK_SIZE = 64 * 1024
+
+# Пробельные символы JSON
+_WHITESPACE = b" \t\r\n"
+
+
+class RequestBodyError(ValueError):
+    """Тело запроса не принято; status — код ответа"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_staged_object(file, watch_keys=(), object_keys=()):
+    """Проверяет, что содержимое файла — один JSON-объект.
+
+    Файл читается в память и разбирается целиком парсером на C (orjson или
+    json), что в десятки раз быстрее разбора по лексемам на Python. Сам объект
+    сразу отбрасывается. Принимается только UTF-8 без BOM: тело сохраняется
+    как есть, и в него дописываются поля в UTF-8.
+    Значения ключей верхнего уровня из object_keys, если они есть, тоже должны
+    быть объектами. Возвращает (смещение закрывающей скобки, пуст ли объект,
+    какие из ключей watch_keys есть на верхнем уровне).
+    """
+    file.seek(0)
+    data = file.read()
+    try:
+        parsed = loads(data)
+    except ValueError:
+        raise RequestBodyError(400, "Request body is not a valid JSON object")
+    if not isinstance(parsed, dict):
+        raise RequestBodyError(400, "Request body is not a valid JSON object")
+    for key in object_keys:
+        if key in parsed and not isinstance(parsed[key], dict):
+            raise RequestBodyError(400, f"Field {key!r} must be a JSON object")
+    empty = not parsed
+    seen_keys = set(watch_keys).intersection(parsed)
+    del parsed
+    # После объекта могут быть только пробелы, поэтому последний другой символ — "}"
+    object_end = len(data.rstrip(_WHITESPACE)) - 1
+    return object_end, empty, seen_keys
+
+
+class StagedBody:
+    """Тело запроса во временном файле хранилища"""
+
+    def __init__(self, file, size, sha256, object_end, empty, seen_keys):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        # Смещение закрывающей скобки объекта, пуст ли он и какие из
+        # отслеживаемых ключей встретились на верхнем уровне
+        self.object_end = object_end
+        self.empty = empty
+        self.seen_keys = seen_keys
+
+    def append_fields(self, fields):
+        """Добавляет поля в конец объекта без его разбора (поля тела с теми же
+        именами перекрываются, так как при разборе JSON побеждает последнее)"""
+        separator = b"" if self.empty else b", "
+        members = b", ".join(f"{json.dumps(name)}: {json.dumps(value)}".encode('utf-8')
+                             for name, value in fields.items())
+        self.file.seek(self.object_end)
+        self.file.truncate()
+        self.file.write(separator + members + b"}")
+        self.size = self.file.tell()
+
+
+def request_content_length(request_handler):
+    """Content-Length запроса; RequestBodyError, если его нет, он некорректен или больше MAX_BODY_SIZE"""
+    header = request_handler.headers.get('Content-Length')
+    if header is None:
+        raise RequestBodyError(411, "Content-Length is required")
+    try:
+        content_length = int(header)
+    except ValueError:
+        raise RequestBodyError(400, "Invalid Content-Length")
+    if content_length < 0:
+        raise RequestBodyError(400, "Invalid Content-Length")
+    if content_length > MAX_BODY_SIZE:
+        raise RequestBodyError(413, f"Request body is larger than {MAX_BODY_SIZE} bytes")
+    return content_length
+
+
+@contextlib.contextmanager
+def staged_json_object(request_handler, store, watch_keys=(), object_keys=()):
+    """Читает тело запроса во временный файл store.stage(), проверяя, что это JSON-объект.
+
+    watch_keys — ключи верхнего уровня, о наличии которых нужно знать
+    (см. StagedBody.seen_keys), object_keys — ключи, значения которых должны
+    быть объектами. Файл удаляется при выходе, если хранилище не забрало его себе.
+    """
+    content_length = request_content_length(request_handler)
+    staged = store.stage()
+    try:
+        digest = hashlib.sha256()
+        remaining = content_length
+        while remaining:
+            chunk = request_handler.rfile.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise RequestBodyError(400, "Request body is shorter than Content-Length")
+            remaining -= len(chunk)
+            digest.update(chunk)
+            staged.write(chunk)
+        with phase("parse"):
+            object_end, empty, seen_keys = parse_staged_object(staged, watch_keys, object_keys)
+        yield StagedBody(staged, content_length, digest.hexdigest(), object_end, empty, seen_keys)
+    finally:
+        staged.close()
+        try:
+            os.remove(staged.name)
+        except FileNotFoundError:
+            pass
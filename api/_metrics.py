@@ -0,0 +1,335 @@
+"""Замеры фаз обработки запросов и экспорт метрик в текстовом формате Prometheus.
+
+Каждый процесс копит гистограммы у себя и не чаще раза в FLUSH_INTERVAL
+секунд сбрасывает снимок в METRICS_DIR/<pid>.json. Эндпоинт /api/metrics
+объединяет снимки всех живых процессов (воркеров api.serve), поэтому видит
+запросы, обработанные любым из них; снимки завершившихся процессов
+удаляются. Счётчики складываются, а размеры кэшей отдаются по процессам
+(метка pid).
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from os.path import join as path_join
+
+from api._storage import store_sizes
+
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/tmp")
+METRICS_DIR = path_join(STORAGE_ROOT, "metrics_data")
+
+# Как часто процесс сбрасывает накопленные метрики на диск (в секундах)
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1.0"))
+
+# Сколько секунд переиспользуется подсчёт записей в хранилищах: он
+# просматривает директории хранилищ целиком
+STORE_SIZES_TTL = float(os.environ.get("METRICS_STORE_SIZES_TTL", "60"))
+
+# Границы корзин гистограмм (в секундах)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {}
+_caches = {}
+_last_flush = 0.0
+# Последний подсчёт записей в хранилищах: (время по monotonic, размеры)
+_store_sizes = (None, None)
+
+
+class _RequestRecord:
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.status = None
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, phase_name, elapsed):
+        self.phases[phase_name] = self.phases.get(phase_name, 0.0) + elapsed
+
+
+class _TimedReader:
+    """Обёртка над rfile, относящая время чтения к фазе read_body"""
+
+    def __init__(self, raw, record):
+        self._raw = raw
+        self._record = record
+
+    def read(self, *args):
+        start = time.perf_counter()
+        try:
+            return self._raw.read(*args)
+        finally:
+            self._record.add("read_body", time.perf_counter() - start)
+
+    def readline(self, *args):
+        start = time.perf_counter()
+        try:
+            return self._raw.readline(*args)
+        finally:
+            self._record.add("read_body", time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class _TimedWriter:
+    """Обёртка над wfile, относящая время записи ответа к фазе write"""
+
+    def __init__(self, raw, record):
+        self._raw = raw
+        self._record = record
+
+    def write(self, data):
+        start = time.perf_counter()
+        try:
+            return self._raw.write(data)
+        finally:
+            self._record.add("write", time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Относит время выполнения блока к фазе текущего запроса (если он замеряется)"""
+    record = getattr(_local, "request", None)
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.add(name, time.perf_counter() - start)
+
+
+def register_cache(name, cache):
+    """Регистрирует кэш ответов, чтобы его статистика попадала в метрики"""
+    _caches[name] = cache
+
+
+def _observe(key, value):
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+    for index, bound in enumerate(BUCKETS):
+        if value <= bound:
+            histogram["buckets"][index] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+
+def _finish(record):
+    global _last_flush
+    duration = time.perf_counter() - record.started
+    status = str(record.status or 0)
+    with _lock:
+        _observe(("api_request_duration_seconds", record.route, record.method, status, ""), duration)
+        for phase_name, elapsed in record.phases.items():
+            _observe(("api_request_phase_seconds", record.route, record.method, status, phase_name), elapsed)
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+        if due:
+            _last_flush = time.monotonic()
+    if due:
+        flush()
+
+
+def instrument(route):
+    """Декоратор класса handler: замеряет каждый запрос и его фазы"""
+
+    def decorate(handler_class):
+        original_send_response = handler_class.send_response
+
+        def send_response(self, code, message=None):
+            record = getattr(_local, "request", None)
+            if record is not None and record.status is None:
+                record.status = code
+            original_send_response(self, code, message)
+
+        handler_class.send_response = send_response
+
+        for method_name in ("do_GET", "do_POST", "do_PATCH", "do_OPTIONS"):
+            method = handler_class.__dict__.get(method_name)
+            if method is not None:
+                setattr(handler_class, method_name, _wrap(method, route, method_name[3:]))
+        return handler_class
+
+    return decorate
+
+
+def _wrap(method, route, http_method):
+    @functools.wraps(method)
+    def wrapper(self):
+        record = _RequestRecord(route, http_method)
+        previous = getattr(_local, "request", None)
+        _local.request = record
+        rfile, wfile = self.rfile, self.wfile
+        self.rfile, self.wfile = _TimedReader(rfile, record), _TimedWriter(wfile, record)
+        try:
+            return method(self)
+        finally:
+            self.rfile, self.wfile = rfile, wfile
+            _local.request = previous
+            _finish(record)
+    return wrapper
+
+
+def _snapshot():
+    with _lock:
+        histograms = [
+            {"key": list(key), "buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+            for key, value in _histograms.items()
+        ]
+    return {"histograms": histograms, "caches": {name: cache.stats() for name, cache in _caches.items()}}
+
+
+def flush():
+    """Сохраняет снимок метрик процесса для объединения эндпоинтом /api/metrics"""
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        file_path = path_join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp_path = f"{file_path}.{os.urandom(16).hex()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp_path, file_path)
+    except OSError:
+        # Метрики не должны ломать обработку запросов
+        pass
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect():
+    """Объединённые гистограммы и статистика кэшей по процессам {pid: {кэш: статистика}}"""
+    flush()
+    histograms = {}
+    caches = {}
+    try:
+        filenames = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        filenames = []
+    for filename in filenames:
+        pid = filename[:-len(".json")]
+        if not filename.endswith(".json") or not pid.isdigit():
+            continue
+        file_path = path_join(METRICS_DIR, filename)
+        if not _process_alive(int(pid)):
+            # Снимок завершившегося воркера больше не обновится
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for item in snapshot.get("histograms", []):
+            merged = histograms.setdefault(tuple(item["key"]), {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], item["buckets"])]
+            merged["sum"] += item["sum"]
+            merged["count"] += item["count"]
+        caches[pid] = snapshot.get("caches", {})
+    return histograms, caches
+
+
+def _cached_store_sizes():
+    global _store_sizes
+    checked, sizes = _store_sizes
+    if checked is None or time.monotonic() - checked >= STORE_SIZES_TTL:
+        sizes = store_sizes()
+        _store_sizes = (time.monotonic(), sizes)
+    return sizes
+
+
+def _labels(**labels):
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus (text/plain; version=0.0.4)"""
+    histograms, process_caches = _collect()
+    lines = []
+
+    descriptions = {
+        "api_request_duration_seconds": "Total request handling time by route, method and status.",
+        "api_request_phase_seconds": "Time spent in each handling phase by route, method, status and phase.",
+    }
+    for metric, description in descriptions.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for key in sorted(k for k in histograms if k[0] == metric):
+            _, route, method, status, phase_name = key
+            labels = {"route": route, "method": method, "status": status}
+            if phase_name:
+                labels["phase"] = phase_name
+            histogram = histograms[key]
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f"{metric}_bucket{_labels(**labels, le=repr(bound))} {count}")
+            lines.append(f"{metric}_bucket{_labels(**labels, le='+Inf')} {histogram['count']}")
+            lines.append(f"{metric}_sum{_labels(**labels)} {histogram['sum']:.6f}")
+            lines.append(f"{metric}_count{_labels(**labels)} {histogram['count']}")
+
+    lines.append("# HELP api_store_entries Number of records in each storage directory "
+                 f"(counted at most every {STORE_SIZES_TTL:g} s).")
+    lines.append("# TYPE api_store_entries gauge")
+    for store, count in _cached_store_sizes().items():
+        lines.append(f"api_store_entries{_labels(store=store)} {count}")
+
+    # Счётчики живых процессов складываются
+    caches = {}
+    for stats_by_cache in process_caches.values():
+        for name, stats in stats_by_cache.items():
+            merged = caches.setdefault(name, {})
+            for field in ("hits", "misses", "evictions"):
+                merged[field] = merged.get(field, 0) + stats.get(field, 0)
+
+    cache_counters = (
+        ("api_response_cache_hits_total", "hits", "Response cache hits."),
+        ("api_response_cache_misses_total", "misses", "Response cache misses."),
+        ("api_response_cache_evictions_total", "evictions", "Response cache evictions."),
+    )
+    for metric, field, description in cache_counters:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for name in sorted(caches):
+            lines.append(f"{metric}{_labels(cache=name)} {caches[name][field]}")
+
+    # У каждого процесса свой кэш, поэтому его размер отдаётся по процессам
+    cache_gauges = (
+        ("api_response_cache_entries", "entries", "Entries currently held in the response cache of each process."),
+        ("api_response_cache_bytes", "bytes", "Bytes of responses held in the response cache of each process."),
+    )
+    for metric, field, description in cache_gauges:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} gauge")
+        for pid in sorted(process_caches, key=int):
+            for name in sorted(process_caches[pid]):
+                lines.append(f"{metric}{_labels(cache=name, pid=pid)} {process_caches[pid][name].get(field, 0)}")
+
+    lines.append("# HELP api_response_cache_hit_ratio Share of response cache lookups that were hits.")
+    lines.append("# TYPE api_response_cache_hit_ratio gauge")
+    for name in sorted(caches):
+        lookups = caches[name].get("hits", 0) + caches[name].get("misses", 0)
+        ratio = caches[name].get("hits", 0) / lookups if lookups else 0.0
+        lines.append(f"api_response_cache_hit_ratio{_labels(cache=name)} {ratio:.4f}")
+
+    return "\n".join(lines) + "\n"
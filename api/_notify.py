@@ -0,0 +1,30 @@
+"""Пробуждение ожидающих /api/changes после записи в том же процессе.
+
+Обработчики, записавшие настройки или персонажей, вызывают notify(user_id),
+и ожидающие запросы этого пользователя сразу проверяют хранилище. Записи
+из других процессов (воркеров api.serve) замечаются опросом хранилища
+раз в CHANGES_POLL_INTERVAL.
+"""
+import threading
+
+_condition = threading.Condition()
+# Счётчик записей по пользователям (только растёт)
+_generations = {}
+
+
+def generation(user_id):
+    """Текущее значение счётчика записей пользователя (для wait)"""
+    with _condition:
+        return _generations.get(user_id, 0)
+
+
+def notify(user_id):
+    with _condition:
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+        _condition.notify_all()
+
+
+def wait(user_id, seen, timeout):
+    """Ждёт записи после generation() == seen не дольше timeout секунд"""
+    with _condition:
+        _condition.wait_for(lambda: _generations.get(user_id, 0) != seen, timeout)
@@ -0,0 +1,160 @@
+"""Ограничение частоты запросов на запись: token bucket по user_id и по IP.
+
+Корзины хранятся в файле RATE_LIMIT_PATH, отображённом в память, и меняются
+под flock, поэтому лимит общий для всех воркеров api.serve на одной машине
+(на Vercel у каждого экземпляра функции свой файл в /tmp). Файл — открытая
+хэш-таблица на RATE_LIMIT_SLOTS корзин фиксированного размера: ключ ищется
+среди нескольких соседних ячеек, а если все заняты, вытесняется корзина,
+которая дольше всех не использовалась. Отклонённый запрос отвечает 429
+до чтения тела.
+"""
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from os.path import join as path_join
+
+from api._storage import STORAGE_ROOT
+
+# Лимиты в запросах в секунду и размер «запаса» на всплеск; 0 отключает лимит
+RATE_LIMIT_USER_RATE = float(os.environ.get("RATE_LIMIT_USER_RATE", "5"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "20"))
+RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", "50"))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "100"))
+
+# Брать IP клиента из X-Forwarded-For (только за доверенным прокси, например на Vercel)
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get(
+    "RATE_LIMIT_TRUST_FORWARDED", "1" if os.environ.get("VERCEL") else "0") == "1"
+
+# Файл с корзинами и число корзин в нём
+RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH", path_join(STORAGE_ROOT, "rate_limits.bin"))
+RATE_LIMIT_SLOTS = 4096
+
+# Ячейка: хэш ключа (0 — свободна), число токенов, время последнего обновления
+_SLOT = struct.Struct("<Qdd")
+# Сколько соседних ячеек просматривается при поиске ключа
+_PROBES = 8
+
+
+def _key_hash(key):
+    value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+    return value or 1
+
+
+class TokenBuckets:
+    """Корзины токенов в общем для процессов файле (открывается лениво, в том числе после fork)"""
+
+    def __init__(self, path=RATE_LIMIT_PATH, slots=RATE_LIMIT_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._pid = None
+
+    def _mapped(self):
+        if self._map is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            size = self.slots * _SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._file = os.fdopen(fd, 'r+b')
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+        return self._map
+
+    def take(self, key, rate, burst, cost=1.0):
+        """Забирает cost токенов из корзины key.
+
+        Возвращает 0, если запрос принят, иначе — через сколько секунд
+        в корзине наберётся нужное число токенов.
+        """
+        key_hash = _key_hash(key)
+        # flock не различает потоки одного процесса, поэтому нужна ещё и обычная блокировка
+        with self._lock:
+            buffer = self._mapped()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                start = key_hash % self.slots
+                target, tokens, updated = None, burst, now
+                oldest, oldest_updated = None, None
+                for probe in range(_PROBES):
+                    offset = (start + probe) % self.slots * _SLOT.size
+                    slot_hash, slot_tokens, slot_updated = _SLOT.unpack_from(buffer, offset)
+                    if slot_hash == key_hash:
+                        target, tokens, updated = offset, slot_tokens, slot_updated
+                        break
+                    if slot_hash == 0 and target is None:
+                        target = offset
+                    if oldest is None or slot_updated < oldest_updated:
+                        oldest, oldest_updated = offset, slot_updated
+                if target is None:
+                    target = oldest
+
+                # Часы могли уйти назад (например, файл пережил перезагрузку)
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                if tokens >= cost:
+                    tokens -= cost
+                    wait = 0.0
+                else:
+                    wait = (cost - tokens) / rate
+                _SLOT.pack_into(buffer, target, key_hash, tokens, now)
+                return wait
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+
+BUCKETS = TokenBuckets()
+
+
+def client_ip(request_handler):
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request_handler.headers.get('X-Forwarded-For')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request_handler.client_address[0]
+
+
+def admit(request_handler, user_id=None):
+    """Проверяет лимиты для запроса; при превышении сам отвечает 429 и возвращает False.
+
+    Сначала проверяется лимит IP, затем лимит user_id (если он известен).
+    Ошибка доступа к файлу корзин запрос не отклоняет.
+    """
+    limits = []
+    if RATE_LIMIT_IP_RATE > 0:
+        limits.append((f"ip:{client_ip(request_handler)}", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST))
+    if user_id and RATE_LIMIT_USER_RATE > 0:
+        limits.append((f"user:{user_id}", RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST))
+
+    retry_after = 0.0
+    try:
+        for key, rate, burst in limits:
+            retry_after = BUCKETS.take(key, rate, burst)
+            if retry_after:
+                break
+    except OSError as e:
+        request_handler.log_error(f"Rate limiter unavailable: {str(e)}")
+        return True
+    if not retry_after:
+        return True
+
+    # Тело запроса не читается, поэтому соединение дальше использовать нельзя
+    request_handler.send_response(429)
+    request_handler.send_header('Content-type', 'application/json')
+    request_handler.send_header('Access-Control-Allow-Origin', '*')
+    request_handler.send_header('Retry-After', str(math.ceil(retry_after)))
+    request_handler.send_header('Connection', 'close')
+    request_handler.end_headers()
+    request_handler.close_connection = True
+
+    response = json.dumps({"error": "Too many requests", "success": False, "retry_after": round(retry_after, 3)})
+    request_handler.wfile.write(response.encode('utf-8'))
+    return False
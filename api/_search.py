@@ -0,0 +1,285 @@
+"""Нечёткий поиск персонажей по имени, описанию и приветствию.
+
+Для каждого пользователя в памяти процесса строится индекс биграмм
+и триграмм имени, описания и приветствия. Запрос находит текст, отличающийся
+от него на MAX_TYPOS опечаток (вставка, удаление или замена символа).
+Индекс строится один раз при первом поиске, а дальше обновляется по журналу
+изменений хранилища (store.changes), поэтому записи из других воркеров
+учитываются без перестроения. Построенный индекс сохраняется на диск
+вместе с позицией журнала, и новый процесс (холодный экземпляр функции)
+догоняет этот снимок по журналу вместо того, чтобы читать всех персонажей. Текст приводится к NFKC и нижнему регистру,
+n-граммы берутся по символам, так что кириллица и иероглифы не требуют
+отдельной разбивки на слова.
+"""
+import hashlib
+import heapq
+import marshal
+import math
+import os
+import threading
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+from os.path import join as path_join
+
+from api._cache import ensure_directory
+from api._codec import loads
+
+# Веса полей при ранжировании
+FIELD_WEIGHTS = {"name": 3.0, "description": 1.0, "greeting": 1.0}
+
+# Размеры n-грамм по полям
+FIELD_GRAM_SIZES = {"name": (2, 3), "description": (2, 3), "greeting": (2, 3)}
+
+# Запросы короче ищутся по биграммам: опечатка портит до q соседних
+# q-грамм, и от триграмм короткого слова с опечаткой ничего бы не осталось
+TRIGRAM_MIN_QUERY_LENGTH = 6
+
+# Доля n-грамм запроса, которой достаточно для совпадения в поле
+MIN_MATCH_RATIO = 0.5
+
+# Сколько опечаток в запросе гарантированно допускается: порог совпадения
+# не выше числа n-грамм запроса минус q на каждую опечатку
+MAX_TYPOS = 1
+
+# Для скольких пользователей индексы держатся в памяти одновременно
+SEARCH_MAX_USERS = int(os.environ.get("SEARCH_MAX_USERS", "32"))
+
+# После скольких изменений, применённых из журнала, снимок индекса на диске обновляется
+SEARCH_SNAPSHOT_EVERY = int(os.environ.get("SEARCH_SNAPSHOT_EVERY", "100"))
+
+# Версия формата снимка: снимки другой версии перестраиваются
+SNAPSHOT_FORMAT = 2
+
+
+def normalize(text):
+    """Текст для индекса и запроса: NFKC, без учёта регистра, пробелы схлопнуты"""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).casefold().split())
+
+
+def grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SearchIndex:
+    """Индекс n-грамм персонажей одного пользователя.
+
+    Списки вхождений хранятся в array('I') по номерам документов. Изменённый
+    персонаж получает новый номер, а старый просто перестаёт считаться живым,
+    поэтому обновление не требует удаления из списков вхождений.
+    """
+
+    def __init__(self):
+        self.cursor = None
+        # Изменения, применённые после последнего сохранения снимка
+        self.unsaved = 0
+        self._postings = {field: {} for field in FIELD_WEIGHTS}
+        self._names = []
+        self._normalized_names = []
+        self._ids = {}
+
+    def to_bytes(self, user_id):
+        """Снимок индекса с позицией журнала (marshal: снимки читает только
+        этот же сервер из своего хранилища)"""
+        postings = {field: {gram: posting.tobytes() for gram, posting in field_postings.items()}
+                    for field, field_postings in self._postings.items()}
+        return marshal.dumps((SNAPSHOT_FORMAT, user_id, self.cursor, self._names,
+                              self._normalized_names, self._ids, postings))
+
+    @classmethod
+    def from_bytes(cls, data, user_id):
+        """Индекс из снимка to_bytes; ValueError, если снимок другого формата или пользователя"""
+        try:
+            snapshot_format, snapshot_user_id, cursor, names, normalized_names, ids, postings = marshal.loads(data)
+        except (EOFError, TypeError) as e:
+            raise ValueError("Damaged search index snapshot") from e
+        if snapshot_format != SNAPSHOT_FORMAT or snapshot_user_id != user_id:
+            raise ValueError("Search index snapshot does not match")
+        index = cls()
+        index.cursor = cursor
+        index._names = names
+        index._normalized_names = normalized_names
+        index._ids = ids
+        for field, field_postings in postings.items():
+            index._postings[field] = {gram: array('I', posting) for gram, posting in field_postings.items()}
+        return index
+
+    @property
+    def size(self):
+        return len(self._ids)
+
+    @property
+    def dead(self):
+        return len(self._names) - len(self._ids)
+
+    def add(self, name, character):
+        doc_id = len(self._names)
+        self._names.append(name)
+        self._normalized_names.append(normalize(name))
+        self._ids[name] = doc_id
+        for field, sizes in FIELD_GRAM_SIZES.items():
+            text = normalize(character.get(field) or "")
+            postings = self._postings[field]
+            for size in sizes:
+                for gram in grams(text, size):
+                    posting = postings.get(gram)
+                    if posting is None:
+                        posting = postings[gram] = array('I')
+                    posting.append(doc_id)
+
+    def remove(self, name):
+        self._ids.pop(name, None)
+
+    def search(self, query, limit):
+        """Имена с оценками в порядке убывания оценки"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        scores = Counter()
+        if len(query) == 1:
+            # Один символ: только начало имени
+            for doc_id, name in enumerate(self._normalized_names):
+                if name.startswith(query):
+                    scores[doc_id] = 2.0
+        else:
+            size = 3 if len(query) >= TRIGRAM_MIN_QUERY_LENGTH else 2
+            query_grams = grams(query, size)
+            min_count = max(1, min(math.ceil(len(query_grams) * MIN_MATCH_RATIO),
+                                   len(query_grams) - MAX_TYPOS * size))
+            for field, weight in FIELD_WEIGHTS.items():
+                postings = self._postings[field]
+                matches = Counter()
+                for gram in query_grams:
+                    posting = postings.get(gram)
+                    if posting is not None:
+                        matches.update(posting)
+                factor = weight / len(query_grams)
+                scores.update({doc_id: count * factor for doc_id, count in matches.items() if count >= min_count})
+                if field == "name":
+                    # Совпадение имени целиком или по началу важнее совпадения n-грамм;
+                    # проверяются только имена, где нашлись все n-граммы запроса
+                    for doc_id, count in matches.items():
+                        if count == len(query_grams):
+                            scores[doc_id] += self._name_bonus(doc_id, query)
+
+        names, ids = self._names, self._ids
+        best = heapq.nsmallest(limit, ((-score, names[doc_id]) for doc_id, score in scores.items()
+                                       if ids.get(names[doc_id]) == doc_id))
+        return [(name, round(-score, 4)) for score, name in best]
+
+    def _name_bonus(self, doc_id, query):
+        normalized_name = self._normalized_names[doc_id]
+        if normalized_name == query:
+            return 3.0
+        if normalized_name.startswith(query):
+            return 2.0
+        if query in normalized_name:
+            return 1.0
+        return 0.0
+
+
+def build_index(characters):
+    """Индекс по итерируемому (имя, данные персонажа)"""
+    index = SearchIndex()
+    for name, character in characters:
+        index.add(name, character)
+    return index
+
+
+class SearchIndexes:
+    """Индексы пользователей для хранилища персонажей (LRU на SEARCH_MAX_USERS).
+
+    Если задан snapshot_dir, непустые индексы сохраняются туда после
+    построения и после каждых SEARCH_SNAPSHOT_EVERY изменений.
+    """
+
+    def __init__(self, store, max_users=SEARCH_MAX_USERS, snapshot_dir=None):
+        self.store = store
+        self.max_users = max_users
+        self.snapshot_dir = snapshot_dir
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks = {}
+
+    def search(self, user_id, query, limit):
+        with self._user_lock(user_id):
+            index = self._refresh(user_id)
+            return index.search(query, limit)
+
+    def _user_lock(self, user_id):
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.Lock()
+            return lock
+
+    def _snapshot_path(self, user_id):
+        # Имя файла по хэшу: user_id приходит из запроса
+        return path_join(self.snapshot_dir, hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32] + ".idx")
+
+    def _load_snapshot(self, user_id):
+        if self.snapshot_dir is None:
+            return None
+        try:
+            with open(self._snapshot_path(user_id), 'rb') as f:
+                return SearchIndex.from_bytes(f.read(), user_id)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_snapshot(self, user_id, index):
+        # Пустые индексы не сохраняются: поиск по произвольному user_id ничего не пишет
+        if self.snapshot_dir is None or not index.size:
+            return
+        ensure_directory(self.snapshot_dir)
+        file_path = self._snapshot_path(user_id)
+        tmp_path = f"{file_path}.{os.urandom(16).hex()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(index.to_bytes(user_id))
+        os.replace(tmp_path, file_path)
+        index.unsaved = 0
+
+    def _remember(self, user_id, index):
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                evicted, _ = self._indexes.popitem(last=False)
+                self._user_locks.pop(evicted, None)
+
+    def _refresh(self, user_id):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+
+        if index is None:
+            index = self._load_snapshot(user_id)
+            if index is not None:
+                self._remember(user_id, index)
+
+        if index is not None:
+            names, cursor = self.store.changes(user_id, index.cursor)
+            # Перестраиваем индекс, если журнал начат заново или в индексе
+            # накопилось больше устаревших документов, чем живых
+            if names is not None and index.dead <= max(index.size, 1000):
+                names = dict.fromkeys(names)
+                for name in names:
+                    record = self.store.get(user_id, name)
+                    index.remove(name)
+                    if record is not None:
+                        index.add(name, loads(record.payload))
+                index.cursor = cursor
+                index.unsaved += len(names)
+                if index.unsaved >= SEARCH_SNAPSHOT_EVERY:
+                    self._save_snapshot(user_id, index)
+                return index
+
+        # Позиция журнала запоминается до чтения, поэтому изменения во время
+        # построения будут применены при следующем поиске
+        _, cursor = self.store.changes(user_id)
+        index = build_index((name, loads(payload)) for name, payload in self.store.items(user_id))
+        index.cursor = cursor
+        self._save_snapshot(user_id, index)
+        self._remember(user_id, index)
+        return index
@@ -0,0 +1,102 @@
+"""Сессии /api/init без хранилища: данные сессии внутри её ID.
+
+Небольшие данные сессии сжимаются (deflate) и подписываются HMAC-SHA256
+ключом SESSION_TOKEN_SECRET, а получившийся токен возвращается вместо
+session_id. GET /api/init/:id проверяет подпись и срок действия, записанный
+в токене, и отдаёт данные без обращения к хранилищу, поэтому сессия
+открывается на любом экземпляре функции. Данные, которые после сжатия не
+укладываются в SESSION_TOKEN_MAX_LENGTH, сохраняются в хранилище, как раньше.
+
+Токен: "s1.<expires_at>.<данные>.<подпись>", данные и подпись — base64url
+без выравнивания. Токен не шифруется: данные сессии может прочитать любой,
+у кого есть её ID (как и при хранении на сервере).
+"""
+import base64
+import hashlib
+import hmac
+import os
+import zlib
+
+# Ключи подписи через запятую: токены подписываются первым, а проверяются
+# любым, поэтому ключ можно сменить, не теряя выданных сессий. Без ключа
+# все сессии хранятся в хранилище
+SESSION_TOKEN_SECRETS = [secret.encode('utf-8') for secret in
+                         os.environ.get("SESSION_TOKEN_SECRET", "").split(",") if secret]
+
+# Наибольшая длина токена в символах: ID сессии попадает в URL Mini App
+SESSION_TOKEN_MAX_LENGTH = int(os.environ.get("SESSION_TOKEN_MAX_LENGTH", "1024"))
+
+# Тела длиннее этого (в байтах) не пытаются уложить в токен: JSON такого
+# размера почти никогда не сжимается в SESSION_TOKEN_MAX_LENGTH
+SESSION_TOKEN_MAX_BODY = 8 * SESSION_TOKEN_MAX_LENGTH
+
+TOKEN_PREFIX = "s1."
+
+# Длина подписи в байтах (усечённый HMAC-SHA256)
+_SIGNATURE_SIZE = 16
+
+
+class InvalidToken(ValueError):
+    """Токен повреждён или подписан неизвестным ключом"""
+
+
+def enabled():
+    return bool(SESSION_TOKEN_SECRETS)
+
+
+def is_token(session_id):
+    return session_id.startswith(TOKEN_PREFIX)
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(secret, signed):
+    return hmac.new(secret, signed.encode('ascii'), hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+
+
+def issue(payload, expires_at):
+    """Токен с данными сессии payload (bytes) до expires_at; None, если он длиннее
+    SESSION_TOKEN_MAX_LENGTH или ключ не задан"""
+    if not SESSION_TOKEN_SECRETS:
+        return None
+    # Необработанный deflate: заголовок и контрольная сумма zlib не нужны, целостность даёт подпись
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    data = compressor.compress(payload) + compressor.flush()
+    signed = f"{TOKEN_PREFIX}{int(expires_at)}.{_encode(data)}"
+    token = f"{signed}.{_encode(_signature(SESSION_TOKEN_SECRETS[0], signed))}"
+    if len(token) > SESSION_TOKEN_MAX_LENGTH:
+        return None
+    return token
+
+
+def expires_at(token):
+    """Срок действия из токена с проверенной подписью; InvalidToken, если подпись неверна"""
+    signed, _, signature = token.rpartition(".")
+    try:
+        signature = _decode(signature)
+        expires = int(signed[len(TOKEN_PREFIX):].partition(".")[0])
+        valid = any(hmac.compare_digest(signature, _signature(secret, signed)) for secret in SESSION_TOKEN_SECRETS)
+    except ValueError:
+        valid = False
+    if not valid:
+        raise InvalidToken("Invalid session token")
+    return expires
+
+
+def read(token):
+    """Данные сессии (bytes) и срок действия из токена; InvalidToken, если токен неверен.
+
+    Срок действия не проверяется: это делает обработчик, чтобы ответить 410.
+    """
+    expires = expires_at(token)
+    data = token[:token.rindex(".")].rpartition(".")[2]
+    try:
+        return zlib.decompress(_decode(data), -15), expires
+    except (ValueError, zlib.error):
+        raise InvalidToken("Invalid session token")
@@ -0,0 +1,959 @@
+"""Хранилища записей, общие для всех обработчиков.
+
+Обработчики не работают с файлами напрямую, а получают хранилище через
+record_store()/character_store(). Реализация выбирается переменной
+окружения STORAGE_BACKEND:
+
+- "files" (по умолчанию) — файл на запись в STORAGE_ROOT/<хранилище>, как
+  раньше; ETag хранится рядом с файлом, сроки хранения — в ExpiryIndex;
+- "sqlite" — один файл базы SQLite в режиме WAL (SQLITE_PATH) с индексом по
+  expires_at и первичным ключом (user_id, name) для персонажей.
+
+Версия записи (для проверки актуальности кэша ответов) у файлов — inode,
+mtime и размер, у SQLite — ETag содержимого.
+"""
+import bisect
+import contextlib
+import fcntl
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from os.path import join as path_join
+
+from api._cache import ensure_directory, file_version, read_versioned
+from api._etag import content_etag, stored_etag, write_with_etag
+from api._expiry import SWEEP_LIMIT, ExpiryIndex
+
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/tmp")
+
+# Реализация хранилищ: "files" или "sqlite"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "files")
+
+# Путь к базе SQLite
+SQLITE_PATH = os.environ.get("SQLITE_PATH", path_join(STORAGE_ROOT, "storage.sqlite3"))
+
+# Раскладка файлового хранилища: имя хранилища -> (директория, шаблон имени файла)
+FILE_LAYOUT = {
+    "init_data": ("init_data", "{key}.json"),
+    "data_storage": ("data_storage", "{key}.json"),
+    "settings": ("settings_data", "settings_{key}.json"),
+    "global_characters": ("character_data", "{key}.json"),
+    "idempotency": (path_join("data_storage", ".idempotency"), "{key}.json"),
+}
+
+# Директория с содержимым store_data, разложенным по хэшу
+BLOB_DIRNAME = path_join("data_storage", ".blobs")
+
+# Директории, размер которых отдаётся в метриках
+METRIC_DIRNAMES = ("init_data", "data_storage", "character_data", "settings_data")
+
+# Директория персонажей пользователей и поддиректория с манифестами имён
+CHARACTER_DIRNAME = "character_data"
+MANIFEST_DIRNAME = ".manifest"
+# Файл в директории манифестов: манифесты построены для всех персонажей,
+# записанных до их появления
+MIGRATED_FILENAME = ".migrated"
+# Файл в директории манифестов: старые файлы персонажей, у которых "_" есть
+# и в имени, и в user_id, так что по имени файла не понять, чей это персонаж
+LEGACY_FILENAME = ".legacy.json"
+# Поддиректория с журналами изменённых персонажей каждого пользователя
+CHANGES_DIRNAME = ".changes"
+
+# Наибольший размер журнала изменений пользователя в файловом хранилище
+# (в байтах): при превышении в нём остаётся только более новая половина
+CHANGES_LOG_MAX_BYTES = int(os.environ.get("CHANGES_LOG_MAX_BYTES", str(64 * 1024)))
+
+# Сколько последних записей журнала изменений (всех пользователей) хранит SQLite
+CHANGES_LOG_MAX_ROWS = int(os.environ.get("CHANGES_LOG_MAX_ROWS", "100000"))
+
+# Сколько персонажей читается за один запрос при переборе всех персонажей пользователя
+ITER_PAGE_SIZE = 100
+
+# Сколько ключей передаётся в один запрос SQLite с IN (...)
+# (старые сборки SQLite принимают не больше 999 параметров)
+SQLITE_MAX_PARAMETERS = 500
+
+# Прочитанная запись: версия, содержимое (bytes) и ETag содержимого (None, если не хранится)
+Record = namedtuple("Record", ["version", "payload", "etag"])
+
+# ETag пустого списка имён персонажей
+EMPTY_NAMES_ETAG = content_etag(b"[]")
+
+
+def new_id():
+    """Случайный UUID версии 4 в обычной записи (без импорта модуля uuid,
+    который тянет за собой platform и заметно удлиняет холодный старт)"""
+    value = bytearray(os.urandom(16))
+    value[6] = value[6] & 0x0F | 0x40
+    value[8] = value[8] & 0x3F | 0x80
+    digits = value.hex()
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+
+def _stage(directory):
+    # Временный файл на той же файловой системе, что и хранилище, чтобы его можно было переименовать
+    ensure_directory(directory)
+    return open(path_join(directory, f"{os.urandom(16).hex()}.tmp"), 'x+b')
+
+
+def _read_staged(staged):
+    staged.flush()
+    staged.seek(0)
+    return staged.read()
+
+
+def prefix_end(prefix):
+    """Наименьшая строка, которая больше всех строк с префиксом prefix (None, если такой нет)"""
+    while prefix:
+        code = ord(prefix[-1]) + 1
+        if 0xD800 <= code <= 0xDFFF:
+            # Суррогаты не кодируются в UTF-8, а порядок строк в SQLite — порядок байтов UTF-8
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return prefix[:-1] + chr(code)
+        prefix = prefix[:-1]
+    return None
+
+
+def sorted_page(names, after=None, prefix="", limit=None):
+    """Имена из отсортированного списка, которые идут после after и начинаются
+    с prefix (не больше limit), за O(log n) поиска без перебора списка"""
+    start = bisect.bisect_left(names, prefix)
+    if after is not None and after >= prefix:
+        start = bisect.bisect_right(names, after)
+    end = len(names)
+    upper = prefix_end(prefix)
+    if upper is not None:
+        end = bisect.bisect_left(names, upper)
+    if limit is not None:
+        end = min(end, start + limit)
+    return names[start:end]
+
+
+class FileRecordStore:
+    """Записи по ключу, по одному файлу на запись.
+
+    Если задан ttl, записи временные: ETag не хранится (у них неизменяемое
+    содержимое, ETag строится по ID), сроки регистрируются в ExpiryIndex.
+    """
+
+    def __init__(self, name, ttl=None):
+        dirname, self.filename = FILE_LAYOUT[name]
+        self.directory = path_join(STORAGE_ROOT, dirname)
+        self.ttl = ttl
+        self.expiry_index = ExpiryIndex(self.directory) if ttl else None
+
+    def path(self, key):
+        return path_join(self.directory, self.filename.format(key=key))
+
+    def version(self, key):
+        return file_version(self.path(key))
+
+    def etag(self, key, version):
+        """ETag, сохранённый для указанной версии записи (None, если неизвестен)"""
+        return stored_etag(self.path(key), version)
+
+    def get(self, key):
+        file_path = self.path(key)
+        try:
+            version, payload = read_versioned(file_path)
+        except FileNotFoundError:
+            return None
+        if self.ttl:
+            return Record(version, payload, None)
+        return Record(version, payload, stored_etag(file_path, version) or content_etag(payload))
+
+    def get_many(self, keys):
+        """Записи по нескольким ключам: {ключ: Record}, отсутствующих ключей в ответе нет"""
+        records = {}
+        for key in keys:
+            record = self.get(key)
+            if record is not None:
+                records[key] = record
+        return records
+
+    def put(self, key, payload, expires_at=None):
+        """Сохраняет запись и возвращает её ETag (None для временных записей)"""
+        file_path = self.path(key)
+        ensure_directory(self.directory)
+        if not self.ttl:
+            return write_with_etag(file_path, payload)
+        with open(file_path, 'wb') as f:
+            f.write(payload)
+        self.expiry_index.add(self.filename.format(key=key), expires_at)
+        return None
+
+    def update(self, key, modify):
+        """Заменяет запись на modify(текущее содержимое или None) и возвращает ETag.
+
+        Чтение и запись идут под блокировкой файла, поэтому между ними запись
+        не изменит ни другой поток, ни другой процесс (если они тоже пишут через update).
+        """
+        # Отдельный файл блокировки: сама запись подменяется переименованием
+        ensure_directory(self.directory)
+        with open(f"{self.path(key)}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            record = self.get(key)
+            return self.put(key, modify(record.payload if record is not None else None))
+
+    def stage(self):
+        """Временный файл, содержимое которого можно сохранить через put_file()"""
+        return _stage(self.directory)
+
+    def put_file(self, key, staged, expires_at):
+        """Сохраняет временную запись из файла stage() без чтения его в память"""
+        staged.flush()
+        os.replace(staged.name, self.path(key))
+        self.expiry_index.add(self.filename.format(key=key), expires_at)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def expires_at(self, key):
+        """Срок хранения записи без чтения её содержимого (None, если записи нет)"""
+        try:
+            return os.stat(self.path(key)).st_mtime + self.ttl
+        except FileNotFoundError:
+            return None
+
+    def sweep(self, current_time=None, limit=SWEEP_LIMIT):
+        return self.expiry_index.sweep(current_time, limit)
+
+
+class FileCharacterStore:
+    """Персонажи пользователей: файл {name}_{user_id}.json на персонажа и
+    манифест с отсортированными именами персонажей каждого пользователя.
+
+    Манифесты для персонажей, записанных до их появления, строятся один раз
+    для всех пользователей (см. migrate_manifests()); после этого
+    пользователь без манифеста — пользователь без персонажей. Старые файлы
+    с неоднозначным именем дописываются в манифест при первом обращении
+    процесса к пользователю (см. _resolve_legacy()).
+
+    Имена записанных персонажей дописываются в журнал пользователя
+    (.changes/<user_id>.log, по JSON-строке на имя), по которому читатели
+    в других процессах узнают, что изменилось (см. changes()). Позиция в
+    журнале — смещение от его начала за всё время: после сжатия журнала
+    первая строка {"base": N} хранит смещение первой оставшейся записи."""
+
+    def __init__(self):
+        self.directory = path_join(STORAGE_ROOT, CHARACTER_DIRNAME)
+        self.manifest_dir = path_join(self.directory, MANIFEST_DIRNAME)
+        self.changes_dir = path_join(self.directory, CHANGES_DIRNAME)
+        self._migrated = False
+        # Основы неоднозначных имён старых файлов (None — ещё не прочитаны)
+        # и пользователи, для которых они уже проверены
+        self._legacy = None
+        self._legacy_checked = set()
+
+    def path(self, user_id, name):
+        return path_join(self.directory, f"{name}_{user_id}.json")
+
+    def _manifest_path(self, user_id):
+        return path_join(self.manifest_dir, f"{user_id}.json")
+
+    @contextlib.contextmanager
+    def _manifest_lock(self, user_id):
+        # Отдельный файл блокировки: сам манифест подменяется переименованием
+        ensure_directory(self.manifest_dir)
+        with open(f"{self._manifest_path(user_id)}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def write_manifest(self, user_id, names):
+        # Манифест подменяется атомарно вместе с его ETag
+        payload = json.dumps(names, ensure_ascii=False).encode('utf-8')
+        ensure_directory(self.manifest_dir)
+        return write_with_etag(self._manifest_path(user_id), payload)
+
+    def _read_manifest(self, user_id):
+        file_path = self._manifest_path(user_id)
+        version, payload = read_versioned(file_path)
+        return json.loads(payload), stored_etag(file_path, version) or content_etag(payload)
+
+    def migrate_manifests(self):
+        """Строит манифесты по файлам персонажей, записанным до их появления.
+
+        Выполняется один раз для всего хранилища: директория просматривается
+        целиком, манифест пишется только пользователям, у которых его ещё нет,
+        после чего создаётся файл MIGRATED_FILENAME. Процесс проверяет этот
+        файл один раз при первом обращении к манифестам.
+
+        Из имени файла {name}_{user_id}.json пользователь однозначно следует,
+        только если в нём один "_". Остальные файлы не угадываются, а
+        сохраняются в LEGACY_FILENAME и разбираются по известному user_id
+        (см. _resolve_legacy()).
+        """
+        if self._migrated:
+            return
+        marker_path = path_join(self.manifest_dir, MIGRATED_FILENAME)
+        if os.path.exists(marker_path):
+            self._migrated = True
+            return
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            # Персонажей ещё нет: манифесты появятся вместе с ними
+            self._migrated = True
+            return
+
+        ensure_directory(self.manifest_dir)
+        with open(f"{marker_path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(marker_path):
+                user_names = {}
+                legacy = []
+                for filename in filenames:
+                    # {name}_{user_id}.json; временные файлы и ETag имеют другие суффиксы
+                    if not filename.endswith(".json"):
+                        continue
+                    stem = filename[:-len(".json")]
+                    if stem.count("_") > 1:
+                        legacy.append(stem)
+                        continue
+                    name, separator, user_id = stem.partition("_")
+                    if separator and name and user_id:
+                        user_names.setdefault(user_id, set()).add(name)
+                for user_id, names in user_names.items():
+                    with self._manifest_lock(user_id):
+                        if file_version(self._manifest_path(user_id)) is None:
+                            self.write_manifest(user_id, sorted(names))
+                with open(path_join(self.manifest_dir, LEGACY_FILENAME), 'w', encoding='utf-8') as f:
+                    json.dump(sorted(legacy), f, ensure_ascii=False)
+                with open(marker_path, 'w'):
+                    pass
+        self._migrated = True
+
+    def _resolve_legacy(self, user_id):
+        """Дописывает в манифест пользователя старые файлы с неоднозначным
+        именем, которые оканчиваются на _{user_id}.json (как искались
+        персонажи до манифестов)"""
+        if self._legacy is None:
+            try:
+                with open(path_join(self.manifest_dir, LEGACY_FILENAME), 'rb') as f:
+                    self._legacy = json.loads(f.read())
+            except FileNotFoundError:
+                self._legacy = []
+        if not self._legacy or user_id in self._legacy_checked:
+            return
+        suffix = f"_{user_id}"
+        names = [stem[:-len(suffix)] for stem in self._legacy if stem.endswith(suffix) and len(stem) > len(suffix)]
+        if names:
+            with self._manifest_lock(user_id):
+                current, _ = self._read_or_empty_manifest(user_id)
+                # Файлы, которые уже удалены, в манифест не возвращаются
+                found = [name for name in names if os.path.exists(self.path(user_id, name))]
+                merged = sorted(set(current).union(found))
+                if merged != current:
+                    self.write_manifest(user_id, merged)
+        self._legacy_checked.add(user_id)
+
+    def _migrate_user(self, user_id):
+        # Вызывается до блокировки манифеста пользователя: обе операции берут её сами
+        self.migrate_manifests()
+        self._resolve_legacy(user_id)
+
+    def _read_or_empty_manifest(self, user_id):
+        # Отсутствующий манифест не создаётся: так запросы с произвольными
+        # user_id ничего не пишут на диск
+        try:
+            return self._read_manifest(user_id)
+        except FileNotFoundError:
+            return [], EMPTY_NAMES_ETAG
+
+    def names(self, user_id):
+        """Отсортированный список имён персонажей пользователя и его ETag"""
+        self._migrate_user(user_id)
+        return self._read_or_empty_manifest(user_id)
+
+    def names_etag(self, user_id):
+        """ETag списка имён без чтения манифеста (None, если неизвестен)"""
+        self._migrate_user(user_id)
+        file_path = self._manifest_path(user_id)
+        return stored_etag(file_path, file_version(file_path))
+
+    def names_page(self, user_id, after=None, prefix="", limit=None):
+        """Часть отсортированного списка имён (см. sorted_page)"""
+        names, _ = self.names(user_id)
+        return sorted_page(names, after, prefix, limit)
+
+    def version(self, user_id, name):
+        return file_version(self.path(user_id, name))
+
+    def etag(self, user_id, name, version):
+        return stored_etag(self.path(user_id, name), version)
+
+    def get(self, user_id, name):
+        file_path = self.path(user_id, name)
+        try:
+            version, payload = read_versioned(file_path)
+        except FileNotFoundError:
+            return None
+        return Record(version, payload, stored_etag(file_path, version) or content_etag(payload))
+
+    def items(self, user_id):
+        """Перебирает (имя, данные) персонажей пользователя в порядке имён,
+        держа в памяти только список имён и одного персонажа"""
+        names, _ = self.names(user_id)
+        for name in names:
+            try:
+                with open(self.path(user_id, name), 'rb') as f:
+                    yield name, f.read()
+            except FileNotFoundError:
+                continue
+
+    def put(self, user_id, name, payload):
+        ensure_directory(self.directory)
+        etag = write_with_etag(self.path(user_id, name), payload)
+        # Добавляем имя в манифест, сохраняя порядок сортировки
+        self._migrate_user(user_id)
+        with self._manifest_lock(user_id):
+            names, _ = self._read_or_empty_manifest(user_id)
+            position = bisect.bisect_left(names, name)
+            if position == len(names) or names[position] != name:
+                names.insert(position, name)
+                self.write_manifest(user_id, names)
+        self._log_changes(user_id, [name])
+        return etag
+
+    def put_many(self, user_id, payloads):
+        """Сохраняет несколько персонажей ({имя: данные}) с одним обновлением
+        манифеста; возвращает {имя: ETag}"""
+        ensure_directory(self.directory)
+        etags = {name: write_with_etag(self.path(user_id, name), payload) for name, payload in payloads.items()}
+        self._migrate_user(user_id)
+        with self._manifest_lock(user_id):
+            names, _ = self._read_or_empty_manifest(user_id)
+            merged = sorted(set(names).union(payloads))
+            if merged != names:
+                self.write_manifest(user_id, merged)
+        self._log_changes(user_id, payloads)
+        return etags
+
+    def _changes_path(self, user_id):
+        return path_join(self.changes_dir, f"{user_id}.log")
+
+    def _log_changes(self, user_id, names):
+        # Один вызов write с O_APPEND: строки разных процессов не перемешиваются
+        data = b"".join(json.dumps(name, ensure_ascii=False).encode('utf-8') + b"\n" for name in names)
+        ensure_directory(self.changes_dir)
+        file_path = self._changes_path(user_id)
+        while True:
+            fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # Разделяемая блокировка не даёт сжатию подменить журнал во время
+                # записи; если подмена случилась до блокировки, открываем новый файл
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                try:
+                    if os.fstat(fd).st_ino != os.stat(file_path).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            break
+        if size > CHANGES_LOG_MAX_BYTES:
+            self._compact_changes(user_id)
+
+    @staticmethod
+    def _log_header(data):
+        # Смещение первой записи журнала и длина строки заголовка
+        if data.startswith(b"{"):
+            header_end = data.index(b"\n") + 1
+            return json.loads(data[:header_end])["base"], header_end
+        return 0, 0
+
+    def _compact_changes(self, user_id):
+        """Оставляет в журнале пользователя более новую половину записей"""
+        file_path = self._changes_path(user_id)
+        with open(file_path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_ino != os.stat(file_path).st_ino:
+                return
+            data = f.read()
+            if len(data) <= CHANGES_LOG_MAX_BYTES:
+                return
+            base, header_end = self._log_header(data)
+            # Граница строки не раньше середины журнала
+            keep_from = data.index(b"\n", header_end + (len(data) - header_end) // 2) + 1
+            new_base = base + keep_from - header_end
+            payload = json.dumps({"base": new_base}).encode('utf-8') + b"\n" + data[keep_from:]
+            tmp_path = f"{file_path}.{os.urandom(16).hex()}.tmp"
+            with open(tmp_path, 'wb') as tmp:
+                tmp.write(payload)
+            os.replace(tmp_path, file_path)
+
+    def changes(self, user_id, since=None):
+        """Имена персонажей, записанных после позиции since, и новая позиция.
+
+        Без since возвращает только текущую позицию журнала. Вместо списка
+        имён возвращается None, если журнал начат заново или сжат и записи
+        после since из него удалены.
+        """
+        try:
+            with open(self._changes_path(user_id), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                base, header_end = self._log_header(f.read(64))
+                end = base + size - header_end
+                if since is None:
+                    return [], end
+                if since > end or since < base:
+                    return None, end
+                f.seek(header_end + since - base)
+                data = f.read(end - since)
+        except FileNotFoundError:
+            return ([] if not since else None), 0
+        # Недописанная последняя строка будет прочитана в следующий раз
+        complete = data.rfind(b"\n") + 1
+        names = [json.loads(line) for line in data[:complete].splitlines()]
+        return names, since + complete
+
+
+class FileBlobStore:
+    """Содержимое, сохранённое один раз под своим SHA-256.
+
+    Файлы раскладываются по поддиректориям из первых символов хэша
+    (.blobs/ab/cd/<hash>.json), чтобы ни одна директория не разрасталась.
+    Срок хранения файла — максимальный срок ссылающихся на него записей,
+    он хранится в mtime и продлевается при каждой новой ссылке.
+    """
+
+    def __init__(self):
+        self.directory = path_join(STORAGE_ROOT, BLOB_DIRNAME)
+        self.expiry_index = ExpiryIndex(self.directory, remove=self._remove_expired)
+
+    def _filename(self, blob_hash):
+        return path_join(blob_hash[:2], blob_hash[2:4], f"{blob_hash}.json")
+
+    def path(self, blob_hash):
+        return path_join(self.directory, self._filename(blob_hash))
+
+    def get(self, blob_hash):
+        try:
+            with open(self.path(blob_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def open(self, blob_hash):
+        """Открывает содержимое для чтения (None, если его нет); открытый файл
+        остаётся читаемым, даже если очистка удалит его"""
+        try:
+            return open(self.path(blob_hash), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def put(self, payload, expires_at):
+        """Сохраняет содержимое (если его ещё нет) и возвращает его хэш"""
+        blob_hash = hashlib.sha256(payload).hexdigest()
+        if self._extend(blob_hash, expires_at):
+            return blob_hash
+
+        file_path = self.path(blob_hash)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.urandom(16).hex()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        self._publish(tmp_path, blob_hash, expires_at)
+        return blob_hash
+
+    def stage(self):
+        return _stage(self.directory)
+
+    def put_file(self, staged, blob_hash, expires_at):
+        """Как put(), но содержимое уже записано в файл stage() и его хэш известен"""
+        if self._extend(blob_hash, expires_at):
+            return blob_hash
+        staged.flush()
+        os.makedirs(os.path.dirname(self.path(blob_hash)), exist_ok=True)
+        self._publish(staged.name, blob_hash, expires_at)
+        return blob_hash
+
+    def _extend(self, blob_hash, expires_at):
+        # Продлевает срок уже сохранённого содержимого; False, если его нет
+        file_path = self.path(blob_hash)
+        try:
+            if os.stat(file_path).st_mtime < expires_at:
+                os.utime(file_path, (expires_at, expires_at))
+                self.expiry_index.add(self._filename(blob_hash), expires_at)
+            # Файл мог быть удалён очисткой между stat и utime
+            os.stat(file_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _publish(self, tmp_path, blob_hash, expires_at):
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, self.path(blob_hash))
+        self.expiry_index.add(self._filename(blob_hash), expires_at)
+
+    def _remove_expired(self, filename, current_time):
+        # Забираем файл переименованием и удаляем, только если срок не продлили
+        file_path = path_join(self.directory, filename)
+        claimed_path = f"{file_path}.{os.urandom(16).hex()}.del"
+        try:
+            os.rename(file_path, claimed_path)
+        except FileNotFoundError:
+            return
+        if os.stat(claimed_path).st_mtime >= current_time:
+            os.rename(claimed_path, file_path)
+        else:
+            os.remove(claimed_path)
+
+    def sweep(self, current_time=None, limit=SWEEP_LIMIT):
+        return self.expiry_index.sweep(current_time, limit)
+
+
+class SQLiteDatabase:
+    """Соединения с базой SQLite: по одному на поток, открываются лениво
+    (в том числе после fork в воркерах api.serve)."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS records ("
+        " store TEXT NOT NULL, key TEXT NOT NULL, payload BLOB NOT NULL, etag TEXT NOT NULL,"
+        " expires_at INTEGER, PRIMARY KEY (store, key)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS records_expires_at ON records (store, expires_at)"
+        " WHERE expires_at IS NOT NULL",
+        "CREATE TABLE IF NOT EXISTS characters ("
+        " user_id TEXT NOT NULL, name TEXT NOT NULL, payload BLOB NOT NULL, etag TEXT NOT NULL,"
+        " PRIMARY KEY (user_id, name)) WITHOUT ROWID",
+        # ETag списка имён пользователя меняется триггером при каждой записи
+        # персонажа, чтобы его не приходилось вычислять по всему списку
+        "CREATE TABLE IF NOT EXISTS character_lists ("
+        " user_id TEXT NOT NULL PRIMARY KEY, etag TEXT NOT NULL) WITHOUT ROWID",
+        "CREATE TRIGGER IF NOT EXISTS characters_list_etag AFTER INSERT ON characters BEGIN"
+        " INSERT INTO character_lists (user_id, etag) VALUES (NEW.user_id, '\"' || lower(hex(randomblob(16))) || '\"')"
+        " ON CONFLICT (user_id) DO UPDATE SET etag = excluded.etag; END",
+        # Журнал записанных персонажей (см. SQLiteCharacterStore.changes)
+        "CREATE TABLE IF NOT EXISTS character_changes ("
+        " seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, name TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS character_changes_user ON character_changes (user_id, seq)",
+        "CREATE TRIGGER IF NOT EXISTS characters_change_log AFTER INSERT ON characters BEGIN"
+        " INSERT INTO character_changes (user_id, name) VALUES (NEW.user_id, NEW.name); END",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # sqlite3 импортируется только при первом соединении: файловому
+            # хранилищу он не нужен, а холодный старт удлиняет
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # isolation_level=None: каждая команда — отдельная транзакция
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def execute(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Транзакция с блокировкой записи с самого начала (BEGIN IMMEDIATE)"""
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def executemany(self, sql, rows):
+        """Выполняет команду для всех строк в одной транзакции"""
+        with self.transaction() as connection:
+            connection.executemany(sql, rows)
+
+
+class SQLiteRecordStore:
+    """Записи по ключу в общей таблице records"""
+
+    def __init__(self, database, name, ttl=None):
+        self.database = database
+        self.name = name
+        self.ttl = ttl
+
+    def version(self, key):
+        row = self.database.execute(
+            "SELECT etag FROM records WHERE store = ? AND key = ?", (self.name, key)).fetchone()
+        return row[0] if row else None
+
+    def etag(self, key, version):
+        return version
+
+    def get(self, key):
+        row = self.database.execute(
+            "SELECT payload, etag FROM records WHERE store = ? AND key = ?", (self.name, key)).fetchone()
+        if row is None:
+            return None
+        return Record(row[1], bytes(row[0]), row[1])
+
+    def get_many(self, keys):
+        # Один запрос по первичному ключу на каждые SQLITE_MAX_PARAMETERS ключей
+        keys = list(dict.fromkeys(keys))
+        records = {}
+        for start in range(0, len(keys), SQLITE_MAX_PARAMETERS):
+            chunk = keys[start:start + SQLITE_MAX_PARAMETERS]
+            rows = self.database.execute(
+                f"SELECT key, payload, etag FROM records WHERE store = ? AND key IN ({', '.join('?' * len(chunk))})",
+                (self.name, *chunk))
+            for key, payload, etag in rows:
+                records[key] = Record(etag, bytes(payload), etag)
+        return records
+
+    def put(self, key, payload, expires_at=None):
+        etag = content_etag(payload)
+        self.database.execute(
+            "INSERT OR REPLACE INTO records (store, key, payload, etag, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (self.name, key, payload, etag, expires_at))
+        return None if self.ttl else etag
+
+    def update(self, key, modify):
+        """Заменяет запись на modify(текущее содержимое или None) в одной транзакции"""
+        with self.database.transaction():
+            record = self.get(key)
+            return self.put(key, modify(record.payload if record is not None else None))
+
+    def stage(self):
+        return _stage(os.path.dirname(self.database.path) or ".")
+
+    def put_file(self, key, staged, expires_at):
+        # Таблицы без rowid не поддерживают потоковую запись BLOB, поэтому
+        # содержимое один раз читается в память
+        self.put(key, _read_staged(staged), expires_at)
+
+    def delete(self, key):
+        self.database.execute("DELETE FROM records WHERE store = ? AND key = ?", (self.name, key))
+
+    def expires_at(self, key):
+        row = self.database.execute(
+            "SELECT expires_at FROM records WHERE store = ? AND key = ?", (self.name, key)).fetchone()
+        return row[0] if row else None
+
+    def sweep(self, current_time=None, limit=SWEEP_LIMIT):
+        # Один диапазонный DELETE по индексу (store, expires_at); limit не нужен
+        if current_time is None:
+            current_time = int(time.time())
+        cursor = self.database.execute(
+            "DELETE FROM records WHERE store = ? AND expires_at < ?", (self.name, current_time))
+        return cursor.rowcount
+
+
+class SQLiteBlobStore:
+    """Содержимое по SHA-256 в таблице records; срок хранения продлевается
+    тем же запросом, что и вставка"""
+
+    def __init__(self, database):
+        self.database = database
+
+    def get(self, blob_hash):
+        row = self.database.execute(
+            "SELECT payload FROM records WHERE store = 'blobs' AND key = ?", (blob_hash,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def open(self, blob_hash):
+        payload = self.get(blob_hash)
+        return io.BytesIO(payload) if payload is not None else None
+
+    def put(self, payload, expires_at):
+        return self._upsert(hashlib.sha256(payload).hexdigest(), payload, expires_at)
+
+    def stage(self):
+        return _stage(os.path.dirname(self.database.path) or ".")
+
+    def put_file(self, staged, blob_hash, expires_at):
+        return self._upsert(blob_hash, _read_staged(staged), expires_at)
+
+    def _upsert(self, blob_hash, payload, expires_at):
+        # Столбец etag заполняется тем же значением, что вернула бы content_etag()
+        self.database.execute(
+            "INSERT INTO records (store, key, payload, etag, expires_at) VALUES ('blobs', ?, ?, ?, ?)"
+            " ON CONFLICT (store, key) DO UPDATE SET expires_at = max(expires_at, excluded.expires_at)",
+            (blob_hash, payload, f'"{blob_hash[:32]}"', expires_at))
+        return blob_hash
+
+    def sweep(self, current_time=None, limit=SWEEP_LIMIT):
+        if current_time is None:
+            current_time = int(time.time())
+        cursor = self.database.execute(
+            "DELETE FROM records WHERE store = 'blobs' AND expires_at < ?", (current_time,))
+        return cursor.rowcount
+
+
+class SQLiteCharacterStore:
+    """Персонажи пользователей в таблице characters с ключом (user_id, name).
+
+    Список имён читается по первичному ключу уже отсортированным, поэтому
+    отдельный манифест не нужен.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def names(self, user_id):
+        # ETag читается до списка: если список успели изменить, ETag окажется
+        # старее данных и просто не совпадёт при следующем запросе
+        etag = self.names_etag(user_id)
+        rows = self.database.execute(
+            "SELECT name FROM characters WHERE user_id = ? ORDER BY name", (user_id,)).fetchall()
+        names = [row[0] for row in rows]
+        return names, etag or content_etag(json.dumps(names, ensure_ascii=False).encode('utf-8'))
+
+    def names_etag(self, user_id):
+        row = self.database.execute(
+            "SELECT etag FROM character_lists WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def names_page(self, user_id, after=None, prefix="", limit=None):
+        # Тот же отбор, что в sorted_page, но диапазоном по первичному ключу
+        sql = "SELECT name FROM characters WHERE user_id = ? AND name >= ?"
+        parameters = [user_id, prefix]
+        if after is not None and after >= prefix:
+            sql = "SELECT name FROM characters WHERE user_id = ? AND name > ?"
+            parameters = [user_id, after]
+        upper = prefix_end(prefix)
+        if upper is not None:
+            sql += " AND name < ?"
+            parameters.append(upper)
+        sql += " ORDER BY name LIMIT ?"
+        parameters.append(-1 if limit is None else limit)
+        return [row[0] for row in self.database.execute(sql, parameters)]
+
+    def version(self, user_id, name):
+        row = self.database.execute(
+            "SELECT etag FROM characters WHERE user_id = ? AND name = ?", (user_id, name)).fetchone()
+        return row[0] if row else None
+
+    def etag(self, user_id, name, version):
+        return version
+
+    def get(self, user_id, name):
+        row = self.database.execute(
+            "SELECT payload, etag FROM characters WHERE user_id = ? AND name = ?", (user_id, name)).fetchone()
+        if row is None:
+            return None
+        return Record(row[1], bytes(row[0]), row[1])
+
+    def items(self, user_id):
+        # Страницы по первичному ключу: ни память, ни время чтения не растут
+        # с числом персонажей, и читающая транзакция не держится между страницами
+        after, comparison = "", ">="
+        while True:
+            rows = self.database.execute(
+                f"SELECT name, payload FROM characters WHERE user_id = ? AND name {comparison} ?"
+                " ORDER BY name LIMIT ?", (user_id, after, ITER_PAGE_SIZE)).fetchall()
+            for name, payload in rows:
+                yield name, bytes(payload)
+            if len(rows) < ITER_PAGE_SIZE:
+                return
+            after, comparison = rows[-1][0], ">"
+
+    def put(self, user_id, name, payload):
+        etag = content_etag(payload)
+        self.database.execute(
+            "INSERT OR REPLACE INTO characters (user_id, name, payload, etag) VALUES (?, ?, ?, ?)",
+            (user_id, name, payload, etag))
+        self._compact_changes()
+        return etag
+
+    def put_many(self, user_id, payloads):
+        etags = {name: content_etag(payload) for name, payload in payloads.items()}
+        self.database.executemany(
+            "INSERT OR REPLACE INTO characters (user_id, name, payload, etag) VALUES (?, ?, ?, ?)",
+            [(user_id, name, payload, etags[name]) for name, payload in payloads.items()])
+        self._compact_changes()
+        return etags
+
+    def _compact_changes(self):
+        # Удаляются записи старше последних CHANGES_LOG_MAX_ROWS (диапазон по первичному ключу)
+        self.database.execute(
+            "DELETE FROM character_changes WHERE seq <= (SELECT max(seq) FROM character_changes) - ?",
+            (CHANGES_LOG_MAX_ROWS,))
+
+    def changes(self, user_id, since=None):
+        if since is None:
+            row = self.database.execute("SELECT max(seq) FROM character_changes").fetchone()
+            return [], row[0] or 0
+        # Записи до первой оставшейся удалены сжатием: читатель с более
+        # старой позицией мог их пропустить
+        oldest, newest = self.database.execute(
+            "SELECT min(seq), max(seq) FROM character_changes").fetchone()
+        if oldest is not None and since < oldest - 1:
+            return None, newest
+        rows = self.database.execute(
+            "SELECT seq, name FROM character_changes WHERE user_id = ? AND seq > ? ORDER BY seq",
+            (user_id, since)).fetchall()
+        return [row[1] for row in rows], rows[-1][0] if rows else since
+
+
+_database = None
+
+
+def _sqlite_database():
+    global _database
+    if _database is None:
+        _database = SQLiteDatabase(SQLITE_PATH)
+    return _database
+
+
+def record_store(name, ttl=None):
+    """Хранилище записей по ключу (init_data, data_storage, settings, global_characters)"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteRecordStore(_sqlite_database(), name, ttl)
+    return FileRecordStore(name, ttl)
+
+
+def blob_store():
+    """Хранилище содержимого с дедупликацией по хэшу"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBlobStore(_sqlite_database())
+    return FileBlobStore()
+
+
+def character_store():
+    """Хранилище персонажей пользователей"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteCharacterStore(_sqlite_database())
+    return FileCharacterStore()
+
+
+def store_sizes():
+    """Количество записей в каждом хранилище (для метрик), по именам директорий"""
+    sizes = dict.fromkeys(METRIC_DIRNAMES, 0)
+    if STORAGE_BACKEND == "sqlite":
+        database = _sqlite_database()
+        for name, count in database.execute("SELECT store, COUNT(*) FROM records GROUP BY store"):
+            dirname = FILE_LAYOUT.get(name, (None,))[0]
+            if dirname in sizes:
+                sizes[dirname] += count
+        sizes[CHARACTER_DIRNAME] += database.execute("SELECT COUNT(*) FROM characters").fetchone()[0]
+        return sizes
+
+    # Обход директорий линейный по числу записей, но выполняется только при сборе метрик
+    for dirname in sizes:
+        try:
+            with os.scandir(path_join(STORAGE_ROOT, dirname)) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and not entry.name.startswith("."):
+                        sizes[dirname] += 1
+        except FileNotFoundError:
+            pass
+    return sizes
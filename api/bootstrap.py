@@ -0,0 +1,82 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import urllib.parse
+
+from api._codec import encode_response, send_format_headers
+from api._etag import PRIVATE_CACHE_CONTROL, combine_etags, etag_matches, send_not_modified
+from api._metrics import instrument
+from api.characters import character_etag, character_list_etag, list_character_names, load_character
+from api.settings import load_settings
+
+@instrument("/api/bootstrap")
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Начальные данные Mini App за один запрос: настройки, список и активный персонаж
+        query = urllib.parse.urlsplit(self.path).query
+        params = urllib.parse.parse_qs(query)
+        user_id = params.get('user_id', ['default'])[0]
+
+        self.log_message(f"Bootstrap request for user_id: {user_id}")
+
+        try:
+            settings_entry, _ = load_settings(user_id)
+            settings = settings_entry.data
+
+            # Активный персонаж хранится в настройках как {"name": ...}
+            active_name = None
+            active_character = settings.get("character")
+            if isinstance(active_character, dict) and active_character.get("name"):
+                active_name = active_character["name"]
+
+            # ETag ответа складывается из ETag его частей, которые известны без чтения данных
+            list_etag = character_list_etag(user_id)
+            active_etag = character_etag(user_id, active_name) if active_name else ""
+            if list_etag is not None and active_etag is not None:
+                etag = combine_etags(settings_entry.etag, list_etag, active_etag)
+                if etag_matches(self, etag):
+                    send_not_modified(self, etag)
+                    return
+
+            character = None
+            active_etag = ""
+            if active_name:
+                character_entry, _ = load_character(user_id, active_name)
+                if character_entry is not None:
+                    character = character_entry.data
+                    active_etag = character_entry.etag
+            character_names, list_etag = list_character_names(user_id)
+
+            body, content_type, encoding = encode_response(self, {
+                "success": True,
+                "data": {
+                    "settings": settings,
+                    "character_names": character_names,
+                    "character": character
+                }
+            })
+
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding, combine_etags(settings_entry.etag, list_etag, active_etag))
+            self.send_header('Cache-Control', PRIVATE_CACHE_CONTROL)
+            self.end_headers()
+
+            self.wfile.write(body)
+
+        except Exception as e:
+            self.log_error(f"Error handling bootstrap request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+
+    def do_OPTIONS(self):
+        # Настройка CORS для предварительных запросов
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
@@ -0,0 +1,216 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import math
+import os
+import time
+
+from api import _notify
+from api._codec import loads
+from api._metrics import instrument, phase
+from api.characters import CHARACTER_STORE
+from api.settings import SETTINGS_CACHE, SETTINGS_STORE, merged_settings
+
+# Как часто хранилище проверяется на изменения из других процессов (в секундах)
+CHANGES_POLL_INTERVAL = float(os.environ.get("CHANGES_POLL_INTERVAL", "0.5"))
+
+# Сколько секунд держится поток SSE или ожидание long-poll. На Vercel функция
+# ограничена maxDuration, поэтому там ожидание короче
+CHANGES_STREAM_TIMEOUT = float(os.environ.get("CHANGES_STREAM_TIMEOUT", "8" if os.environ.get("VERCEL") else "25"))
+
+# Через сколько секунд тишины в поток SSE отправляется комментарий,
+# чтобы прокси не закрыли соединение
+CHANGES_HEARTBEAT = 15
+
+# Через сколько миллисекунд EventSource переподключается после закрытия потока
+CHANGES_RETRY_MS = 1000
+
+
+def parse_wait(value):
+    """Время ожидания long-poll в секундах, не больше CHANGES_STREAM_TIMEOUT; ValueError, если некорректно"""
+    wait = float(value)
+    if not math.isfinite(wait):
+        raise ValueError("wait must be a finite number of seconds")
+    return min(max(wait, 0.0), CHANGES_STREAM_TIMEOUT)
+
+
+def parse_cursor(value):
+    """Позиция ленты "<версия настроек>.<позиция журнала персонажей>"; ValueError, если некорректна"""
+    settings_version, _, characters_cursor = value.partition('.')
+    if not settings_version.isdigit() or not characters_cursor.isdigit():
+        raise ValueError("Invalid change cursor")
+    return int(settings_version), int(characters_cursor)
+
+
+class ChangeFeed:
+    """Изменения настроек и персонажей одного пользователя после позиции cursor.
+
+    Настройки сравниваются по их версии (промежуточные версии не выдаются,
+    только последняя), персонажи — по журналу хранилища (store.changes).
+    Без cursor лента начинается с текущего состояния.
+    """
+
+    def __init__(self, user_id, cursor=None):
+        self.user_id = user_id
+        self._record_version = None
+        if cursor is None:
+            self._record_version, settings = self._stored_settings()
+            self.settings_version = settings["version"]
+            _, self.characters_cursor = CHARACTER_STORE.changes(user_id)
+        else:
+            # Версия записи неизвестна, поэтому первый poll() прочитает настройки
+            self._record_version = object()
+            self.settings_version, self.characters_cursor = cursor
+
+    @property
+    def cursor(self):
+        return f"{self.settings_version}.{self.characters_cursor}"
+
+    def _stored_settings(self):
+        # Берутся только записанные настройки: отложенные ещё не получили версию
+        record = SETTINGS_STORE.get(self.user_id)
+        if record is None:
+            return None, merged_settings(None)
+        entry = SETTINGS_CACHE.peek(self.user_id, record.version)
+        if entry is not None:
+            return record.version, entry.data
+        return record.version, merged_settings(loads(record.payload))
+
+    def poll(self):
+        """Новые события [(тип, данные, позиция после события)]"""
+        events = []
+        if SETTINGS_STORE.version(self.user_id) != self._record_version:
+            self._record_version, settings = self._stored_settings()
+            if settings["version"] != self.settings_version:
+                self.settings_version = settings["version"]
+                events.append(("settings", {"version": self.settings_version, "settings": settings}, self.cursor))
+
+        names, self.characters_cursor = CHARACTER_STORE.changes(self.user_id, self.characters_cursor)
+        if names is None:
+            # Журнал начат заново: клиенту нужно перечитать список целиком
+            events.append(("characters", {"reset": True}, self.cursor))
+        elif names:
+            events.append(("characters", {"names": list(dict.fromkeys(names))}, self.cursor))
+        return events
+
+    def wait(self, timeout):
+        """Новые события, не дольше timeout секунд ожидания (пустой список, если их нет)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            # Счётчик берётся до проверки, чтобы не пропустить запись между ними
+            seen = _notify.generation(self.user_id)
+            with phase("storage"):
+                events = self.poll()
+            remaining = deadline - time.monotonic()
+            # not > 0, а не <= 0: так ожидание кончается и при NaN
+            if events or not remaining > 0:
+                return events
+            _notify.wait(self.user_id, seen, min(CHANGES_POLL_INTERVAL, remaining))
+
+
+@instrument("/api/changes")
+class handler(BaseHTTPRequestHandler):
+    # Запрос держит соединение до CHANGES_STREAM_TIMEOUT секунд (см. api.serve)
+    streaming = True
+
+    def do_GET(self):
+        # Лента изменений пользователя: SSE для EventSource, иначе long-poll
+        params = {}
+        if '?' in self.path:
+            query = self.path.split('?')[1]
+            params = dict(param.split('=', 1) for param in query.split('&') if '=' in param)
+        user_id = params.get('user_id', 'default')
+
+        self.log_message(f"Changes request for user_id: {user_id}")
+
+        try:
+            try:
+                # Позиция из Last-Event-ID присылается EventSource при переподключении
+                since = params.get('since') or self.headers.get('Last-Event-ID')
+                cursor = parse_cursor(since) if since else None
+                wait = parse_wait(params.get('wait', CHANGES_STREAM_TIMEOUT))
+            except ValueError as e:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+
+                response = json.dumps({"error": str(e), "success": False})
+                self.wfile.write(response.encode('utf-8'))
+                return
+
+            with phase("storage"):
+                feed = ChangeFeed(user_id, cursor)
+
+            if 'text/event-stream' in self.headers.get('Accept', ''):
+                self._stream(feed)
+                return
+
+            events = feed.wait(wait)
+
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+
+            response = json.dumps({
+                "success": True,
+                "data": {
+                    "cursor": feed.cursor,
+                    "events": [{"id": event_id, "type": event_type, "data": data}
+                               for event_type, data, event_id in events]
+                }
+            })
+            self.wfile.write(response.encode('utf-8'))
+
+        except Exception as e:
+            self.log_error(f"Error handling changes request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+
+    def _stream(self, feed):
+        # Поток закрывается через CHANGES_STREAM_TIMEOUT, и EventSource
+        # переподключается с Last-Event-ID, ничего не теряя
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            self.wfile.write(f"retry: {CHANGES_RETRY_MS}\n".encode('utf-8'))
+            self._send_event("ready", {"cursor": feed.cursor}, feed.cursor)
+            deadline = time.monotonic() + CHANGES_STREAM_TIMEOUT
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                events = feed.wait(min(CHANGES_HEARTBEAT, remaining))
+                for event_type, data, event_id in events:
+                    self._send_event(event_type, data, event_id)
+                if not events and time.monotonic() < deadline:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент отключился: он переподключится с последним полученным id
+            self.log_message(f"Changes stream closed by client for user {feed.user_id}")
+
+    def _send_event(self, event_type, data, event_id):
+        self.wfile.write(f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def do_OPTIONS(self):
+        # Настройка CORS для предварительных запросов
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Last-Event-ID')
+        self.end_headers()
@@ -1,14 +1,28 @@
 from http.server import BaseHTTPRequestHandler
+import base64
+import functools
+import heapq
+import itertools
 import json
 import os
 import re
 import time
-from os.path import join as path_join
 import urllib.parse
+from os.path import join as path_join
+
+from api._cache import ResponseCache
+from api._codec import (DecodeError, check_body_format, decode_body, dumps, encode_response, loads,
+                        send_format_headers)
+from api._etag import (DEFAULT_CACHE_CONTROL, PRIVATE_CACHE_CONTROL, combine_etags, content_etag,
+                       etag_matches, send_not_modified)
+from api._metrics import instrument, phase, register_cache
+from api._notify import notify
+from api._ratelimit import admit
+from api._search import SearchIndexes, build_index
+from api._storage import STORAGE_BACKEND, STORAGE_ROOT, character_store, sorted_page
 
-# Путь к директории для хранения данных персонажей
-STORAGE_DIR = "/tmp/character_data"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+# Хранилище персонажей пользователей
+CHARACTER_STORE = character_store()
 
 # Для имитации базы данных персонажей, если не используем реальную БД
 DEFAULT_CHARACTERS = [
@@ -19,6 +33,200 @@ DEFAULT_CHARACTERS = [
     {"name": "Цзин Юань", "description": "Мудрый советник", "greeting": "Приветствую, путник."}
 ]
 
+# Максимальное число персонажей в одном пакетном запросе
+CHARACTER_BATCH_LIMIT = int(os.environ.get("CHARACTER_BATCH_LIMIT", "100"))
+
+# Сколько результатов поиска возвращается по умолчанию и наибольшее допустимое
+SEARCH_RESULT_LIMIT = 20
+SEARCH_RESULT_MAX = 100
+
+# Размер страницы списка персонажей по умолчанию и наибольший допустимый
+CHARACTER_PAGE_SIZE = 100
+CHARACTER_PAGE_MAX = 1000
+
+# Имена стандартных персонажей в порядке сортировки списка
+DEFAULT_CHARACTER_NAMES = sorted(char["name"] for char in DEFAULT_CHARACTERS)
+
+# Стандартные персонажи не меняются во время работы, поэтому их ETag вычисляются один раз
+DEFAULT_CHARACTER_ETAGS = {
+    char["name"]: content_etag(dumps(char))
+    for char in DEFAULT_CHARACTERS
+}
+DEFAULT_NAMES_ETAG = content_etag(json.dumps(DEFAULT_CHARACTER_NAMES, ensure_ascii=False).encode('utf-8'))
+
+# Список пользователя без своих персонажей и готовое тело ответа с ним
+DEFAULT_CHARACTER_LIST = [{"name": name} for name in DEFAULT_CHARACTER_NAMES]
+DEFAULT_LIST_RESPONSE = dumps({"success": True, "data": {"character_names": DEFAULT_CHARACTER_LIST}})
+# Сжатые варианты DEFAULT_LIST_RESPONSE по кодировкам (заполняются encode_body)
+DEFAULT_LIST_VARIANTS = {}
+
+# Индексы поиска пользовательских персонажей: строятся при первом поиске
+# (или загружаются из снимка) и дальше обновляются по журналу изменений.
+# Позиции журнала у хранилищ разные, поэтому и снимки у каждого свои
+SEARCH_INDEXES = SearchIndexes(CHARACTER_STORE, snapshot_dir=path_join(STORAGE_ROOT, "search_index", STORAGE_BACKEND))
+
+# Разбор пути запроса
+LIST_PATTERN = re.compile(r'/api/characters(?:\?user_id=([^&]+))?$')
+DETAIL_PATTERN = re.compile(r'/api/characters/([^/?]+)(?:\?user_id=([^&]+))?$')
+
+# Кэш ответов GET /api/characters/:name по (user_id, имя персонажа)
+DETAIL_CACHE = ResponseCache()
+register_cache("character_detail", DETAIL_CACHE)
+
+
+def load_user_character_names(user_id):
+    """Возвращает отсортированный список имён пользовательских персонажей и его ETag"""
+    with phase("storage"):
+        return CHARACTER_STORE.names(user_id)
+
+
+def character_etag(user_id, character_name):
+    """ETag персонажа без чтения его данных (None, если неизвестен или персонажа нет)"""
+    version = CHARACTER_STORE.version(user_id, character_name)
+    if version is None:
+        return DEFAULT_CHARACTER_ETAGS.get(character_name)
+    entry = DETAIL_CACHE.peek((user_id, character_name), version)
+    if entry is not None:
+        return entry.etag
+    return CHARACTER_STORE.etag(user_id, character_name, version)
+
+
+def load_character(user_id, character_name):
+    """Возвращает запись кэша с данными персонажа (или None) и статус кэша (HIT/MISS)"""
+    # Проверяем, не изменился ли персонаж с момента кэширования ответа
+    cache_key = (user_id, character_name)
+    version = CHARACTER_STORE.version(user_id, character_name)
+    entry = DETAIL_CACHE.get(cache_key, version)
+    if entry is not None:
+        return entry, 'HIT'
+    
+    character_data = None
+    with phase("storage"):
+        record = CHARACTER_STORE.get(user_id, character_name)
+    if record is not None:
+        version, etag = record.version, record.etag
+        with phase("parse"):
+            character_data = loads(record.payload)
+    else:
+        # Ищем персонажа в стандартных персонажах
+        version = None
+        for char in DEFAULT_CHARACTERS:
+            if char["name"] == character_name:
+                character_data = char
+                etag = DEFAULT_CHARACTER_ETAGS[character_name]
+                break
+    
+    if character_data is None:
+        return None, 'MISS'
+    
+    response = dumps({"success": True, "data": character_data})
+    return DETAIL_CACHE.put(cache_key, version, character_data, response, etag), 'MISS'
+
+
+def character_name_error(data):
+    """Почему данные персонажа из запроса нельзя сохранить (None, если имя подходит)"""
+    if not isinstance(data, dict) or 'name' not in data:
+        return "Character name is required"
+    name = data['name']
+    # Имя становится частью имени файла персонажа и ключом в манифесте
+    if not isinstance(name, str) or not name.strip() or '/' in name or '\x00' in name:
+        return "Character name must be a non-empty string without \"/\""
+    return None
+
+
+def build_character(data, user_id, created_at):
+    """Данные персонажа для сохранения из тела запроса (имя уже проверено)"""
+    return {
+        "name": data['name'],
+        "description": data.get('description', ''),
+        "greeting": data.get('greeting', 'Привет!'),
+        "user_id": user_id,
+        "created_at": created_at
+    }
+
+
+def character_list_etag(user_id):
+    """ETag списка персонажей без чтения списка имён (None, если неизвестен)"""
+    names_etag = CHARACTER_STORE.names_etag(user_id)
+    if names_etag is None:
+        return None
+    return combine_etags(DEFAULT_NAMES_ETAG, names_etag)
+
+
+@functools.lru_cache(maxsize=None)
+def default_search_index():
+    """Индекс стандартных персонажей: строится один раз при первом поиске, а не при импорте"""
+    return build_index((char["name"], char) for char in DEFAULT_CHARACTERS)
+
+
+def list_character_names(user_id):
+    """Объединяет стандартных и пользовательских персонажей в один отсортированный список.
+
+    Возвращает список и его ETag; для пользователя без своих персонажей —
+    сам DEFAULT_CHARACTER_LIST.
+    """
+    user_names, names_etag = load_user_character_names(user_id)
+    if not user_names:
+        return DEFAULT_CHARACTER_LIST, combine_etags(DEFAULT_NAMES_ETAG, names_etag)
+    character_names = []
+    previous = None
+    for name in heapq.merge(DEFAULT_CHARACTER_NAMES, user_names):
+        if name != previous:
+            character_names.append({"name": name})
+            previous = name
+    return character_names, combine_etags(DEFAULT_NAMES_ETAG, names_etag)
+
+
+def search_characters(user_id, query, limit=SEARCH_RESULT_LIMIT):
+    """Персонажи, подходящие под запрос, с оценками, лучшие первыми"""
+    with phase("search"):
+        scores = dict(SEARCH_INDEXES.search(user_id, query, limit))
+    # Стандартный персонаж не показывается, если пользователь сохранил своего с тем же именем
+    for name, score in default_search_index().search(query, limit):
+        if name not in scores and CHARACTER_STORE.version(user_id, name) is None:
+            scores[name] = score
+    
+    results = []
+    for name, score in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]:
+        entry, _ = load_character(user_id, name)
+        if entry is not None:
+            results.append(dict(entry.data, score=score))
+    return results
+
+
+def encode_cursor(name):
+    """Курсор страницы — последнее выданное имя: он остаётся верным при
+    добавлении и удалении других персонажей"""
+    return base64.urlsafe_b64encode(name.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Имя из курсора; ValueError, если курсор повреждён"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return base64.b64decode(padded, altchars='-_', validate=True).decode('utf-8')
+
+
+def list_character_page(user_id, after=None, prefix="", limit=CHARACTER_PAGE_SIZE):
+    """Страница объединённого отсортированного списка персонажей.
+
+    Из стандартных и пользовательских имён берётся не больше limit + 1 с каждой
+    стороны, поэтому полный список не строится. Возвращает список и курсор
+    следующей страницы (None, если страница последняя).
+    """
+    default_names = sorted_page(DEFAULT_CHARACTER_NAMES, after, prefix, limit + 1)
+    with phase("storage"):
+        user_names = CHARACTER_STORE.names_page(user_id, after, prefix, limit + 1)
+    
+    names = []
+    for name in heapq.merge(default_names, user_names):
+        if not names or names[-1] != name:
+            names.append(name)
+    
+    next_cursor = encode_cursor(names[limit - 1]) if len(names) > limit else None
+    return [{"name": name} for name in itertools.islice(names, limit)], next_cursor
+
+
+@instrument("/api/characters")
 class handler(BaseHTTPRequestHandler):
     def log_request(self, code='-', size='-'):
         self.log_message('"%s" %s %s',
@@ -27,12 +235,33 @@ class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         self.log_message(f"Processing GET request: {self.path}")
         
-        # Используем регулярное выражение для извлечения параметров из URL
-        list_pattern = re.compile(r'/api/characters(?:\?user_id=([^&]+))?$')
-        detail_pattern = re.compile(r'/api/characters/([^/]+)(?:\?user_id=([^&]+))?$')
+        # Несколько персонажей одним запросом: /api/characters?names=a,b,c
+        path, _, query = self.path.partition('?')
+        params = dict(param.split('=', 1) for param in query.split('&') if '=' in param)
+        if path == '/api/characters' and 'names' in params:
+            names = [urllib.parse.unquote(name) for name in params['names'].split(',') if name]
+            user_id = params.get('user_id') or 'default'
+            self.log_message(f"Character multi-get request for {len(names)} names, user_id: {user_id}")
+            self._handle_multi_request(names, user_id)
+            return
+        
+        # Поиск: /api/characters/search?q=...
+        if path == '/api/characters/search' and 'q' in params:
+            user_id = params.get('user_id') or 'default'
+            self.log_message(f"Character search request for user_id: {user_id}")
+            self._handle_search_request(params, user_id)
+            return
+        
+        # Постраничный список: /api/characters?limit=...&cursor=...&prefix=...
+        if path == '/api/characters' and any(name in params for name in ('limit', 'cursor', 'prefix')):
+            user_id = params.get('user_id') or 'default'
+            self.log_message(f"Character page request for user_id: {user_id}")
+            self._handle_page_request(user_id, params)
+            return
         
-        list_match = list_pattern.match(self.path)
-        detail_match = detail_pattern.match(self.path)
+        # Используем регулярное выражение для извлечения параметров из URL
+        list_match = LIST_PATTERN.match(self.path)
+        detail_match = DETAIL_PATTERN.match(self.path)
         
         if list_match:
             # Запрос на получение списка персонажей
@@ -60,70 +289,68 @@ class handler(BaseHTTPRequestHandler):
         # Обработка запроса на создание/обновление персонажа
         self.log_message(f"Processing POST request: {self.path}")
         
-        if self.path.startswith('/api/characters'):
+        # Лимит частоты проверяется до чтения тела
+        if self.path.startswith('/api/characters') and not admit(self, self._query_user_id()):
+            return
+        if self.path.startswith('/api/characters') and not check_body_format(self):
+            return
+        
+        if self.path.split('?')[0] == '/api/characters/batch':
+            self._handle_batch_request()
+        elif self.path.startswith('/api/characters'):
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             
             try:
-                data = json.loads(post_data.decode('utf-8'))
+                with phase("parse"):
+                    data = decode_body(self, post_data)
                 self.log_message(f"Received character data: {json.dumps(data)[:100]}...")
                 
                 # Проверяем наличие необходимых полей
-                if 'name' not in data:
-                    self.log_message("Missing required field: name")
+                name_error = character_name_error(data)
+                if name_error is not None:
+                    self.log_message(f"Invalid character name: {name_error}")
                     self.send_response(400)
                     self.send_header('Content-type', 'application/json')
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.end_headers()
                     
-                    response = json.dumps({"error": "Character name is required", "success": False})
+                    response = json.dumps({"error": name_error, "success": False})
                     self.wfile.write(response.encode('utf-8'))
                     return
                 
-                # Получаем user_id из query параметра или используем значение по умолчанию
-                user_id = 'default'
-                if '?' in self.path:
-                    query = self.path.split('?')[1]
-                    params = dict(param.split('=') for param in query.split('&') if '=' in param)
-                    user_id = params.get('user_id', 'default')
-                
                 # Сохраняем персонажа
+                user_id = self._query_user_id()
                 character_name = data['name']
-                description = data.get('description', '')
-                greeting = data.get('greeting', 'Привет!')
-                
-                character_data = {
-                    "name": character_name,
-                    "description": description,
-                    "greeting": greeting,
-                    "user_id": user_id,
-                    "created_at": int(time.time())
-                }
+                character_data = build_character(data, user_id, int(time.time()))
                 
                 # Сохраняем в локальное хранилище
-                file_path = path_join(STORAGE_DIR, f"{character_name}_{user_id}.json")
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(character_data, f, ensure_ascii=False)
+                payload = dumps(character_data)
+                with phase("storage"):
+                    CHARACTER_STORE.put(user_id, character_name, payload)
+                DETAIL_CACHE.invalidate((user_id, character_name))
+                notify(user_id)
                 
                 self.log_message(f"Character '{character_name}' saved for user {user_id}")
                 
                 # Отправляем успешный ответ
+                body, content_type, encoding = encode_response(self, {"success": True, "data": character_data})
+                
                 self.send_response(200)
-                self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
+                send_format_headers(self, content_type, encoding)
                 self.end_headers()
                 
-                response = json.dumps({"success": True, "data": character_data})
-                self.wfile.write(response.encode('utf-8'))
+                self.wfile.write(body)
                 
-            except json.JSONDecodeError as e:
-                self.log_message(f"JSON decode error: {str(e)}")
+            except DecodeError as e:
+                self.log_message(f"Request body decode error: {str(e)}")
                 self.send_response(400)
                 self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
                 self.end_headers()
                 
-                response = json.dumps({"error": f"Invalid JSON: {str(e)}", "success": False})
+                response = json.dumps({"error": str(e), "success": False})
                 self.wfile.write(response.encode('utf-8'))
             
             except Exception as e:
@@ -153,42 +380,291 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
     
-    def _handle_list_request(self, user_id):
+    def _query_user_id(self):
+        # Получаем user_id из query параметра или используем значение по умолчанию
+        user_id = 'default'
+        if '?' in self.path:
+            query = self.path.split('?')[1]
+            params = dict(param.split('=') for param in query.split('&') if '=' in param)
+            user_id = params.get('user_id', 'default')
+        return user_id
+    
+    def _handle_batch_request(self):
+        # Создание/обновление нескольких персонажей одной записью в хранилище
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        
         try:
-            # Получаем список персонажей из локального хранилища
-            character_names = []
-            
-            # Сначала добавляем стандартных персонажей
-            for char in DEFAULT_CHARACTERS:
-                character_names.append({"name": char["name"]})
-            
-            # Теперь ищем пользовательских персонажей
-            user_suffix = f"_{user_id}.json"
-            for filename in os.listdir(STORAGE_DIR):
-                if filename.endswith(user_suffix):
-                    try:
-                        char_name = filename.replace(user_suffix, "")
-                        if not any(c["name"] == char_name for c in character_names):
-                            character_names.append({"name": char_name})
-                    except Exception:
-                        continue
-            
-            # Сортируем по имени
-            character_names.sort(key=lambda x: x["name"])
+            with phase("parse"):
+                items = decode_body(self, post_data)
+            
+            if not isinstance(items, list) or len(items) > CHARACTER_BATCH_LIMIT:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({
+                    "error": f"Expected a list of at most {CHARACTER_BATCH_LIMIT} characters",
+                    "success": False
+                })
+                self.wfile.write(response.encode('utf-8'))
+                return
+            
+            user_id = self._query_user_id()
+            created_at = int(time.time())
+            
+            # Результат по каждому элементу в порядке запроса; при повторе имени
+            # сохраняется последний вариант, как при последовательных POST
+            results = []
+            payloads = {}
+            for index, item in enumerate(items):
+                name_error = character_name_error(item)
+                if name_error is not None:
+                    results.append({"index": index, "error": name_error, "success": False})
+                    continue
+                character_data = build_character(item, user_id, created_at)
+                payloads[item['name']] = dumps(character_data)
+                results.append({"index": index, "success": True, "data": character_data})
+            
+            if payloads:
+                with phase("storage"):
+                    CHARACTER_STORE.put_many(user_id, payloads)
+                for character_name in payloads:
+                    DETAIL_CACHE.invalidate((user_id, character_name))
+                notify(user_id)
+            
+            self.log_message(f"Batch saved {len(payloads)} characters for user {user_id}")
+            
+            body, content_type, encoding = encode_response(self, {"success": True, "data": {"results": results}})
             
-            # Отправляем список персонажей
             self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding)
+            self.end_headers()
+            
+            self.wfile.write(body)
+            
+        except DecodeError as e:
+            self.log_message(f"Request body decode error: {str(e)}")
+            self.send_response(400)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             
-            response = json.dumps({
-                "success": True, 
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+        
+        except Exception as e:
+            self.log_message(f"Error handling character batch save: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+    
+    def _handle_multi_request(self, names, user_id):
+        try:
+            # Повторы имён не нужны в ответе
+            names = list(dict.fromkeys(names))
+            if not names or len(names) > CHARACTER_BATCH_LIMIT:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({
+                    "error": f"Expected from 1 to {CHARACTER_BATCH_LIMIT} character names",
+                    "success": False
+                })
+                self.wfile.write(response.encode('utf-8'))
+                return
+            
+            # Если у клиента уже есть актуальные версии всех персонажей, данные не читаем
+            etags = [character_etag(user_id, name) for name in names]
+            etag = combine_etags(*etags) if all(etags) else None
+            if etag_matches(self, etag):
+                send_not_modified(self, etag)
+                return
+            
+            # Каждый персонаж берётся так же, как в _handle_detail_request:
+            # из кэша, хранилища или среди стандартных
+            characters = []
+            not_found = []
+            etags = []
+            for name in names:
+                entry, _ = load_character(user_id, name)
+                if entry is None:
+                    not_found.append(name)
+                else:
+                    characters.append(entry.data)
+                    etags.append(entry.etag)
+            etag = combine_etags(*etags) if not not_found and all(etags) else None
+            
+            body, content_type, encoding = encode_response(self, {
+                "success": True,
                 "data": {
-                    "character_names": character_names
+                    "characters": characters,
+                    "not_found": not_found
                 }
             })
+            
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding, etag)
+            self.send_header('Cache-Control', PRIVATE_CACHE_CONTROL)
+            self.end_headers()
+            
+            self.wfile.write(body)
+            
+        except Exception as e:
+            self.log_message(f"Error handling character multi-get request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+    
+    def _handle_search_request(self, params, user_id):
+        try:
+            query = urllib.parse.unquote_plus(params['q'])
+            try:
+                limit = int(params.get('limit', SEARCH_RESULT_LIMIT))
+            except ValueError:
+                limit = 0
+            
+            if not query.strip() or not 1 <= limit <= SEARCH_RESULT_MAX:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({
+                    "error": f"q must not be empty and limit must be from 1 to {SEARCH_RESULT_MAX}",
+                    "success": False
+                })
+                self.wfile.write(response.encode('utf-8'))
+                return
+            
+            results = search_characters(user_id, query, limit)
+            
+            body, content_type, encoding = encode_response(self, {"success": True, "data": {"results": results}})
+            
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding)
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            
+            self.wfile.write(body)
+            
+            self.log_message(f"Search returned {len(results)} characters for user {user_id}")
+            
+        except Exception as e:
+            self.log_message(f"Error handling character search request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
             self.wfile.write(response.encode('utf-8'))
+    
+    def _handle_page_request(self, user_id, params):
+        try:
+            try:
+                limit = int(params.get('limit', CHARACTER_PAGE_SIZE))
+                after = decode_cursor(params['cursor']) if params.get('cursor') else None
+            except ValueError:
+                limit = 0
+            prefix = urllib.parse.unquote(params.get('prefix', ''))
+            
+            if not 1 <= limit <= CHARACTER_PAGE_MAX:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({
+                    "error": f"limit must be from 1 to {CHARACTER_PAGE_MAX} and cursor must come from next_cursor",
+                    "success": False
+                })
+                self.wfile.write(response.encode('utf-8'))
+                return
+            
+            # Страница меняется только вместе со списком имён, поэтому её ETag
+            # строится из ETag списка и параметров запроса
+            list_etag = character_list_etag(user_id)
+            query = json.dumps([limit, after, prefix], ensure_ascii=False)
+            etag = combine_etags(list_etag, query) if list_etag else None
+            if etag_matches(self, etag):
+                send_not_modified(self, etag)
+                return
+            
+            character_names, next_cursor = list_character_page(user_id, after, prefix, limit)
+            
+            body, content_type, encoding = encode_response(self, {
+                "success": True,
+                "data": {
+                    "character_names": character_names,
+                    "next_cursor": next_cursor
+                }
+            })
+            
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding, etag)
+            self.send_header('Cache-Control', PRIVATE_CACHE_CONTROL)
+            self.end_headers()
+            
+            self.wfile.write(body)
+            
+        except Exception as e:
+            self.log_message(f"Error handling character page request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+    
+    def _handle_list_request(self, user_id):
+        try:
+            # Если у клиента уже есть актуальный список, не читаем манифест
+            etag = character_list_etag(user_id)
+            if etag_matches(self, etag):
+                send_not_modified(self, etag)
+                return
+            
+            # Получаем отсортированный список персонажей из манифеста пользователя
+            character_names, etag = list_character_names(user_id)
+            
+            response = {
+                "success": True, 
+                "data": {
+                    "character_names": character_names
+                }
+            }
+            if character_names is DEFAULT_CHARACTER_LIST:
+                # Список по умолчанию сериализован в JSON и сжат заранее
+                body, content_type, encoding = encode_response(self, response, DEFAULT_LIST_RESPONSE,
+                                                               DEFAULT_LIST_VARIANTS)
+            else:
+                body, content_type, encoding = encode_response(self, response)
+            
+            # Отправляем список персонажей
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding, etag)
+            self.send_header('Cache-Control', PRIVATE_CACHE_CONTROL)
+            self.end_headers()
+            
+            self.wfile.write(body)
             
             self.log_message(f"Returned {len(character_names)} characters for user {user_id}")
             
@@ -204,36 +680,36 @@ class handler(BaseHTTPRequestHandler):
     
     def _handle_detail_request(self, character_name, user_id):
         try:
-            # Ищем персонажа в локальном хранилище
-            file_path = path_join(STORAGE_DIR, f"{character_name}_{user_id}.json")
+            # Если у клиента уже есть актуальная версия, не читаем данные персонажа
+            etag = character_etag(user_id, character_name)
+            if etag_matches(self, etag):
+                cache_control = PRIVATE_CACHE_CONTROL
+                if etag == DEFAULT_CHARACTER_ETAGS.get(character_name):
+                    cache_control = DEFAULT_CACHE_CONTROL
+                send_not_modified(self, etag, cache_control)
+                return
             
-            character_data = None
+            # Ищем персонажа в локальном хранилище и среди стандартных
+            entry, cache_status = load_character(user_id, character_name)
+            if entry is None:
+                self.log_message(f"Character not found: {character_name}")
             
-            if os.path.exists(file_path):
-                # Считываем данные персонажа из файла
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    character_data = json.load(f)
-                self.log_message(f"Loaded character data from file: {character_name}")
-            else:
-                # Ищем персонажа в стандартных персонажах
-                for char in DEFAULT_CHARACTERS:
-                    if char["name"] == character_name:
-                        character_data = char
-                        self.log_message(f"Found character in default list: {character_name}")
-                        break
-                
-                if character_data is None:
-                    self.log_message(f"Character not found: {character_name}")
+            self.log_message(f"Character cache {cache_status} for {character_name}, "
+                             f"hits: {DETAIL_CACHE.hits}, misses: {DETAIL_CACHE.misses}")
             
-            if character_data:
+            if entry is not None:
                 # Персонаж найден
+                body, content_type, encoding = encode_response(self, {"success": True, "data": entry.data},
+                                                               entry.body, entry.variants)
+                
                 self.send_response(200)
-                self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('X-Cache', cache_status)
+                send_format_headers(self, content_type, encoding, entry.etag)
+                self.send_header('Cache-Control', DEFAULT_CACHE_CONTROL if entry.version is None else PRIVATE_CACHE_CONTROL)
                 self.end_headers()
                 
-                response = json.dumps({"success": True, "data": character_data})
-                self.wfile.write(response.encode('utf-8'))
+                self.wfile.write(body)
             else:
                 # Персонаж не найден
                 self.send_response(404)
@@ -0,0 +1,81 @@
+from http.server import BaseHTTPRequestHandler
+import json
+
+from api._metrics import instrument, phase
+from api.characters import CHARACTER_STORE
+from api.settings import load_settings
+
+
+def export_lines(user_id):
+    """Строки NDJSON с настройками и персонажами пользователя.
+
+    Данные персонажей вставляются в строку как есть, без разбора, и читаются
+    по одному, поэтому память не зависит от числа персонажей.
+    """
+    entry, _ = load_settings(user_id)
+    if entry.version is not None:
+        # Настройки по умолчанию не выгружаем: при импорте они и так получатся
+        yield json.dumps({"type": "settings", "data": entry.data}, ensure_ascii=False).encode('utf-8') + b"\n"
+    for _, payload in CHARACTER_STORE.items(user_id):
+        yield b'{"type": "character", "data": ' + payload + b'}\n'
+
+
+@instrument("/api/export")
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Выгрузка всех данных пользователя построчно (NDJSON)
+        user_id = 'default'
+        if '?' in self.path:
+            query = self.path.split('?')[1]
+            params = dict(param.split('=') for param in query.split('&') if '=' in param)
+            user_id = params.get('user_id', 'default')
+
+        self.log_message(f"Export request for user_id: {user_id}")
+
+        streaming = False
+        try:
+            lines = export_lines(user_id)
+            # Первая строка читается до заголовков, чтобы ошибка хранилища
+            # превратилась в ответ 500, а не в оборванный поток
+            with phase("storage"):
+                first_line = next(lines, b"")
+
+            # Длина заранее неизвестна: тело заканчивается закрытием соединения
+            self.send_response(200)
+            self.send_header('Content-type', 'application/x-ndjson; charset=utf-8')
+            self.send_header('Content-Disposition', f'attachment; filename="export_{user_id}.ndjson"')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            streaming = True
+
+            self.wfile.write(first_line)
+            count = 1 if first_line else 0
+            for line in lines:
+                self.wfile.write(line)
+                count += 1
+
+            self.log_message(f"Exported {count} records for user {user_id}")
+
+        except Exception as e:
+            self.log_error(f"Error handling export request: {str(e)}")
+            if streaming:
+                # Заголовки уже отправлены: клиент увидит оборванный поток
+                return
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+
+    def do_OPTIONS(self):
+        # Настройка CORS для предварительных запросов
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
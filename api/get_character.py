@@ -1,19 +1,29 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
 import re
-from os.path import join as path_join
 import urllib.parse
 
-# Путь к директории для хранения данных
-STORAGE_DIR = "/tmp/character_data"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+from api._cache import ResponseCache
+from api._codec import check_body_format, decode_body, dumps, encode_response, loads, send_format_headers
+from api._etag import PRIVATE_CACHE_CONTROL, etag_matches, send_not_modified
+from api._metrics import instrument, phase, register_cache
+from api._storage import record_store
 
+# Хранилище данных персонажей, присланных ботом
+GLOBAL_CHARACTER_STORE = record_store("global_characters")
+
+# Кэш ответов GET по имени персонажа
+CHARACTER_CACHE = ResponseCache()
+register_cache("get_character", CHARACTER_CACHE)
+
+# Имя персонажа в URL запроса
+NAME_PATTERN = re.compile(r'/api/get_character(?:\?name=([^&]+))?')
+
+@instrument("/api/get_character")
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # Извлекаем имя персонажа из URL
-        name_pattern = re.compile(r'/api/get_character(?:\?name=([^&]+))?')
-        match = name_pattern.match(self.path)
+        match = NAME_PATTERN.match(self.path)
         
         if not match or not match.group(1):
             # Если имя не найдено в URL
@@ -31,22 +41,43 @@ class handler(BaseHTTPRequestHandler):
         try:
             # Поскольку мы не можем напрямую взаимодействовать с файловой системой бота,
             # мы проверяем, есть ли уже сохраненные данные о персонаже
-            file_path = path_join(STORAGE_DIR, f"{character_name}.json")
-            
-            # Проверяем существование файла
-            if os.path.exists(file_path):
-                # Читаем данные из файла
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    character_data = json.load(f)
+            # Проверяем существование записи и актуальность кэша
+            version = GLOBAL_CHARACTER_STORE.version(character_name)
+            if version is not None:
+                # Если у клиента уже есть актуальная версия, не читаем данные
+                entry = CHARACTER_CACHE.peek(character_name, version)
+                etag = entry.etag if entry is not None else GLOBAL_CHARACTER_STORE.etag(character_name, version)
+                if etag_matches(self, etag):
+                    send_not_modified(self, etag)
+                    return
+                
+                entry = CHARACTER_CACHE.get(character_name, version)
+                cache_status = 'HIT'
+                
+                if entry is None:
+                    cache_status = 'MISS'
+                    # Читаем данные из хранилища
+                    with phase("storage"):
+                        record = GLOBAL_CHARACTER_STORE.get(character_name)
+                    with phase("parse"):
+                        character_data = loads(record.payload)
+                    version, etag = record.version, record.etag
+                    
+                    response = dumps({"data": character_data, "success": True})
+                    entry = CHARACTER_CACHE.put(character_name, version, character_data, response, etag)
+                
+                body, content_type, encoding = encode_response(self, {"data": entry.data, "success": True},
+                                                               entry.body, entry.variants)
                 
                 # Отправляем данные клиенту
                 self.send_response(200)
-                self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('X-Cache', cache_status)
+                send_format_headers(self, content_type, encoding, entry.etag)
+                self.send_header('Cache-Control', PRIVATE_CACHE_CONTROL)
                 self.end_headers()
                 
-                response = json.dumps({"data": character_data, "success": True})
-                self.wfile.write(response.encode('utf-8'))
+                self.wfile.write(body)
             else:
                 # Если данных нет, отправляем ошибку
                 self.send_response(404)
@@ -72,6 +103,9 @@ class handler(BaseHTTPRequestHandler):
     
     def do_POST(self):
         """Сохранение данных о персонаже"""
+        if not check_body_format(self):
+            return
+        
         # Получаем длину тела запроса
         content_length = int(self.headers['Content-Length'])
         
@@ -79,8 +113,9 @@ class handler(BaseHTTPRequestHandler):
         post_data = self.rfile.read(content_length)
         
         try:
-            # Парсим JSON
-            data = json.loads(post_data.decode('utf-8'))
+            # Разбираем тело (JSON или MessagePack)
+            with phase("parse"):
+                data = decode_body(self, post_data)
             
             if "name" not in data:
                 self.send_response(400)
@@ -95,9 +130,9 @@ class handler(BaseHTTPRequestHandler):
             character_name = data["name"]
             
             # Сохраняем данные персонажа
-            file_path = path_join(STORAGE_DIR, f"{character_name}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False)
+            with phase("storage"):
+                GLOBAL_CHARACTER_STORE.put(character_name, dumps(data))
+            CHARACTER_CACHE.invalidate(character_name)
             
             # Отправляем подтверждение клиенту
             self.send_response(200)
@@ -1,19 +1,31 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import select
 import time
-from os.path import join as path_join
 import re
 
-# Путь к директории для хранения данных
-STORAGE_DIR = "/tmp/data_storage"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+from api._codec import loads
+from api._compress import compress, encode_body, response_encoding, send_encoding_headers
+from api._etag import etag_matches, id_etag, immutable_cache_control, send_not_modified
+from api._metrics import instrument, phase
+from api._storage import blob_store, record_store
 
+# Время жизни данных (в секундах), должно совпадать с store_data.py
+DATA_TTL = 3600  # 1 час
+
+# Хранилища, общие с store_data.py: ссылки по ID и содержимое по хэшу
+DATA_STORE = record_store("data_storage", ttl=DATA_TTL)
+BLOB_STORE = blob_store()
+
+# ID данных в URL запроса
+ID_PATTERN = re.compile(r'/api/get_data/([a-zA-Z0-9\-]+)')
+
+@instrument("/api/get_data")
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # Извлекаем ID данных из URL
-        id_pattern = re.compile(r'/api/get_data/([a-zA-Z0-9\-]+)')
-        match = id_pattern.match(self.path)
+        match = ID_PATTERN.match(self.path)
         
         if not match:
             # Если ID не найден в URL
@@ -29,11 +41,40 @@ class handler(BaseHTTPRequestHandler):
         data_id = match.group(1)
         
         try:
-            # Путь к файлу данных
-            file_path = path_join(STORAGE_DIR, f"{data_id}.json")
+            # Данные по ID не меняются, поэтому для ответа 304 достаточно
+            # убедиться, что они существуют и ещё не устарели
+            etag = id_etag(data_id)
+            current_time = int(time.time())
+            # Данные отдаются как сохранены, без выбора формата по Accept
+            if etag_matches(self, etag, negotiated=False):
+                expires_at = DATA_STORE.expires_at(data_id)
+                if expires_at is not None and current_time <= expires_at:
+                    send_not_modified(self, etag, immutable_cache_control(expires_at, current_time),
+                                      negotiated=False)
+                    return
+            
+            # Читаем ссылку на данные (записи, сохранённые до дедупликации,
+            # содержат данные целиком)
+            data = None
+            reference = None
+            blob = None
+            with phase("storage"):
+                record = DATA_STORE.get(data_id)
+            if record is not None:
+                with phase("parse"):
+                    data = loads(record.payload)
+                if "blob" in data:
+                    reference, data = data, None
+            if reference is not None:
+                if "object_end" in reference:
+                    # Содержимое отправляется как есть, без разбора
+                    with phase("storage"):
+                        blob = BLOB_STORE.open(reference["blob"])
+                else:
+                    data = self._resolve_reference(reference)
             
-            # Проверяем существование файла
-            if not os.path.exists(file_path):
+            # Проверяем существование данных
+            if data is None and blob is None:
                 self.send_response(404)
                 self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
@@ -43,34 +84,45 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(response.encode('utf-8'))
                 return
             
-            # Читаем данные из файла
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Проверяем срок действия данных (у ссылок он хранится в самой ссылке)
+            expires_at = current_time + DATA_TTL
+            if reference is not None:
+                expires_at = reference["expires_at"]
+            elif "meta" in data and "expires_at" in data["meta"]:
+                expires_at = data["meta"]["expires_at"]
+            if current_time > expires_at:
+                # Данные устарели
+                if blob is not None:
+                    blob.close()
+                DATA_STORE.delete(data_id)  # Удаляем устаревшие данные
+                
+                self.send_response(410)  # Gone
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({"error": "Data has expired", "success": False})
+                self.wfile.write(response.encode('utf-8'))
+                return
             
-            # Проверяем срок действия данных
-            current_time = int(time.time())
-            if "meta" in data and "expires_at" in data["meta"]:
-                if current_time > data["meta"]["expires_at"]:
-                    # Данные устарели
-                    os.remove(file_path)  # Удаляем устаревший файл
-                    
-                    self.send_response(410)  # Gone
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    
-                    response = json.dumps({"error": "Data has expired", "success": False})
-                    self.wfile.write(response.encode('utf-8'))
-                    return
+            if blob is not None:
+                with blob:
+                    self._send_spliced(reference, blob, etag, immutable_cache_control(expires_at, current_time))
+                return
+            
+            with phase("write"):
+                response = json.dumps({"data": data, "success": True})
+                body, encoding = encode_body(self, response.encode('utf-8'))
             
             # Отправляем данные клиенту
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            send_encoding_headers(self, encoding, etag)
+            self.send_header('Cache-Control', immutable_cache_control(expires_at, current_time))
             self.end_headers()
             
-            response = json.dumps({"data": data, "success": True})
-            self.wfile.write(response.encode('utf-8'))
+            self.wfile.write(body)
             
         except Exception as e:
             # Обработка ошибок
@@ -88,4 +140,70 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*') 
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
\ No newline at end of file
+        self.end_headers()
+    
+    def _send_spliced(self, reference, blob, etag, cache_control):
+        """Отправляет содержимое в обёртке {"data": ..., "success": true}, вставляя
+        meta перед закрывающей скобкой объекта; сами байты содержимого не разбираются"""
+        meta = json.dumps({"created_at": reference["created_at"], "expires_at": reference["expires_at"]})
+        prefix = b'{"data": '
+        suffix = (b'' if reference["empty"] else b', ') + f'"meta": {meta}}}, "success": true}}'.encode('utf-8')
+        content_length = reference["object_end"]
+        size = len(prefix) + content_length + len(suffix)
+        
+        encoding = response_encoding(self, size)
+        body = None
+        if encoding is not None:
+            with phase("write"):
+                body = compress(b''.join((prefix, blob.read(content_length), suffix)), encoding)
+                size = len(body)
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        send_encoding_headers(self, encoding, etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        
+        if body is not None:
+            self.wfile.write(body)
+            return
+        self.wfile.write(prefix)
+        self._send_file(blob, content_length)
+        self.wfile.write(suffix)
+    
+    def _send_file(self, blob, count):
+        """Отправляет первые count байт файла через os.sendfile, минуя память процесса
+        (если ответ пишется не в сокет или содержимое не в файле — обычной записью)"""
+        try:
+            out_fd = self.wfile.fileno()
+            in_fd = blob.fileno()
+        except (AttributeError, OSError):
+            self.wfile.write(blob.read(count))
+            return
+        offset = 0
+        with phase("write"):
+            while offset < count:
+                try:
+                    sent = os.sendfile(out_fd, in_fd, offset, count - offset)
+                except BlockingIOError:
+                    # Сокет с таймаутом неблокирующий: ждём, пока освободится буфер
+                    select.select([], [out_fd], [])
+                    continue
+                if sent == 0:
+                    raise OSError(f"Stored data is shorter than {count} bytes")
+                offset += sent
+    
+    def _resolve_reference(self, reference):
+        """Данные по ссылке из store_data с подставленными сроками хранения (None, если их нет)"""
+        with phase("storage"):
+            payload = BLOB_STORE.get(reference["blob"])
+        if payload is None:
+            return None
+        with phase("parse"):
+            data = loads(payload)
+        data.setdefault("meta", {})
+        data["meta"]["created_at"] = reference["created_at"]
+        data["meta"]["expires_at"] = reference["expires_at"]
+        return data
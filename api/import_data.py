@@ -0,0 +1,168 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import time
+
+from api._codec import dumps, loads
+from api._ingest import MAX_BODY_SIZE, READ_CHUNK_SIZE
+from api._metrics import instrument, phase
+from api._notify import notify
+from api._ratelimit import admit
+from api.characters import (CHARACTER_BATCH_LIMIT, CHARACTER_STORE, DETAIL_CACHE, build_character,
+                            character_name_error)
+from api.settings import normalize_settings, store_settings
+
+# Сколько ошибок по строкам возвращается в ответе (остальные только считаются)
+IMPORT_MAX_ERRORS = 100
+
+
+def read_lines(rfile, content_length, max_line=MAX_BODY_SIZE):
+    """Читает тело запроса построчно, не загружая его целиком.
+
+    Возвращает пары (номер строки, строка); вместо строк длиннее max_line
+    байт возвращается None, а их содержимое пропускается.
+    """
+    remaining = content_length
+    line_number = 0
+    while remaining:
+        line = rfile.readline(min(remaining, max_line + 1))
+        if not line:
+            return
+        remaining -= len(line)
+        line_number += 1
+        if len(line) > max_line and not line.endswith(b"\n"):
+            while remaining and not line.endswith(b"\n"):
+                line = rfile.readline(min(remaining, READ_CHUNK_SIZE))
+                if not line:
+                    break
+                remaining -= len(line)
+            yield line_number, None
+            continue
+        yield line_number, line
+
+
+def parse_record(line):
+    """Тип и данные записи из строки NDJSON; ValueError, если запись некорректна"""
+    record = loads(line)
+    if not isinstance(record, dict) or not isinstance(record.get("data"), dict):
+        raise ValueError("Record must be an object with a \"data\" object")
+    record_type, data = record.get("type"), record["data"]
+    if record_type not in ("character", "settings"):
+        raise ValueError(f"Unknown record type: {record_type}")
+    if record_type == "character":
+        name_error = character_name_error(data)
+        if name_error is not None:
+            raise ValueError(name_error)
+    return record_type, data
+
+
+@instrument("/api/import")
+class handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        # Загрузка данных пользователя из NDJSON (формат /api/export)
+        user_id = 'default'
+        if '?' in self.path:
+            query = self.path.split('?')[1]
+            params = dict(param.split('=') for param in query.split('&') if '=' in param)
+            user_id = params.get('user_id', 'default')
+
+        self.log_message(f"Import request for user_id: {user_id}")
+
+        # Лимит частоты проверяется до чтения тела
+        if not admit(self, user_id):
+            return
+
+        content_length = self.headers.get('Content-Length')
+        if content_length is None or not content_length.isdigit():
+            self.send_response(411)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({"error": "Content-Length is required", "success": False})
+            self.wfile.write(response.encode('utf-8'))
+            return
+
+        try:
+            created_at = int(time.time())
+            imported_characters = 0
+            imported_settings = 0
+            errors = []
+            error_count = 0
+            # Персонажи пишутся пачками, чтобы память не зависела от размера импорта
+            payloads = {}
+
+            def save_characters():
+                with phase("storage"):
+                    CHARACTER_STORE.put_many(user_id, payloads)
+                for character_name in payloads:
+                    DETAIL_CACHE.invalidate((user_id, character_name))
+                notify(user_id)
+                payloads.clear()
+
+            for line_number, line in read_lines(self.rfile, int(content_length)):
+                error = None
+                try:
+                    if line is None:
+                        raise ValueError(f"Line is longer than {MAX_BODY_SIZE} bytes")
+                    if not line.strip():
+                        continue
+                    with phase("parse"):
+                        record_type, data = parse_record(line)
+                    if record_type == "character":
+                        character_data = build_character(data, user_id, data.get('created_at', created_at))
+                        payloads[data['name']] = dumps(character_data)
+                        imported_characters += 1
+                        if len(payloads) >= CHARACTER_BATCH_LIMIT:
+                            save_characters()
+                    else:
+                        normalize_settings(data, user_id)
+                        with phase("storage"):
+                            store_settings(user_id, data)
+                        imported_settings += 1
+                except (TypeError, ValueError) as e:
+                    error = str(e)
+
+                if error is not None:
+                    error_count += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append({"line": line_number, "error": error})
+
+            if payloads:
+                save_characters()
+
+            self.log_message(f"Imported {imported_characters} characters and {imported_settings} settings "
+                             f"for user {user_id}, errors: {error_count}")
+
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({
+                "success": True,
+                "data": {
+                    "characters": imported_characters,
+                    "settings": imported_settings,
+                    "errors": errors,
+                    "error_count": error_count
+                }
+            })
+            self.wfile.write(response.encode('utf-8'))
+
+        except Exception as e:
+            self.log_error(f"Error handling import request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+
+    def do_OPTIONS(self):
+        # Настройка CORS для предварительных запросов
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
@@ -0,0 +1,59 @@
+from http.server import BaseHTTPRequestHandler
+import hmac
+import json
+import os
+
+from api._metrics import instrument, render
+
+# Токен для чтения метрик: запрос должен прислать Authorization: Bearer <токен>.
+# Без токена эндпоинт отвечает 404, если метрики явно не открыты METRICS_PUBLIC=1
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "") == "1"
+
+
+def metrics_allowed(header):
+    """Можно ли отдать метрики запросу с заголовком Authorization header"""
+    if not METRICS_TOKEN:
+        return METRICS_PUBLIC
+    scheme, _, token = (header or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode('utf-8'),
+                                                              METRICS_TOKEN.encode('utf-8'))
+
+
+@instrument("/api/metrics")
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Метрики всех процессов в текстовом формате Prometheus
+        if not metrics_allowed(self.headers.get('Authorization')):
+            # Без METRICS_TOKEN и METRICS_PUBLIC эндпоинт выключен
+            status = 401 if METRICS_TOKEN else 404
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            if status == 401:
+                self.send_header('WWW-Authenticate', 'Bearer')
+            self.end_headers()
+
+            response = json.dumps({"error": "Unauthorized" if status == 401 else "Endpoint not found",
+                                   "success": False})
+            self.wfile.write(response.encode('utf-8'))
+            return
+
+        try:
+            response = render()
+
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+
+            self.wfile.write(response.encode('utf-8'))
+
+        except Exception as e:
+            self.log_error(f"Error rendering metrics: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
@@ -0,0 +1,231 @@
+"""Самостоятельный HTTP-сервер для всех API-функций вне Vercel.
+
+Запуск: python -m api.serve [--port 8000] [--workers N] [--threads M] [--streams K]
+
+Маршруты берутся из rewrites в vercel.json, поэтому URL совпадают с теми,
+что обслуживает Vercel. Остальные пути отдаются как статические файлы
+(index.html, scripts/, styles.css).
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import argparse
+import importlib
+import json
+import os
+import posixpath
+import re
+import signal
+import socket
+import sys
+import threading
+import urllib.parse
+from os.path import join as path_join
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VERCEL_CONFIG = path_join(PROJECT_DIR, "vercel.json")
+
+# Статические файлы Mini App: отдаются только они, остальное содержимое
+# проекта (исходники, bench/, vercel.json, .git) наружу не попадает
+STATIC_FILES = ("index.html", "styles.css")
+STATIC_DIRECTORIES = ("scripts",)
+STATIC_EXTENSIONS = (".js", ".css", ".html")
+
+
+def static_path(request_path):
+    """Нормализованный путь статического файла из списка разрешённых (None, если
+    путь не из него). Путь раскодируется так же, как в SimpleHTTPRequestHandler"""
+    path = posixpath.normpath(urllib.parse.unquote(request_path.split("?", 1)[0].split("#", 1)[0]))
+    relative = path.lstrip("/") or "index.html"
+    if relative in STATIC_FILES:
+        return "/" + relative
+    directory, _, name = relative.partition("/")
+    if (directory in STATIC_DIRECTORIES and name and "/" not in name and not name.startswith(".")
+            and name.endswith(STATIC_EXTENSIONS)):
+        return "/" + relative
+    return None
+
+
+def _resolve_module(destination):
+    """Имя модуля с классом handler для пути назначения вида /api/<name>.py"""
+    file_path = destination.split("?", 1)[0].lstrip("/")
+    module_name = file_path[:-len(".py")].replace("/", ".")
+    if os.path.exists(path_join(PROJECT_DIR, file_path)):
+        return module_name
+    # /api/init обслуживается обработчиком из api/__init__.py
+    package_name, _, _ = module_name.rpartition(".")
+    if os.path.exists(path_join(PROJECT_DIR, package_name.replace(".", "/"), "__init__.py")):
+        return package_name
+    raise ValueError(f"No handler module for rewrite destination {destination}")
+
+
+def load_routes(config_path=VERCEL_CONFIG):
+    """Список (регулярное выражение, класс handler) по rewrites из vercel.json"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    routes = []
+    for rewrite in config.get("rewrites", []):
+        # Параметры вида :id соответствуют одному сегменту пути
+        pattern = re.sub(r":(\w+)", r"(?P<\1>[^/?]+)", rewrite["source"])
+        module = importlib.import_module(_resolve_module(rewrite["destination"]))
+        routes.append((re.compile(pattern + r"/?(?:\?.*)?$"), module.handler))
+    return routes
+
+
+class RoutingHandler(BaseHTTPRequestHandler):
+    """Передаёт запрос обработчику нужной функции так же, как это делает Vercel"""
+
+    routes = []
+    static_dir = None
+
+    def _dispatch(self):
+        for pattern, handler_class in self.routes:
+            if pattern.match(self.path):
+                break
+        else:
+            path = static_path(self.path) if self.static_dir else None
+            if path is not None:
+                handler_class = SimpleHTTPRequestHandler
+                self.directory = self.static_dir
+                self.path = path
+            else:
+                self.send_error(404, "Endpoint not found")
+                return
+
+        method = getattr(handler_class, f"do_{self.command}", None)
+        if method is None:
+            self.send_error(501, f"Unsupported method ({self.command})")
+            return
+
+        # Долгие запросы (SSE и long-poll /api/changes) занимают свои слоты и не
+        # мешают остальным; когда слоты кончились, клиент получает 503
+        streaming = getattr(handler_class, "streaming", False)
+        slots = self.server.stream_slots if streaming else self.server.request_slots
+        if not slots.acquire(blocking=not streaming):
+            self.send_response(503)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Retry-After', '5')
+            self.end_headers()
+
+            response = json.dumps({"error": "Too many open streams", "success": False})
+            self.wfile.write(response.encode('utf-8'))
+            return
+
+        # Запрос и заголовки уже разобраны, поэтому достаточно сменить класс
+        # экземпляра: все обработчики наследуются от BaseHTTPRequestHandler
+        try:
+            self.__class__ = handler_class
+            method(self)
+        finally:
+            slots.release()
+
+    do_GET = _dispatch
+    do_HEAD = _dispatch
+    do_POST = _dispatch
+    do_PATCH = _dispatch
+    do_OPTIONS = _dispatch
+
+
+class LimitedHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTPServer с потоком на соединение и ограничением числа одновременно
+    обрабатываемых запросов.
+
+    Обычные запросы ждут одного из threads слотов, поэтому одновременно их
+    обрабатывается не больше threads; ожидающие соединения (в том числе
+    keep-alive без запросов) слотов не занимают. Долгие запросы обработчиков
+    с атрибутом streaming берут один из streams отдельных слотов.
+    """
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, server_address, handler_class, threads, streams, reuse_port=False):
+        self.reuse_port = reuse_port
+        self.request_slots = threading.BoundedSemaphore(threads)
+        self.stream_slots = threading.BoundedSemaphore(streams)
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            # Несколько процессов слушают один порт, ядро распределяет соединения
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _serve(args, reuse_port):
+    # SIGTERM завершает сервер штатно, чтобы отработали atexit-обработчики модулей
+    # (например, сброс отложенных записей настроек)
+    signal.signal(signal.SIGTERM, _interrupt)
+    server = LimitedHTTPServer((args.host, args.port), RoutingHandler, args.threads, args.streams, reuse_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve all API functions from one port")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", os.cpu_count() or 1)),
+                        help="number of worker processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", "8")),
+                        help="requests handled at once in each worker")
+    parser.add_argument("--streams", type=int, default=int(os.environ.get("WEB_STREAMS", "64")),
+                        help="open /api/changes streams and long-polls allowed in each worker")
+    parser.add_argument("--no-static", action="store_true", help="do not serve static files")
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("SO_REUSEPORT is not available, running a single worker", file=sys.stderr)
+        workers = 1
+    # Модули функций узнают число воркеров при импорте (см. SETTINGS_WRITE_DELAY)
+    os.environ["WEB_WORKERS"] = str(workers)
+
+    RoutingHandler.routes = load_routes()
+    RoutingHandler.static_dir = None if args.no_static else PROJECT_DIR
+
+    print(f"Serving on http://{args.host}:{args.port} with {workers} worker(s) x {args.threads} thread(s), "
+          f"{args.streams} stream(s)", file=sys.stderr)
+
+    if workers == 1:
+        _serve(args, reuse_port=False)
+        return
+
+    # Маршруты и модули загружены до fork, поэтому воркеры стартуют без повторного импорта
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _serve(args, reuse_port=True)
+            sys.exit(0)
+        children.append(pid)
+
+    def _stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 from http.server import BaseHTTPRequestHandler
+import atexit
+import itertools
 import json
 import os
+import threading
 import time
-from os.path import join as path_join
 
-# Путь к директории для хранения данных
-STORAGE_DIR = "/tmp/settings_data"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+from api._cache import ResponseCache
+from api._codec import check_body_format, decode_body, dumps, encode_response, loads, send_format_headers
+from api._etag import (DEFAULT_CACHE_CONTROL, PRIVATE_CACHE_CONTROL, content_etag,
+                       etag_matches, send_not_modified)
+from api._metrics import instrument, phase, register_cache
+from api._notify import notify
+from api._ratelimit import admit
+from api._storage import record_store
+
+# Хранилище настроек пользователей
+SETTINGS_STORE = record_store("settings")
 
 # Значения по умолчанию
 DEFAULT_SETTINGS = {
@@ -21,6 +31,353 @@ DEFAULT_SETTINGS = {
     "enable_image_generation": True
 }
 
+# Служебные поля: хранятся отдельно от самих настроек и не меняются через PATCH
+SETTINGS_META_FIELDS = ("version", "updated_at", "user_id")
+
+
+class SettingsConflict(Exception):
+    """Версия настроек не совпала с ожидаемой; settings — текущие настройки"""
+
+    def __init__(self, settings):
+        super().__init__("Settings version conflict")
+        self.settings = settings
+
+
+def merged_settings(stored):
+    """Полные настройки из разобранной записи хранилища (None — настройки по умолчанию).
+
+    В хранилище лежат только отличия от DEFAULT_SETTINGS (overrides), поэтому
+    изменение значения по умолчанию доходит до всех, кто его не менял. Записи
+    старого формата содержат настройки целиком и считаются версией 0.
+    """
+    if stored is None:
+        return dict(DEFAULT_SETTINGS, version=0)
+    if "overrides" not in stored:
+        return dict(stored, version=stored.get("version", 0))
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(stored["overrides"])
+    for field in SETTINGS_META_FIELDS:
+        if field in stored:
+            settings[field] = stored[field]
+    return settings
+
+
+def stored_payload(settings, version):
+    """Запись хранилища для полных настроек: отличия от DEFAULT_SETTINGS и метаданные"""
+    stored = {field: settings[field] for field in SETTINGS_META_FIELDS if field in settings}
+    stored["version"] = version
+    stored["overrides"] = {name: value for name, value in settings.items()
+                           if name not in SETTINGS_META_FIELDS
+                           and (name not in DEFAULT_SETTINGS or DEFAULT_SETTINGS[name] != value)}
+    return dumps(stored)
+
+
+def _stored_version(payload):
+    return loads(payload).get("version", 0) if payload is not None else 0
+
+
+# Настройки по умолчанию не меняются во время работы, поэтому их ETag вычисляется один раз
+DEFAULT_SETTINGS_DATA = merged_settings(None)
+DEFAULT_SETTINGS_ETAG = content_etag(dumps(DEFAULT_SETTINGS_DATA))
+# Готовое тело ответа GET для пользователя без сохранённых настроек
+DEFAULT_SETTINGS_RESPONSE = dumps({"success": True, "data": DEFAULT_SETTINGS_DATA})
+
+# Сколько пользователей можно запросить одним POST /api/settings/bulk
+SETTINGS_BULK_LIMIT = int(os.environ.get("SETTINGS_BULK_LIMIT", "500"))
+
+# Кэш ответов GET по user_id
+SETTINGS_CACHE = ResponseCache()
+register_cache("settings", SETTINGS_CACHE)
+
+# Через сколько секунд после первого изменения настройки записываются на диск
+# (все изменения за это время сливаются в одну запись). На Vercel экземпляр
+# функции может быть заморожен сразу после ответа, поэтому там запись синхронная.
+# Отложенные настройки видны только своему процессу, поэтому при нескольких
+# воркерах api.serve (WEB_WORKERS > 1) запись всегда синхронная: иначе другие
+# воркеры отдавали бы старые настройки до записи
+SETTINGS_WRITE_DELAY = float(os.environ.get("SETTINGS_WRITE_DELAY", "0" if os.environ.get("VERCEL") else "0.25"))
+if int(os.environ.get("WEB_WORKERS", "1")) > 1:
+    SETTINGS_WRITE_DELAY = 0.0
+
+# Принятые, но ещё не записанные настройки: user_id -> (версия, payload, ETag)
+_pending = {}
+_pending_lock = threading.Lock()
+# Пользователи, для которых уже запланирована запись
+_scheduled = set()
+# Записи настроек одного пользователя идут по одной, чтобы более старое
+# значение не перезаписало новое; пользователи распределены по блокировкам
+# по хэшу user_id, поэтому медленная запись не задерживает остальных
+_write_locks = [threading.Lock() for _ in range(64)]
+_pending_versions = itertools.count(1)
+
+
+def _write_lock(user_id):
+    return _write_locks[hash(user_id) % len(_write_locks)]
+
+
+def _schedule_flush(user_id):
+    # Таймер отсчитывается от первого изменения, поэтому при долгом перетаскивании
+    # слайдера запись всё равно происходит не реже раза в SETTINGS_WRITE_DELAY
+    with _pending_lock:
+        schedule = user_id not in _scheduled
+        _scheduled.add(user_id)
+    if schedule:
+        timer = threading.Timer(SETTINGS_WRITE_DELAY, _flush_user, (user_id,))
+        timer.daemon = True
+        timer.start()
+
+
+def _flush_user(user_id):
+    with _write_lock(user_id):
+        with _pending_lock:
+            _scheduled.discard(user_id)
+            pending = _pending.get(user_id)
+        if pending is None:
+            return
+        
+        _, payload, _ = pending
+        try:
+            # Версия назначена при приёме запроса, и payload записывается как есть:
+            # ETag после записи совпадает с тем, что уже получил клиент
+            SETTINGS_STORE.update(user_id, lambda current: payload)
+            notify(user_id)
+        except Exception:
+            # Клиент уже получил подтверждение: значение остаётся в буфере
+            # и записывается повторно
+            _schedule_flush(user_id)
+            raise
+        # Значение, пришедшее во время записи, остаётся в буфере до своей записи
+        with _pending_lock:
+            if _pending.get(user_id) is pending:
+                del _pending[user_id]
+
+
+def _write_settings(user_id, settings):
+    """Сразу записывает настройки с версией на единицу больше сохранённой
+    и проставляет эту версию в settings.
+
+    Версия вычисляется под блокировкой хранилища: кэш этого процесса мог
+    отстать от записи другого воркера.
+    """
+    def next_version(current):
+        settings["version"] = _stored_version(current) + 1
+        return stored_payload(settings, settings["version"])
+
+    etag = SETTINGS_STORE.update(user_id, next_version)
+    notify(user_id)
+    return etag
+
+
+def flush_pending_settings():
+    """Немедленно записывает все отложенные настройки; ошибка записи одного
+    пользователя не мешает записать остальных и выбрасывается в конце"""
+    with _pending_lock:
+        user_ids = list(_pending)
+    error = None
+    for user_id in user_ids:
+        try:
+            _flush_user(user_id)
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+
+atexit.register(flush_pending_settings)
+
+
+def normalize_settings(settings, user_id):
+    """Проверяет настройки из запроса, приводит типы и добавляет метаданные.
+
+    Изменяет и возвращает settings; ValueError, если не хватает обязательных полей.
+    """
+    # Проверяем обязательные поля
+    required_fields = ['model_name', 'temperature', 'top_p', 'top_k']
+    for field in required_fields:
+        if field not in settings:
+            raise ValueError(f"Missing required field: {field}")
+    
+    # Нормализуем типы данных
+    if 'temperature' in settings:
+        settings['temperature'] = float(settings['temperature'])
+    if 'top_p' in settings:
+        settings['top_p'] = float(settings['top_p'])
+    if 'top_k' in settings:
+        settings['top_k'] = int(settings['top_k'])
+    if 'streaming_edit_interval' in settings:
+        settings['streaming_edit_interval'] = float(settings['streaming_edit_interval'])
+    
+    # Обрабатываем булевы значения
+    bool_fields = ['streaming_mode', 'streaming_edit_mode', 'enable_message_buttons', 'enable_image_generation']
+    for field in bool_fields:
+        if field in settings:
+            if isinstance(settings[field], str):
+                settings[field] = settings[field].lower() in ('true', 'yes', '1')
+    
+    # Добавляем метаданные
+    settings["updated_at"] = int(time.time())
+    settings["user_id"] = user_id
+    return settings
+
+
+def store_settings(user_id, settings):
+    """Сохраняет полные настройки (после normalize_settings) следующей версией.
+
+    При SETTINGS_WRITE_DELAY > 0 запись откладывается и сливается; версия
+    назначается один раз, при приёме, и записывается без изменений.
+    """
+    if SETTINGS_WRITE_DELAY <= 0:
+        with _write_lock(user_id):
+            _write_settings(user_id, settings)
+        SETTINGS_CACHE.invalidate(user_id)
+        return settings
+    
+    # Под блокировкой пользователя два одновременных запроса не получат одну версию
+    with _write_lock(user_id):
+        entry, _ = load_settings(user_id)
+        settings["version"] = entry.data.get("version", 0) + 1
+        payload = stored_payload(settings, settings["version"])
+        with _pending_lock:
+            _pending[user_id] = (("pending", next(_pending_versions)), payload, content_etag(payload))
+    SETTINGS_CACHE.invalidate(user_id)
+    _schedule_flush(user_id)
+    return settings
+
+
+def patch_settings(user_id, changes, expected=None):
+    """Меняет только переданные поля (None возвращает значение по умолчанию).
+
+    Если expected (см. parse_if_match) задано и не совпадает с текущими
+    настройками, бросает SettingsConflict. Чтение, проверка и запись идут под блокировкой хранилища,
+    поэтому одновременные PATCH из разных воркеров не теряют изменений.
+    Возвращает новые настройки и их ETag.
+    """
+    # Отложенная запись этого пользователя должна попасть в хранилище раньше изменения
+    _flush_user(user_id)
+    result = {}
+
+    def apply(current):
+        settings = merged_settings(loads(current) if current is not None else None)
+        if expected is not None and not _expected_state(expected, settings, current):
+            raise SettingsConflict(settings)
+        for name, value in changes.items():
+            if name in SETTINGS_META_FIELDS:
+                continue
+            if value is not None:
+                settings[name] = value
+            elif name in DEFAULT_SETTINGS:
+                settings[name] = DEFAULT_SETTINGS[name]
+            else:
+                settings.pop(name, None)
+        normalize_settings(settings, user_id)
+        settings["version"] += 1
+        result["settings"] = settings
+        return stored_payload(settings, settings["version"])
+
+    with _write_lock(user_id):
+        etag = SETTINGS_STORE.update(user_id, apply)
+    SETTINGS_CACHE.invalidate(user_id)
+    notify(user_id)
+    return result["settings"], etag
+
+
+def _expected_state(expected, settings, current):
+    # Версия сравнивается с data.version, ETag — с ETag записи (для любого
+    # представления: сжатые и MessagePack отличаются суффиксом в кавычках)
+    if isinstance(expected, int):
+        return settings["version"] == expected
+    etag = content_etag(current) if current is not None else DEFAULT_SETTINGS_ETAG
+    return expected == etag or expected.startswith(etag[:-1] + "-")
+
+
+def parse_if_match(header):
+    """Ожидаемое состояние настроек из заголовка If-Match: версия (int), ETag
+    из ответа GET или PATCH (str) или None, если заголовка нет или он равен *"""
+    if header is None or header.strip() == "*":
+        return None
+    value = header.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    if value.strip('"').isdigit():
+        return int(value.strip('"'))
+    if len(value) < 3 or not value.startswith('"') or not value.endswith('"'):
+        raise ValueError("If-Match must contain the settings version or ETag")
+    return value
+
+
+def settings_etag(user_id):
+    """ETag текущих настроек без чтения самих настроек (None, если неизвестен)"""
+    pending = _pending.get(user_id)
+    if pending is not None:
+        return pending[2]
+    version = SETTINGS_STORE.version(user_id)
+    if version is None:
+        return DEFAULT_SETTINGS_ETAG
+    entry = SETTINGS_CACHE.peek(user_id, version)
+    if entry is not None:
+        return entry.etag
+    return SETTINGS_STORE.etag(user_id, version)
+
+
+def load_settings(user_id):
+    """Возвращает запись кэша с настройками пользователя и статус кэша (HIT/MISS)"""
+    # Ещё не записанные настройки новее сохранённых
+    pending = _pending.get(user_id)
+    if pending is not None:
+        version, payload, etag = pending
+        entry = SETTINGS_CACHE.get(user_id, version)
+        if entry is not None:
+            return entry, 'HIT'
+        settings = merged_settings(loads(payload))
+        response = dumps({"success": True, "data": settings})
+        return SETTINGS_CACHE.put(user_id, version, settings, response, etag), 'MISS'
+    
+    # Проверяем, не изменились ли настройки с момента кэширования ответа
+    version = SETTINGS_STORE.version(user_id)
+    entry = SETTINGS_CACHE.get(user_id, version)
+    if entry is not None:
+        return entry, 'HIT'
+    
+    with phase("storage"):
+        record = SETTINGS_STORE.get(user_id)
+    if record is None:
+        # Используем настройки по умолчанию
+        return SETTINGS_CACHE.put(user_id, None, DEFAULT_SETTINGS_DATA, DEFAULT_SETTINGS_RESPONSE,
+                                  DEFAULT_SETTINGS_ETAG), 'MISS'
+    
+    with phase("parse"):
+        settings = merged_settings(loads(record.payload))
+    response = dumps({"success": True, "data": settings})
+    return SETTINGS_CACHE.put(user_id, record.version, settings, response, record.etag), 'MISS'
+
+def load_many_settings(user_ids):
+    """Настройки нескольких пользователей {user_id: настройки} в порядке user_ids.
+
+    Сохранённые настройки читаются из хранилища одним get_many; уже разобранные
+    берутся из SETTINGS_CACHE по версии записи, не записанные — из буфера.
+    """
+    found = {}
+    missing = []
+    for user_id in user_ids:
+        if user_id in _pending:
+            found[user_id] = load_settings(user_id)[0].data
+        else:
+            missing.append(user_id)
+    
+    with phase("storage"):
+        records = SETTINGS_STORE.get_many(missing)
+    with phase("parse"):
+        for user_id in missing:
+            record = records.get(user_id)
+            if record is None:
+                found[user_id] = DEFAULT_SETTINGS_DATA
+                continue
+            entry = SETTINGS_CACHE.peek(user_id, record.version)
+            found[user_id] = entry.data if entry is not None else merged_settings(loads(record.payload))
+    return {user_id: found[user_id] for user_id in user_ids}
+
+
+@instrument("/api/settings")
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # Получение настроек пользователя
@@ -33,28 +390,30 @@ class handler(BaseHTTPRequestHandler):
         self.log_message(f"GET request for settings with user_id: {user_id}")
         
         try:
-            # Путь к файлу настроек
-            file_path = path_join(STORAGE_DIR, f"settings_{user_id}.json")
-            
-            # Проверяем существование файла
-            if os.path.exists(file_path):
-                # Читаем настройки из файла
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                self.log_message(f"Loaded settings from file for user {user_id}")
-            else:
-                # Используем настройки по умолчанию
-                settings = DEFAULT_SETTINGS
-                self.log_message(f"Using default settings for user {user_id}")
+            # Если у клиента уже есть актуальная версия, не читаем настройки
+            etag = settings_etag(user_id)
+            if etag_matches(self, etag):
+                cache_control = DEFAULT_CACHE_CONTROL if etag == DEFAULT_SETTINGS_ETAG else PRIVATE_CACHE_CONTROL
+                send_not_modified(self, etag, cache_control)
+                return
+            
+            entry, cache_status = load_settings(user_id)
+            
+            self.log_message(f"Settings cache {cache_status} for user {user_id}, "
+                             f"hits: {SETTINGS_CACHE.hits}, misses: {SETTINGS_CACHE.misses}")
+            
+            body, content_type, encoding = encode_response(self, {"success": True, "data": entry.data},
+                                                           entry.body, entry.variants)
             
             # Отправляем настройки клиенту
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Cache', cache_status)
+            send_format_headers(self, content_type, encoding, entry.etag)
+            self.send_header('Cache-Control', DEFAULT_CACHE_CONTROL if entry.version is None else PRIVATE_CACHE_CONTROL)
             self.end_headers()
             
-            response = json.dumps({"success": True, "data": settings})
-            self.wfile.write(response.encode('utf-8'))
+            self.wfile.write(body)
             
         except Exception as e:
             self.log_error(f"Error handling GET request: {str(e)}")
@@ -67,9 +426,9 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(response.encode('utf-8'))
     
     def do_POST(self):
-        # Сохранение настроек пользователя
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
+        if self.path.split('?')[0] == '/api/settings/bulk':
+            self._handle_bulk_request()
+            return
         
         user_id = 'default'
         if '?' in self.path:
@@ -77,43 +436,28 @@ class handler(BaseHTTPRequestHandler):
             params = dict(param.split('=') for param in query.split('&') if '=' in param)
             user_id = params.get('user_id', 'default')
         
+        # Лимит частоты проверяется до чтения тела
+        if not admit(self, user_id):
+            return
+        if not check_body_format(self):
+            return
+        
+        # Сохранение настроек пользователя
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        
         self.log_message(f"POST request for settings with user_id: {user_id}")
         
         try:
-            # Парсим JSON
-            settings = json.loads(post_data.decode('utf-8'))
-            
-            # Проверяем обязательные поля
-            required_fields = ['model_name', 'temperature', 'top_p', 'top_k']
-            for field in required_fields:
-                if field not in settings:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Нормализуем типы данных
-            if 'temperature' in settings:
-                settings['temperature'] = float(settings['temperature'])
-            if 'top_p' in settings:
-                settings['top_p'] = float(settings['top_p'])
-            if 'top_k' in settings:
-                settings['top_k'] = int(settings['top_k'])
-            if 'streaming_edit_interval' in settings:
-                settings['streaming_edit_interval'] = float(settings['streaming_edit_interval'])
-            
-            # Обрабатываем булевы значения
-            bool_fields = ['streaming_mode', 'streaming_edit_mode', 'enable_message_buttons', 'enable_image_generation']
-            for field in bool_fields:
-                if field in settings:
-                    if isinstance(settings[field], str):
-                        settings[field] = settings[field].lower() in ('true', 'yes', '1')
-            
-            # Добавляем метаданные
-            settings["updated_at"] = int(time.time())
-            settings["user_id"] = user_id
+            # Разбираем тело (JSON или MessagePack)
+            with phase("parse"):
+                settings = decode_body(self, post_data)
+            
+            normalize_settings(settings, user_id)
             
             # Сохраняем настройки во временном хранилище
-            file_path = path_join(STORAGE_DIR, f"settings_{user_id}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False)
+            with phase("storage"):
+                store_settings(user_id, settings)
             
             self.log_message(f"Settings saved for user {user_id}")
             
@@ -136,10 +480,136 @@ class handler(BaseHTTPRequestHandler):
             response = json.dumps({"error": str(e), "success": False})
             self.wfile.write(response.encode('utf-8'))
     
+    def _handle_bulk_request(self):
+        # Настройки сразу нескольких пользователей (для бота): {"user_ids": [...], "fields": [...]}
+        if not check_body_format(self):
+            return
+        content_length = int(self.headers.get('Content-Length', 0))
+        post_data = self.rfile.read(content_length)
+        
+        try:
+            try:
+                with phase("parse"):
+                    request = decode_body(self, post_data)
+                user_ids = request.get("user_ids") if isinstance(request, dict) else None
+                fields = request.get("fields") if isinstance(request, dict) else None
+                if (not isinstance(user_ids, list) or not 0 < len(user_ids) <= SETTINGS_BULK_LIMIT
+                        or not all(isinstance(user_id, str) for user_id in user_ids)):
+                    raise ValueError(f"\"user_ids\" must be a list of 1 to {SETTINGS_BULK_LIMIT} strings")
+                if fields is not None and (not isinstance(fields, list)
+                                           or not all(isinstance(field, str) for field in fields)):
+                    raise ValueError("\"fields\" must be a list of strings")
+            except ValueError as e:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({"error": str(e), "success": False})
+                self.wfile.write(response.encode('utf-8'))
+                return
+            
+            self.log_message(f"Bulk settings request for {len(user_ids)} users")
+            
+            settings = load_many_settings(user_ids)
+            if fields is not None:
+                # Бот может запросить только нужные ему поля, чтобы не гонять остальные
+                settings = {user_id: {field: data[field] for field in fields if field in data}
+                            for user_id, data in settings.items()}
+            
+            body, content_type, encoding = encode_response(self, {"success": True, "data": settings})
+            
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding)
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            
+            self.wfile.write(body)
+            
+        except Exception as e:
+            self.log_error(f"Error handling bulk settings request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+    
+    def do_PATCH(self):
+        # Частичное изменение настроек: в теле только изменённые поля,
+        # в If-Match — версия, от которой клиент их менял
+        user_id = 'default'
+        if '?' in self.path:
+            query = self.path.split('?')[1]
+            params = dict(param.split('=') for param in query.split('&') if '=' in param)
+            user_id = params.get('user_id', 'default')
+        
+        # Лимит частоты проверяется до чтения тела
+        if not admit(self, user_id):
+            return
+        if not check_body_format(self):
+            return
+        content_length = int(self.headers.get('Content-Length', 0))
+        patch_data = self.rfile.read(content_length)
+        
+        self.log_message(f"PATCH request for settings with user_id: {user_id}")
+        
+        try:
+            try:
+                expected = parse_if_match(self.headers.get('If-Match'))
+                with phase("parse"):
+                    changes = decode_body(self, patch_data)
+                if not isinstance(changes, dict):
+                    raise ValueError("Request body must be an object")
+                with phase("storage"):
+                    settings, etag = patch_settings(user_id, changes, expected)
+            except SettingsConflict as e:
+                # Клиент менял устаревшую версию: отдаём текущую, чтобы он мог повторить
+                self.send_response(409)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({"error": str(e), "success": False, "data": e.settings})
+                self.wfile.write(response.encode('utf-8'))
+                return
+            except (TypeError, ValueError) as e:
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                
+                response = json.dumps({"error": str(e), "success": False})
+                self.wfile.write(response.encode('utf-8'))
+                return
+            
+            self.log_message(f"Settings patched for user {user_id}, version {settings['version']}")
+            
+            body, content_type, encoding = encode_response(self, {"success": True, "data": settings})
+            
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            send_format_headers(self, content_type, encoding, etag)
+            self.end_headers()
+            
+            self.wfile.write(body)
+            
+        except Exception as e:
+            self.log_error(f"Error handling PATCH request: {str(e)}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+    
     def do_OPTIONS(self):
         # Настройка CORS для предварительных запросов
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PATCH, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-Match')
         self.end_headers()
\ No newline at end of file
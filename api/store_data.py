@@ -1,59 +1,94 @@
 from http.server import BaseHTTPRequestHandler
+import hashlib
 import json
-import uuid
-import os
 import time
-from os.path import join as path_join
 
-# Путь к директории для хранения данных
-STORAGE_DIR = "/tmp/data_storage"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+from api._ingest import RequestBodyError, staged_json_object
+from api._metrics import instrument, phase
+from api._ratelimit import admit
+from api._storage import blob_store, new_id, record_store
 
 # Время жизни данных (в секундах)
 DATA_TTL = 3600  # 1 час
 
+# Хранилища, общие с get_data.py: ID -> ссылка на содержимое со своим сроком,
+# и само содержимое, сохранённое один раз под своим хэшем
+DATA_STORE = record_store("data_storage", ttl=DATA_TTL)
+BLOB_STORE = blob_store()
+
+# Idempotency-Key -> ранее выданный ID
+IDEMPOTENCY_STORE = record_store("idempotency", ttl=DATA_TTL)
+
+@instrument("/api/store_data")
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
-        # Получаем длину тела запроса
-        content_length = int(self.headers['Content-Length'])
-        
-        # Читаем тело запроса
-        post_data = self.rfile.read(content_length)
+        # Лимит частоты проверяется до чтения тела; user_id в запросе необязателен
+        user_id = None
+        if '?' in self.path:
+            query = self.path.split('?')[1]
+            params = dict(param.split('=', 1) for param in query.split('&') if '=' in param)
+            user_id = params.get('user_id')
+        if not admit(self, user_id):
+            return
         
         try:
-            # Парсим JSON
-            data = json.loads(post_data.decode('utf-8'))
-            
-            # Проверяем наличие meta-информации
-            if "meta" not in data:
-                data["meta"] = {}
-            
-            # Добавляем или обновляем время создания и истечения
-            data["meta"]["created_at"] = int(time.time())
-            data["meta"]["expires_at"] = int(time.time()) + DATA_TTL
+            # Повтор запроса с тем же Idempotency-Key получает уже выданный ID
+            idempotency_key = self.headers.get('Idempotency-Key')
+            data_id = None
+            if idempotency_key:
+                key_hash = hashlib.sha256(idempotency_key.encode('utf-8')).hexdigest()
+                data_id = self._find_idempotent_id(key_hash)
             
-            # Генерируем уникальный ID
-            data_id = str(uuid.uuid4())
-            
-            # Очистка старых данных перед сохранением
-            self._cleanup_old_data()
-            
-            # Сохраняем данные во временном хранилище
-            file_path = path_join(STORAGE_DIR, f"{data_id}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False)
+            if data_id is None:
+                # Время создания и истечения хранятся в ссылке на содержимое,
+                # поэтому одинаковые данные сохраняются один раз
+                created_at = int(time.time())
+                expires_at = created_at + DATA_TTL
+                
+                # Генерируем уникальный ID
+                data_id = new_id()
+                
+                # Очистка старых данных перед сохранением
+                self._cleanup_old_data()
+                
+                # Тело запроса пишется во временный файл кусками и сохраняется
+                # как есть, без повторной сериализации. В meta get_data.py
+                # добавляет сроки хранения, поэтому это должен быть объект
+                with staged_json_object(self, BLOB_STORE, watch_keys=("meta",), object_keys=("meta",)) as body:
+                    with phase("storage"):
+                        blob_hash = BLOB_STORE.put_file(body.file, body.sha256, expires_at)
+                reference = {"blob": blob_hash, "created_at": created_at, "expires_at": expires_at}
+                if "meta" not in body.seen_keys:
+                    # get_data.py вставит meta перед закрывающей скобкой,
+                    # не разбирая содержимое
+                    reference["object_end"] = body.object_end
+                    reference["empty"] = body.empty
+                with phase("storage"):
+                    DATA_STORE.put(data_id, json.dumps(reference).encode('utf-8'), expires_at)
+                    if idempotency_key:
+                        IDEMPOTENCY_STORE.put(key_hash, data_id.encode('utf-8'), expires_at)
             
             # Отправляем ID назад клиенту
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key')
             self.end_headers()
             
             response = json.dumps({"id": data_id, "success": True})
             self.wfile.write(response.encode('utf-8'))
             
+        except RequestBodyError as e:
+            # Тело запроса не принято (слишком большое или не JSON-объект)
+            self.send_response(e.status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            
+            response = json.dumps({"error": str(e), "success": False})
+            self.wfile.write(response.encode('utf-8'))
+            
         except Exception as e:
             # Обработка ошибок
             self.send_response(500)
@@ -69,42 +104,28 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key')
         self.end_headers()
     
+    def _find_idempotent_id(self, key_hash):
+        """ID, выданный ранее для этого ключа, если данные ещё не устарели"""
+        with phase("storage"):
+            record = IDEMPOTENCY_STORE.get(key_hash)
+            if record is None:
+                return None
+            data_id = record.payload.decode('utf-8')
+            expires_at = DATA_STORE.expires_at(data_id)
+        if expires_at is None or expires_at < time.time():
+            return None
+        return data_id
+    
     def _cleanup_old_data(self):
-        """Очистка устаревших данных"""
+        """Инкрементальная очистка устаревших данных по индексу"""
         try:
-            current_time = int(time.time())
-            for filename in os.listdir(STORAGE_DIR):
-                if not filename.endswith('.json'):
-                    continue
-                    
-                file_path = path_join(STORAGE_DIR, filename)
-                
-                try:
-                    # Проверяем время создания файла
-                    file_stat = os.stat(file_path)
-                    file_age = current_time - file_stat.st_mtime
-                    
-                    # Если файл старше TTL, удаляем его
-                    if file_age > DATA_TTL:
-                        os.remove(file_path)
-                        continue
-                    
-                    # Проверяем метаданные
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        try:
-                            data = json.load(f)
-                            if "meta" in data and "expires_at" in data["meta"]:
-                                if current_time > data["meta"]["expires_at"]:
-                                    os.remove(file_path)
-                        except json.JSONDecodeError:
-                            # Если файл содержит неверный JSON, удаляем его
-                            os.remove(file_path)
-                except Exception:
-                    # Если произошла ошибка при обработке файла, просто продолжаем
-                    continue
+            with phase("cleanup"):
+                DATA_STORE.sweep()
+                BLOB_STORE.sweep()
+                IDEMPOTENCY_STORE.sweep()
         except Exception:
             # Игнорируем ошибки при очистке, чтобы не блокировать основной функционал
-            pass
\ No newline at end of file
+            pass
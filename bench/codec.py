@@ -0,0 +1,99 @@
+"""Стоимость кодирования и разбора типичных тел запросов и ответов разными кодеками.
+
+Запуск:
+    python -m bench.codec --repeat 2000 --users 200
+
+Сравниваются стандартный json (как в обработчиках до api._codec), orjson
+и MessagePack; кодеки, пакеты которых не установлены, пропускаются. Для
+каждого тела (ответ GET /api/settings, список персонажей, ответ
+POST /api/settings/bulk на --users пользователей) сохраняются размер
+и медианное время одного кодирования и одного разбора в микросекундах.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from bench.harness import write_results
+
+
+def _codecs():
+    codecs = {
+        "json": (lambda obj: json.dumps(obj).encode('utf-8'),
+                 lambda data: json.loads(data.decode('utf-8')))
+    }
+    try:
+        import orjson
+        codecs["orjson"] = (orjson.dumps, orjson.loads)
+    except ImportError:
+        pass
+    try:
+        import msgpack
+        codecs["msgpack"] = (msgpack.packb, msgpack.unpackb)
+    except ImportError:
+        pass
+    return codecs
+
+
+def _payloads(users):
+    from api.characters import DEFAULT_CHARACTERS
+    from api.settings import DEFAULT_SETTINGS_DATA
+
+    settings = dict(DEFAULT_SETTINGS_DATA, user_id="123456789", updated_at=int(time.time()), version=12)
+    characters = [{"name": f"Персонаж {index}"} for index in range(100)]
+    return {
+        "settings": {"success": True, "data": settings},
+        "character_list": {"success": True, "data": {"character_names": characters}},
+        "character": {"success": True, "data": DEFAULT_CHARACTERS[2]},
+        "settings_bulk": {"success": True, "data": {str(user): settings for user in range(users)}}
+    }
+
+
+def _median_us(function, argument, repeat):
+    # Время берётся по пачкам вызовов, чтобы не мерить сам таймер
+    batch = 50
+    samples = []
+    for _ in range(max(1, repeat // batch)):
+        started = time.perf_counter()
+        for _ in range(batch):
+            function(argument)
+        samples.append((time.perf_counter() - started) / batch)
+    return round(statistics.median(samples) * 1e6, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare encode/decode cost of the JSON and MessagePack codecs")
+    parser.add_argument("--repeat", type=int, default=2000, help="calls per measurement")
+    parser.add_argument("--users", type=int, default=200, help="users in the bulk settings body")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    codecs = _codecs()
+    results = []
+    for body_name, payload in _payloads(args.users).items():
+        for codec_name, (encode, decode) in codecs.items():
+            encoded = encode(payload)
+            results.append({
+                "body": body_name,
+                "codec": codec_name,
+                "bytes": len(encoded),
+                "encode_us": _median_us(encode, payload, args.repeat),
+                "decode_us": _median_us(decode, encoded, args.repeat)
+            })
+
+    columns = ("body", "codec", "bytes", "encode_us", "decode_us")
+    print("  ".join(column.ljust(14) for column in columns), file=sys.stderr)
+    for result in results:
+        print("  ".join(str(result[column]).ljust(14) for column in columns), file=sys.stderr)
+    write_results(results, args.output, {
+        "repeat": args.repeat,
+        "users": args.users,
+        "codecs": list(codecs),
+        "python": sys.version.split()[0],
+        "timestamp": int(time.time())
+    })
+
+
+if __name__ == "__main__":
+    main()
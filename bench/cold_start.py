@@ -0,0 +1,113 @@
+"""Холодный старт каждой функции: время от импорта модуля до первого ответа.
+
+Запуск:
+    python -m bench.cold_start --runs 5 --budget 50
+
+Каждая функция (модуль из FIRST_REQUESTS) импортируется в отдельном
+процессе интерпретатора с пустым STORAGE_ROOT, после чего выполняется её
+первый запрос, как после холодного старта на Vercel. Время запуска самого
+интерпретатора и импорта http.server (его загружает среда выполнения Vercel
+до функции) не учитывается. Для каждой функции берётся медиана по --runs
+запускам; с --budget (мс) скрипт завершается с кодом 1, если импорт и первый
+ответ какой-либо функции вместе заняли больше.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.harness import write_results
+
+# Первый запрос каждой функции: (метод, путь, тело)
+FIRST_REQUESTS = {
+    "api": ("GET", "/api/init/00000000-0000-0000-0000-000000000000", None),
+    "api.settings": ("GET", "/api/settings?user_id=cold", None),
+    "api.bootstrap": ("GET", "/api/bootstrap?user_id=cold", None),
+    "api.characters": ("GET", "/api/characters?user_id=cold", None),
+    "api.get_character": ("GET", "/api/get_character?name=AI_Assistant", None),
+    "api.get_data": ("GET", "/api/get_data/00000000-0000-0000-0000-000000000000", None),
+    "api.store_data": ("POST", "/api/store_data", '{"message": "hello"}'),
+    "api.export": ("GET", "/api/export?user_id=cold", None),
+    "api.import_data": ("POST", "/api/import?user_id=cold", '{"type": "character", "data": {"name": "Cold"}}\n'),
+    "api.changes": ("GET", "/api/changes?user_id=cold&wait=0", None),
+    "api.metrics": ("GET", "/api/metrics", None),
+}
+
+# Выполняется в дочернем процессе: до импорта функции загружается только то,
+# что уже загружено средой выполнения
+_CHILD = """
+import http.server, importlib, sys, time
+started = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+from bench.harness import call
+method, path, body = sys.argv[2], sys.argv[3], sys.argv[4].encode("utf-8")
+request_started = time.perf_counter()
+status, _, _ = call(module.handler, method, path, body)
+finished = time.perf_counter()
+print(f"{(imported - started) * 1000} {(finished - request_started) * 1000} {status}")
+"""
+
+
+def measure(module_name, method, path, body):
+    """(время импорта, время первого запроса в мс, код ответа) в свежем процессе"""
+    with tempfile.TemporaryDirectory(prefix="lv_cold_") as storage_root:
+        env = dict(os.environ, STORAGE_ROOT=storage_root, PYTHONDONTWRITEBYTECODE="1", METRICS_PUBLIC="1")
+        env.pop("SQLITE_PATH", None)
+        output = subprocess.run([sys.executable, "-c", _CHILD, module_name, method, path, body or ""],
+                                env=env, capture_output=True, text=True, check=True).stdout
+    import_ms, request_ms, status = output.split()
+    return float(import_ms), float(request_ms), int(status)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import-to-first-response time of every API function")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per function (median is reported)")
+    parser.add_argument("--modules", default="", help="comma-separated module names (default: all functions)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="fail if import + first response of any function exceeds this many ms")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.modules.split(",") if name.strip()] or list(FIRST_REQUESTS)
+
+    results = []
+    for module_name in selected:
+        method, path, body = FIRST_REQUESTS[module_name]
+        runs = [measure(module_name, method, path, body) for _ in range(args.runs)]
+        import_ms = statistics.median(run[0] for run in runs)
+        request_ms = statistics.median(run[1] for run in runs)
+        results.append({
+            "endpoint": f"{method} {path.split('?')[0]}",
+            "module": module_name,
+            "import_ms": round(import_ms, 3),
+            "first_response_ms": round(request_ms, 3),
+            "cold_start_ms": round(import_ms + request_ms, 3),
+            "statuses": sorted({str(run[2]) for run in runs})
+        })
+
+    columns = ("module", "import_ms", "first_response_ms", "cold_start_ms")
+    print("  ".join(column.ljust(18) for column in columns), file=sys.stderr)
+    for result in results:
+        print("  ".join(str(result[column]).ljust(18) for column in columns), file=sys.stderr)
+    write_results(results, args.output, {
+        "runs": args.runs,
+        "budget_ms": args.budget,
+        "python": sys.version.split()[0],
+        "timestamp": int(time.time())
+    })
+
+    if args.budget is not None:
+        over = [result for result in results if result["cold_start_ms"] > args.budget]
+        for result in over:
+            print(f"{result['module']}: cold start {result['cold_start_ms']} ms is over the budget "
+                  f"of {args.budget} ms", file=sys.stderr)
+        if over:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Вызов обработчиков из api/*.py внутри процесса и сбор статистики задержек."""
+from http.client import parse_headers
+import io
+import json
+import math
+import time
+
+
+def _silent_log(*args, **kwargs):
+    pass
+
+
+def call(handler_class, method, path, body=b"", headers=None, client_ip="127.0.0.1"):
+    """Выполняет один запрос к классу handler без сокета.
+
+    Возвращает (код ответа, заголовки ответа, тело ответа).
+    """
+    header_lines = dict(headers or {})
+    if body:
+        header_lines.setdefault("Content-Type", "application/json")
+        header_lines["Content-Length"] = str(len(body))
+    raw_headers = "".join(f"{name}: {value}\r\n" for name, value in header_lines.items())
+
+    request = handler_class.__new__(handler_class)
+    request.rfile = io.BytesIO(body)
+    request.wfile = io.BytesIO()
+    request.headers = parse_headers(io.BytesIO(raw_headers.encode("latin-1") + b"\r\n"))
+    request.command = method
+    request.path = path
+    request.request_version = "HTTP/1.1"
+    request.requestline = f"{method} {path} HTTP/1.1"
+    request.client_address = (client_ip, 0)
+    request.server = None
+    request.close_connection = True
+    request.log_message = _silent_log
+
+    getattr(request, f"do_{method}")()
+
+    raw = request.wfile.getvalue()
+    head, _, response_body = raw.partition(b"\r\n\r\n")
+    status_line, _, header_block = head.partition(b"\r\n")
+    status = int(status_line.split(b" ", 2)[1])
+    response_headers = parse_headers(io.BytesIO(header_block + b"\r\n\r\n"))
+    return status, response_headers, response_body
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Собирает задержки и коды ответов одной серии запросов"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.started = None
+        self.elapsed = 0.0
+
+    def run(self, requests):
+        """requests — итерируемое вызовов без аргументов, возвращающих код ответа"""
+        self.started = time.perf_counter()
+        for request in requests:
+            start = time.perf_counter()
+            status = request()
+            self.latencies.append(time.perf_counter() - start)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def summary(self, **labels):
+        latencies = sorted(self.latencies)
+        result = dict(labels)
+        result.update({
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "statuses": {str(code): count for code, count in sorted(self.statuses.items())}
+        })
+        return result
+
+
+def write_results(results, output, meta):
+    """Сохраняет результаты в JSON, пригодном для сравнения между запусками"""
+    document = {"meta": meta, "results": results}
+    if output == "-":
+        print(json.dumps(document, ensure_ascii=False, indent=2))
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+
+
+def format_table(results):
+    columns = ["endpoint", "size", "requests", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    rows = [[str(result.get(column, "")) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) if rows else len(column)
+              for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    for row in rows:
+        lines.append("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+    return "\n".join(lines)
@@ -0,0 +1,115 @@
+"""Задержки обычных пользователей, пока один клиент засыпает сервер записями.
+
+Запуск:
+    python -m bench.noisy_neighbor --quiet-users 8 --noisy-rps 1000 --duration 5
+
+Обычные пользователи (каждый со своего IP) сохраняют персонажа раз в
+--interval-ms, укладываясь в лимит. Шумный клиент присылает --noisy-rps
+запросов в секунду независимо от ответов, как клиент, который не смотрит
+на Retry-After. Прогон повторяется без лимитов частоты и с лимитами
+(RATE_LIMIT_*), для обычных пользователей сравниваются p50/p99.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench.harness import Recorder, call, format_table, write_results
+
+
+def _run(modules, limited, quiet_users, noisy_threads, noisy_rps, duration, interval):
+    ratelimit, characters = modules
+    ratelimit.RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", "50")) if limited else 0.0
+    ratelimit.RATE_LIMIT_USER_RATE = float(os.environ.get("RATE_LIMIT_USER_RATE", "5")) if limited else 0.0
+    handler = characters.handler
+    deadline = time.perf_counter() + duration
+
+    def save(user_id, client_ip, index):
+        body = json.dumps({"name": f"Character {index % 50}", "description": "x" * 200,
+                           "greeting": "Привет!"}).encode("utf-8")
+        status, _, _ = call(handler, "POST", f"/api/characters?user_id={user_id}", body, client_ip=client_ip)
+        return status
+
+    def quiet(index, recorder):
+        def requests():
+            step = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                yield lambda step=step: save(f"quiet{index}", f"10.0.1.{index}", step)
+                step += 1
+                time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+        recorder.run(requests())
+
+    def noisy(recorder):
+        # Запросы отправляются по расписанию: отклонённый запрос не ускоряет следующий
+        period = noisy_threads / noisy_rps
+        def requests():
+            step = 0
+            scheduled = time.perf_counter()
+            while time.perf_counter() < deadline:
+                yield lambda step=step: save("noisy", "10.0.2.1", step)
+                step += 1
+                scheduled += period
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+        recorder.run(requests())
+
+    quiet_recorders = [Recorder() for _ in range(quiet_users)]
+    noisy_recorders = [Recorder() for _ in range(noisy_threads)]
+    threads = [threading.Thread(target=quiet, args=(index, recorder)) for index, recorder in enumerate(quiet_recorders)]
+    threads += [threading.Thread(target=noisy, args=(recorder,)) for recorder in noisy_recorders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = []
+    for label, recorders in (("quiet", quiet_recorders), ("noisy", noisy_recorders)):
+        merged = Recorder()
+        merged.elapsed = duration
+        for recorder in recorders:
+            merged.latencies.extend(recorder.latencies)
+            for status, count in recorder.statuses.items():
+                merged.statuses[status] = merged.statuses.get(status, 0) + count
+        results.append(merged.summary(endpoint=f"POST /api/characters ({label})",
+                                      size="limited" if limited else "unlimited"))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure quiet tenants' latency while one client floods writes")
+    parser.add_argument("--quiet-users", type=int, default=8, help="well-behaved users, one request per interval each")
+    parser.add_argument("--noisy-threads", type=int, default=4, help="threads sending the noisy client's requests")
+    parser.add_argument("--noisy-rps", type=float, default=1000.0, help="requests per second from the noisy client")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--interval-ms", type=float, default=250.0, help="time between a quiet user's requests")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    # Путь к хранилищам должен быть задан до импорта обработчиков
+    storage_root = tempfile.mkdtemp(prefix="lv_bench_")
+    os.environ["STORAGE_ROOT"] = storage_root
+    from api import _ratelimit, characters
+    modules = (_ratelimit, characters)
+
+    results = []
+    for limited in (False, True):
+        results.extend(_run(modules, limited, args.quiet_users, args.noisy_threads, args.noisy_rps,
+                            args.duration, args.interval_ms / 1000))
+
+    print(format_table(results), file=sys.stderr)
+    write_results(results, args.output, {
+        "quiet_users": args.quiet_users,
+        "noisy_threads": args.noisy_threads,
+        "noisy_rps": args.noisy_rps,
+        "duration_s": args.duration,
+        "interval_ms": args.interval_ms,
+        "storage_root": storage_root,
+        "timestamp": int(time.time())
+    })
+
+
+if __name__ == "__main__":
+    main()
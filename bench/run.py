@@ -0,0 +1,245 @@
+"""Нагрузочный бенчмарк всех API-функций при разном объёме хранилищ.
+
+Запуск:
+    python -m bench.run --sizes 1000,100000,1000000 --requests 2000 --output bench.json
+
+Хранилища создаются во временной директории (STORAGE_ROOT) и последовательно
+дозаполняются до каждого размера. Для каждой точки (эндпоинт, размер)
+сохраняются пропускная способность и p50/p95/p99 задержки.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import quote
+
+from bench.harness import Recorder, call, format_table, write_results
+
+# Сколько персонажей приходится на одного пользователя при заполнении
+CHARACTERS_PER_USER = 10
+
+# Доля записей init_data/data_storage, срок которых уже истёк
+EXPIRED_FRACTION = 0.1
+
+# Сколько ID запоминается для GET-запросов к уже заполненным хранилищам
+SAMPLE_SIZE = 10000
+
+
+class Stores:
+    """Заполнение хранилищ в том же формате, в котором их пишут обработчики"""
+
+    def __init__(self, modules, rng):
+        self.modules = modules
+        self.rng = rng
+        self.size = 0
+        self.init_ids = []
+        self.data_ids = []
+        self.users = []
+        self.global_characters = []
+
+    def _remember(self, sample, value):
+        # Резервуарная выборка: память не растёт вместе с размером хранилища
+        if len(sample) < SAMPLE_SIZE:
+            sample.append(value)
+        else:
+            position = self.rng.randrange(self.size + 1)
+            if position < SAMPLE_SIZE:
+                sample[position] = value
+
+    def grow(self, target):
+        init_module = self.modules["init"]
+        store_module = self.modules["store_data"]
+        settings_module = self.modules["settings"]
+        characters_module = self.modules["characters"]
+        get_character_module = self.modules["get_character"]
+
+        now = int(time.time())
+        for index in range(self.size, target):
+            expired = self.rng.random() < EXPIRED_FRACTION
+            expires_at = now - 60 if expired else now + init_module.DATA_TTL
+
+            session_id = str(uuid.uuid4())
+            session = {"user_id": str(index), "created_at": expires_at - init_module.DATA_TTL,
+                       "expires_at": expires_at}
+            init_module.SESSION_STORE.put(session_id, json.dumps(session, ensure_ascii=False).encode("utf-8"),
+                                          expires_at)
+
+            data_id = str(uuid.uuid4())
+            data = {"payload": f"{index} " + "x" * 200}
+            payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            blob_hash = store_module.BLOB_STORE.put(payload, expires_at)
+            reference = {"blob": blob_hash, "created_at": expires_at - store_module.DATA_TTL, "expires_at": expires_at,
+                         "object_end": len(payload) - 1, "empty": False}
+            store_module.DATA_STORE.put(data_id, json.dumps(reference).encode("utf-8"), expires_at)
+
+            if not expired:
+                self._remember(self.init_ids, session_id)
+                self._remember(self.data_ids, data_id)
+
+            user_id = f"user{index // CHARACTERS_PER_USER}"
+            character_name = f"Персонаж {index}"
+            character = {"name": character_name, "description": "Описание " * 20,
+                         "greeting": "Привет!", "user_id": user_id, "created_at": now}
+            characters_module.CHARACTER_STORE.put(user_id, character_name,
+                                                  json.dumps(character, ensure_ascii=False).encode("utf-8"))
+
+            if index % CHARACTERS_PER_USER == CHARACTERS_PER_USER - 1 or index == target - 1:
+                settings = dict(settings_module.DEFAULT_SETTINGS, user_id=user_id, updated_at=now,
+                                character={"name": character_name})
+                settings_module.SETTINGS_STORE.put(user_id, json.dumps(settings, ensure_ascii=False).encode("utf-8"))
+                self._remember(self.users, user_id)
+
+                global_name = f"Global {index}"
+                get_character_module.GLOBAL_CHARACTER_STORE.put(
+                    global_name, json.dumps({"name": global_name}, ensure_ascii=False).encode("utf-8"))
+                self._remember(self.global_characters, global_name)
+
+            self.size = index + 1
+
+
+def _cleanup_call(handler_class):
+    def run():
+        handler_class.__new__(handler_class)._cleanup_old_data()
+        return 200
+    return run
+
+
+def build_workloads(modules, stores, rng):
+    """Эндпоинт -> функция, создающая n вызовов-запросов"""
+    init_handler = modules["init"].handler
+    store_handler = modules["store_data"].handler
+    get_data_handler = modules["get_data"].handler
+    settings_handler = modules["settings"].handler
+    characters_handler = modules["characters"].handler
+    get_character_handler = modules["get_character"].handler
+    bootstrap_handler = modules["bootstrap"].handler
+
+    def request(handler_class, method, path_factory, body=b"", headers=None):
+        def run():
+            status, _, _ = call(handler_class, method, path_factory(), body, headers)
+            return status
+        return run
+
+    payload = json.dumps({"text": "Привет, мир! " * 20}, ensure_ascii=False).encode("utf-8")
+    settings_body = json.dumps(dict(modules["settings"].DEFAULT_SETTINGS, temperature=0.5)).encode("utf-8")
+    character_body = json.dumps({"name": "Bench", "description": "Описание", "greeting": "Привет!"},
+                                ensure_ascii=False).encode("utf-8")
+
+    def user():
+        return rng.choice(stores.users)
+
+    return {
+        "POST /api/init": lambda: request(init_handler, "POST", lambda: "/api/init", payload),
+        "GET /api/init/:id": lambda: request(
+            init_handler, "GET", lambda: f"/api/init/{rng.choice(stores.init_ids)}"),
+        "POST /api/store_data": lambda: request(store_handler, "POST", lambda: "/api/store_data", payload),
+        "GET /api/get_data/:id": lambda: request(
+            get_data_handler, "GET", lambda: f"/api/get_data/{rng.choice(stores.data_ids)}"),
+        "GET /api/settings": lambda: request(
+            settings_handler, "GET", lambda: f"/api/settings?user_id={user()}"),
+        "POST /api/settings": lambda: request(
+            settings_handler, "POST", lambda: f"/api/settings?user_id={user()}", settings_body),
+        "GET /api/characters": lambda: request(
+            characters_handler, "GET", lambda: f"/api/characters?user_id={user()}"),
+        "GET /api/characters?limit=20": lambda: request(
+            characters_handler, "GET", lambda: f"/api/characters?user_id={user()}&limit=20"),
+        "GET /api/characters/:name": lambda: request(
+            characters_handler, "GET", lambda: f"/api/characters/Capitano?user_id={user()}"),
+        "POST /api/characters": lambda: request(
+            characters_handler, "POST", lambda: f"/api/characters?user_id={user()}", character_body),
+        "GET /api/get_character": lambda: request(
+            get_character_handler, "GET",
+            lambda: f"/api/get_character?name={quote(rng.choice(stores.global_characters))}"),
+        "GET /api/bootstrap": lambda: request(
+            bootstrap_handler, "GET", lambda: f"/api/bootstrap?user_id={user()}"),
+        "cleanup init_data": lambda: _cleanup_call(init_handler),
+        "cleanup data_storage": lambda: _cleanup_call(store_handler),
+    }
+
+
+def _load_modules():
+    names = {
+        "init": "api",
+        "store_data": "api.store_data",
+        "get_data": "api.get_data",
+        "settings": "api.settings",
+        "characters": "api.characters",
+        "get_character": "api.get_character",
+        "bootstrap": "api.bootstrap",
+    }
+    return {key: importlib.import_module(name) for key, name in names.items()}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every API endpoint at several storage sizes")
+    parser.add_argument("--sizes", default="1000,100000,1000000",
+                        help="comma-separated numbers of pre-populated entries per store")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint and size")
+    parser.add_argument("--endpoints", default="", help="comma-separated substrings to select endpoints")
+    parser.add_argument("--storage-root", default=None, help="directory for the stores (default: temp dir)")
+    parser.add_argument("--backend", default=os.environ.get("STORAGE_BACKEND", "files"), choices=["files", "sqlite"],
+                        help="storage backend (STORAGE_BACKEND)")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    sizes = sorted(int(size) for size in args.sizes.split(",") if size)
+    selected = [item.strip() for item in args.endpoints.split(",") if item.strip()]
+
+    # Путь к хранилищам должен быть задан до импорта обработчиков
+    storage_root = args.storage_root or tempfile.mkdtemp(prefix="lv_bench_")
+    os.environ["STORAGE_ROOT"] = storage_root
+    os.environ["STORAGE_BACKEND"] = args.backend
+    # Измеряются сами обработчики, а не лимиты частоты (для них есть bench.noisy_neighbor)
+    os.environ["RATE_LIMIT_IP_RATE"] = "0"
+    os.environ["RATE_LIMIT_USER_RATE"] = "0"
+    modules = _load_modules()
+
+    rng = random.Random(args.seed)
+    stores = Stores(modules, rng)
+    workloads = build_workloads(modules, stores, rng)
+
+    results = []
+    for size in sizes:
+        started = time.perf_counter()
+        stores.grow(size)
+        print(f"Populated {size} entries per store in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+
+        for endpoint, factory in workloads.items():
+            if selected and not any(item in endpoint for item in selected):
+                continue
+            run = factory()
+            recorder = Recorder().run(run for _ in range(args.requests))
+            results.append(recorder.summary(endpoint=endpoint, size=size))
+
+    print(format_table(results), file=sys.stderr)
+    write_results(results, args.output, {
+        "sizes": sizes,
+        "requests": args.requests,
+        "storage_root": storage_root,
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "revision": _git_revision(),
+        "timestamp": int(time.time())
+    })
+
+
+if __name__ == "__main__":
+    main()
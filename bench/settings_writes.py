@@ -0,0 +1,109 @@
+"""Усиление записи POST /api/settings при перетаскивании слайдеров.
+
+Запуск:
+    python -m bench.settings_writes --users 20 --steps 100 --interval-ms 20 --delays 0,0.25
+
+Каждый пользователь присылает полный объект настроек на каждом шаге
+перетаскивания (как settings.js при изменении слайдера), после каждого
+POST читает настройки обратно и проверяет, что видит только что
+отправленное значение. Для каждой задержки SETTINGS_WRITE_DELAY считается,
+сколько раз файл настроек был записан на диск в расчёте на один POST.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from bench.harness import Recorder, call, format_table, write_results
+
+
+def _run(settings_module, delay, users, steps, interval):
+    settings_module.SETTINGS_WRITE_DELAY = delay
+    handler = settings_module.handler
+
+    writes = 0
+    store = settings_module.SETTINGS_STORE
+    put = store.put
+
+    def counting_put(key, payload, expires_at=None):
+        nonlocal writes
+        writes += 1
+        return put(key, payload, expires_at)
+
+    store.put = counting_put
+    stale_reads = 0
+    try:
+        def drag(user_id, value):
+            def run():
+                nonlocal stale_reads
+                body = json.dumps(dict(settings_module.DEFAULT_SETTINGS, temperature=value)).encode("utf-8")
+                status, _, _ = call(handler, "POST", f"/api/settings?user_id={user_id}", body)
+                _, _, response = call(handler, "GET", f"/api/settings?user_id={user_id}")
+                if json.loads(response)["data"]["temperature"] != value:
+                    stale_reads += 1
+                return status
+            return run
+
+        def requests():
+            for step in range(steps):
+                started = time.perf_counter()
+                for index in range(users):
+                    yield drag(f"slider{index}", round(step / steps, 4))
+                # Шаги перетаскивания приходят не чаще, чем раз в interval
+                time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+        recorder = Recorder().run(requests())
+        settings_module.flush_pending_settings()
+    finally:
+        del store.put
+
+    posts = users * steps
+    result = recorder.summary(endpoint="POST+GET /api/settings (slider drag)", size=f"delay={delay}")
+    result.update({
+        "write_delay_s": delay,
+        "posts": posts,
+        "disk_writes": writes,
+        "writes_per_post": round(writes / posts, 4) if posts else 0.0,
+        "stale_reads": stale_reads
+    })
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure settings write amplification under slider-drag traffic")
+    parser.add_argument("--users", type=int, default=20, help="users dragging sliders at the same time")
+    parser.add_argument("--steps", type=int, default=100, help="POSTs per user during one drag")
+    parser.add_argument("--interval-ms", type=float, default=20.0, help="time between drag steps")
+    parser.add_argument("--delays", default="0,0.25", help="comma-separated SETTINGS_WRITE_DELAY values")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    # Путь к хранилищам должен быть задан до импорта обработчиков
+    storage_root = tempfile.mkdtemp(prefix="lv_bench_")
+    os.environ["STORAGE_ROOT"] = storage_root
+    # Перетаскивание слайдера шлёт запросы чаще лимита частоты, а измеряется слияние записей
+    os.environ["RATE_LIMIT_IP_RATE"] = "0"
+    os.environ["RATE_LIMIT_USER_RATE"] = "0"
+    from api import settings as settings_module
+
+    results = []
+    for delay in (float(value) for value in args.delays.split(",") if value):
+        results.append(_run(settings_module, delay, args.users, args.steps, args.interval_ms / 1000))
+
+    print(format_table(results), file=sys.stderr)
+    for result in results:
+        print(f"delay={result['write_delay_s']}: {result['disk_writes']} disk writes for {result['posts']} POSTs "
+              f"({result['writes_per_post']} per POST), stale reads: {result['stale_reads']}", file=sys.stderr)
+    write_results(results, args.output, {
+        "users": args.users,
+        "steps": args.steps,
+        "interval_ms": args.interval_ms,
+        "storage_root": storage_root,
+        "timestamp": int(time.time())
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -99,6 +99,9 @@ async function saveCharacter() {
         
         console.log("Character saved successfully via API");
         
+        // Заранее полученные данные персонажа больше не актуальны
+        delete prefetchedCharacterDetails[name];
+        
         // Отправляем данные в Telegram для обновления настроек бота
         const saveData = {
             action: 'save_character',
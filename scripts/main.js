@@ -31,6 +31,9 @@ let isDataLoading = false;
 // Текущий ID пользователя
 let currentUserId = 'default';
 
+// Данные персонажей, полученные заранее (например, при начальной загрузке)
+let prefetchedCharacterDetails = {};
+
 // Инициализация функций при загрузке документа
 document.addEventListener('DOMContentLoaded', function() {
     console.log("DOM loaded, initializing WebApp UI");
@@ -88,11 +91,12 @@ function loadInitialDataFromApi() {
     console.log("Loading initial data from API");
     showLoadingIndicator("Загрузка данных...");
     
-    // Запрашиваем список персонажей
-    fetchCharacterList()
-        .then(() => {
-            // После загрузки списка персонажей загружаем настройки
-            return fetchSettings();
+    // Пробуем получить все начальные данные одним запросом,
+    // при ошибке возвращаемся к отдельным запросам
+    fetchBootstrap()
+        .catch((error) => {
+            console.warn("Bootstrap request failed, falling back to separate requests:", error);
+            return loadInitialDataSeparately();
         })
         .then(() => {
             hideLoadingIndicator();
@@ -105,6 +109,55 @@ function loadInitialDataFromApi() {
         });
 }
 
+// Загрузка начальных данных отдельными запросами
+function loadInitialDataSeparately() {
+    // Запрашиваем список персонажей
+    return fetchCharacterList()
+        .then(() => {
+            // После загрузки списка персонажей загружаем настройки
+            return fetchSettings();
+        });
+}
+
+// Функция запроса настроек, списка персонажей и активного персонажа одним запросом
+async function fetchBootstrap() {
+    console.log("Fetching bootstrap data from API");
+    
+    const url = `${API_BASE_URL}/bootstrap?user_id=${currentUserId}`;
+    console.log("Fetching from URL:", url);
+    
+    const response = await fetch(url);
+    
+    if (!response.ok) {
+        throw new Error(`API returned status ${response.status}`);
+    }
+    
+    const result = await response.json();
+    console.log("Bootstrap response:", result);
+    
+    if (!result.success || !result.data) {
+        throw new Error(result.error || "Unknown error");
+    }
+    
+    // Список персонажей
+    characterNames = result.data.character_names || [];
+    renderCharacterList();
+    updateCharacterSelect();
+    
+    // Настройки
+    if (result.data.settings) {
+        updateUIWithSettings(result.data.settings);
+    }
+    
+    // Активный персонаж
+    if (result.data.character && result.data.character.name) {
+        prefetchedCharacterDetails[result.data.character.name] = result.data.character;
+        selectCharacterInUI(result.data.character);
+    }
+    
+    return true;
+}
+
 // Функция запроса списка персонажей через API
 async function fetchCharacterList() {
     console.log("Fetching character list from API");
@@ -184,6 +237,15 @@ async function fetchSettings() {
 // Запрос данных персонажа через API
 async function fetchCharacterDetails(name) {
     console.log("Fetching character details:", name);
+    
+    // Используем данные, полученные при начальной загрузке
+    if (prefetchedCharacterDetails[name]) {
+        const data = prefetchedCharacterDetails[name];
+        delete prefetchedCharacterDetails[name];
+        processCharacterDetails(data);
+        return true;
+    }
+    
     showLoadingIndicator("Загрузка данных персонажа...");
     
     try {
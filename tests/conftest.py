@@ -0,0 +1,18 @@
+"""Общая настройка тестов.
+
+Модули api/ читают STORAGE_ROOT и остальные переменные окружения при
+импорте, поэтому временное хранилище задаётся до их импорта.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["STORAGE_ROOT"] = tempfile.mkdtemp(prefix="lv_tests_")
+os.environ.setdefault("STORAGE_BACKEND", "files")
+# Все тесты идут с одного IP; лимиты частоты включают тесты api._ratelimit
+os.environ["RATE_LIMIT_IP_RATE"] = "0"
+os.environ["RATE_LIMIT_USER_RATE"] = "0"
+# Запись настроек синхронная; тесты отложенной записи включают её сами
+os.environ["SETTINGS_WRITE_DELAY"] = "0"
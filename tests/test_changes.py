@@ -0,0 +1,33 @@
+import json
+import time
+
+import pytest
+
+from api import changes
+from bench.harness import call
+
+
+@pytest.mark.parametrize("wait", ["nan", "NaN", "inf", "-inf", "x"])
+def test_non_finite_wait_is_400(wait):
+    started = time.monotonic()
+    status, _, body = call(changes.handler, "GET", f"/api/changes?user_id=changes-wait&wait={wait}")
+
+    assert status == 400
+    assert json.loads(body)["success"] is False
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize("value, expected", [("0", 0.0), ("-5", 0.0), ("0.25", 0.25), ("1e9", None)])
+def test_wait_is_clamped(value, expected):
+    if expected is None:
+        expected = changes.CHANGES_STREAM_TIMEOUT
+    assert changes.parse_wait(value) == expected
+
+
+def test_long_poll_returns_after_wait():
+    started = time.monotonic()
+    status, _, body = call(changes.handler, "GET", "/api/changes?user_id=changes-wait&wait=0.2")
+
+    assert status == 200
+    assert json.loads(body)["data"]["events"] == []
+    assert 0.15 < time.monotonic() - started < 2
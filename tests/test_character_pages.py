@@ -0,0 +1,129 @@
+import json
+import random
+import urllib.parse
+
+import pytest
+
+from api import _storage
+from api.characters import DEFAULT_CHARACTER_NAMES, handler
+from bench.harness import call
+
+# Имена с общими префиксами, кириллицей, иероглифами и символами вне BMP
+NAMES = sorted({"".join(random.Random(seed).choice("aabAБбя字😀_ ") for _ in range(random.Random(seed).randrange(1, 5)))
+                for seed in range(300)})
+PREFIXES = ["", "a", "ab", "Б", "字", "😀", "zz", "\U0010ffff"]
+
+
+def _expected(names, after, prefix, limit):
+    selected = [name for name in names if name.startswith(prefix) and (after is None or name > after)]
+    return selected if limit is None else selected[:limit]
+
+
+@pytest.mark.parametrize("prefix", PREFIXES)
+def test_sorted_page_matches_brute_force(prefix):
+    for after in [None, ""] + NAMES[::7]:
+        for limit in (None, 1, 5):
+            assert _storage.sorted_page(NAMES, after, prefix, limit) == _expected(NAMES, after, prefix, limit)
+
+
+@pytest.fixture(params=["files", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(_storage, "STORAGE_ROOT", str(tmp_path))
+    if request.param == "sqlite":
+        return _storage.SQLiteCharacterStore(_storage.SQLiteDatabase(str(tmp_path / "storage.sqlite3")))
+    return _storage.FileCharacterStore()
+
+
+@pytest.mark.parametrize("prefix", PREFIXES)
+def test_store_names_page_matches_sorted_page(store, prefix):
+    # В файловом хранилище "/" в имени недопустимо, остальные имена подходят обоим
+    store.put_many("pages", {name: b"{}" for name in NAMES})
+
+    for after in [None] + NAMES[::11]:
+        assert store.names_page("pages", after, prefix, 4) == _expected(NAMES, after, prefix, 4)
+
+
+def _page(user_id, limit, cursor=None, prefix=None):
+    query = {"user_id": user_id, "limit": limit}
+    if cursor is not None:
+        query["cursor"] = cursor
+    if prefix is not None:
+        query["prefix"] = prefix
+    status, _, body = call(handler, "GET", f"/api/characters?{urllib.parse.urlencode(query)}")
+    return status, json.loads(body)
+
+
+def _walk(user_id, limit, prefix=None):
+    names, cursor = [], None
+    while True:
+        status, body = _page(user_id, limit, cursor, prefix)
+        assert status == 200
+        names.extend(item["name"] for item in body["data"]["character_names"])
+        cursor = body["data"]["next_cursor"]
+        if cursor is None:
+            return names
+
+
+def _post(user_id, name):
+    body = json.dumps({"name": name}).encode('utf-8')
+    assert call(handler, "POST", f"/api/characters?user_id={user_id}", body)[0] == 200
+
+
+def test_pages_cover_merged_list_once():
+    user_names = ["Aria", "Capitano", "Дотторе-2", "Zed", "字"]
+    for name in user_names:
+        _post("walk", name)
+    expected = sorted(set(DEFAULT_CHARACTER_NAMES) | set(user_names))
+
+    for limit in (1, 2, 3, len(expected), 100):
+        assert _walk("walk", limit) == expected
+
+
+def test_prefix_filter_pages():
+    for name in ("Ann", "Anna", "Annette", "Bob"):
+        _post("prefix", name)
+
+    assert _walk("prefix", 2, prefix="Ann") == ["Ann", "Anna", "Annette"]
+    assert _walk("prefix", 2, prefix="Дот") == [name for name in sorted(DEFAULT_CHARACTER_NAMES)
+                                                 if name.startswith("Дот")]
+
+
+def test_cursor_survives_inserts_before_and_after_it():
+    for name in ("B", "D", "F"):
+        _post("stable", name)
+    status, first = _page("stable", 1, prefix="")
+    cursor = first["data"]["next_cursor"]
+    seen = [item["name"] for item in first["data"]["character_names"]]
+    assert status == 200 and len(seen) == 1
+
+    # Имя до курсора не попадает в следующие страницы, имя после — попадает
+    _post("stable", "0")
+    _post("stable", "E")
+    names, page_cursor = [], cursor
+    while page_cursor is not None:
+        _, body = _page("stable", 2, page_cursor)
+        names.extend(item["name"] for item in body["data"]["character_names"])
+        page_cursor = body["data"]["next_cursor"]
+
+    assert "E" in names and "0" not in names
+    assert len(names) == len(set(names)) and seen[0] not in names
+
+
+def test_page_not_modified():
+    _post("etag", "Ann")
+    status, headers, _ = call(handler, "GET", "/api/characters?user_id=etag&limit=2")
+    assert status == 200
+    headers = dict(headers)
+    etag = headers.get('ETag') or headers.get('Etag')
+
+    status, _, _ = call(handler, "GET", "/api/characters?user_id=etag&limit=2", headers={'If-None-Match': etag})
+    assert status == 304
+    # Другой запрос — другой ETag
+    status, _, _ = call(handler, "GET", "/api/characters?user_id=etag&limit=3", headers={'If-None-Match': etag})
+    assert status == 200
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=1001", "limit=x", "limit=5&cursor=%25%25%25"])
+def test_invalid_page_parameters_are_400(query):
+    status, _, _ = call(handler, "GET", f"/api/characters?user_id=invalid&{query}")
+    assert status == 400
@@ -0,0 +1,28 @@
+import os
+import statistics
+
+import pytest
+
+from bench.cold_start import FIRST_REQUESTS, measure
+
+# Бюджет холодного старта функции (импорт и первый ответ) в миллисекундах.
+# Он с большим запасом: тест ловит тяжёлый импорт на уровне модуля, а не
+# колебания скорости машины. Точные цифры даёт python -m bench.cold_start
+COLD_START_BUDGET_MS = float(os.environ.get("COLD_START_BUDGET_MS", "250"))
+COLD_START_RUNS = 3
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module_name", list(FIRST_REQUESTS))
+def test_cold_start_within_budget(module_name, monkeypatch):
+    # Дочерний процесс должен найти api и bench из любого каталога запуска
+    monkeypatch.setenv("PYTHONPATH", REPO_ROOT)
+    method, path, body = FIRST_REQUESTS[module_name]
+
+    runs = [measure(module_name, method, path, body) for _ in range(COLD_START_RUNS)]
+    cold_start_ms = statistics.median(import_ms + request_ms for import_ms, request_ms, _ in runs)
+
+    assert all(status < 500 for _, _, status in runs), runs
+    assert cold_start_ms <= COLD_START_BUDGET_MS, (
+        f"{module_name}: cold start {cold_start_ms:.1f} ms is over the budget of {COLD_START_BUDGET_MS} ms")
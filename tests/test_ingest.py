@@ -0,0 +1,118 @@
+import io
+import json
+import random
+
+import pytest
+
+from api import _codec
+from api._ingest import RequestBodyError, parse_staged_object, staged_json_object
+from api._storage import record_store
+
+
+class _Request:
+    def __init__(self, body):
+        self.headers = {"Content-Length": str(len(body))}
+        self.rfile = io.BytesIO(body)
+
+
+def _random_value(rng, depth=0):
+    kind = rng.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rng.choice([None, True, False])
+    if kind == 1:
+        return rng.randint(-10 ** 12, 10 ** 12)
+    if kind == 2:
+        return rng.uniform(-1e6, 1e6)
+    if kind in (3, 4):
+        return "".join(rng.choice('ab"\\/\n\tё字 😀{}[],:') for _ in range(rng.randrange(6)))
+    if kind == 5:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{index}": _random_value(rng, depth + 1) for index in range(rng.randrange(4))}
+
+
+def _documents(count=300):
+    rng = random.Random(13)
+    for _ in range(count):
+        value = rng.choice([{}, []]) if rng.random() < 0.05 else _random_value(rng)
+        text = json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        text = rng.choice(["", " ", "\n"]) + text + rng.choice(["", "\n", " \r\n"])
+        data = text.encode('utf-8')
+        yield data
+        # Повреждённые варианты: обрезка и замена одного байта
+        if len(data) > 1:
+            yield data[:rng.randrange(1, len(data))]
+            position = rng.randrange(len(data))
+            yield data[:position] + bytes([rng.choice(b'{}[]",:x\x00\xff0 ')]) + data[position + 1:]
+
+
+def _json_loads_object(data):
+    try:
+        # Тела принимаются только в UTF-8: json.loads из bytes угадал бы кодировку
+        value = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def test_validator_agrees_with_json_loads():
+    checked = rejected = 0
+    for data in _documents():
+        expected = _json_loads_object(data)
+        checked += 1
+        if expected is None:
+            rejected += 1
+            with pytest.raises(RequestBodyError) as error:
+                parse_staged_object(io.BytesIO(data))
+            assert error.value.status == 400, data
+            continue
+
+        object_end, empty, seen_keys = parse_staged_object(io.BytesIO(data), watch_keys=("k0", "missing"))
+        assert data[object_end:object_end + 1] == b"}", data
+        assert data[object_end + 1:].strip() == b"", data
+        assert empty == (not expected), data
+        assert seen_keys == {"k0"}.intersection(expected), data
+    # Среди образцов есть и принятые, и отклонённые тела
+    assert 0 < rejected < checked
+
+
+@pytest.mark.skipif(_codec.orjson is None, reason="the standard json module accepts these extensions")
+@pytest.mark.parametrize("data", [b'{"a": NaN}', b'{"a": 1e400}', b'{"a": "\\ud800"}'])
+def test_validator_rejects_what_stored_bodies_cannot_be_read_back_with(data):
+    # json.loads принимает эти расширения, но записи читаются парсером api._codec
+    with pytest.raises(RequestBodyError):
+        parse_staged_object(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("data", [
+    '{"a": "ё"}'.encode('utf-16'),
+    '{"a": "ё"}'.encode('utf-16-le'),
+    '{"a": "ё"}'.encode('utf-32'),
+    b'\xef\xbb\xbf{"a": 1}',
+    b'{"a": "\xed\xa0\x80"}',
+    b'{"a": "\xff"}'
+])
+def test_non_utf8_bodies_are_rejected(data):
+    # Поля дописываются в UTF-8 по байтовому смещению, поэтому другие кодировки испортились бы
+    with pytest.raises(RequestBodyError) as error:
+        parse_staged_object(io.BytesIO(data))
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize("body", [b'{}', b' {"message": "hi", "created_at": 1}\n'])
+def test_appended_fields_override_body_fields(body):
+    with staged_json_object(_Request(body), record_store("data_storage")) as staged:
+        staged.append_fields({"created_at": 100, "expires_at": 200})
+        staged.file.seek(0)
+        stored = json.loads(staged.file.read())
+
+    assert stored == dict(json.loads(body), created_at=100, expires_at=200)
+
+
+def test_short_body_is_rejected():
+    request = _Request(b'{"a": 1}')
+    request.headers["Content-Length"] = "100"
+
+    with pytest.raises(RequestBodyError) as error:
+        with staged_json_object(request, record_store("data_storage")):
+            pass
+    assert error.value.status == 400
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from api import _storage
+
+
+@pytest.fixture
+def legacy_store(tmp_path, monkeypatch):
+    # Файлы персонажей в формате до манифестов: {name}_{user_id}.json
+    monkeypatch.setattr(_storage, "STORAGE_ROOT", str(tmp_path))
+    directory = tmp_path / _storage.CHARACTER_DIRNAME
+    directory.mkdir()
+    for filename in ("Alice_1.json", "AI_Assistant_1.json", "Bob_tg_42.json", "Carol_tg_42.json", "Дед_7.json"):
+        (directory / filename).write_bytes(b'{"name": "x"}')
+    return _storage.FileCharacterStore
+
+
+def test_user_ids_with_underscore_keep_their_characters(legacy_store):
+    store = legacy_store()
+
+    assert store.names("tg_42")[0] == ["Bob", "Carol"]
+    assert store.names("1")[0] == ["AI_Assistant", "Alice"]
+    assert store.names("7")[0] == ["Дед"]
+    # Неоднозначные имена файлов не приписываются пользователю по последнему "_"
+    assert "Bob" not in store.names("42")[0]
+
+
+def test_legacy_names_are_resolved_in_every_process(legacy_store):
+    store = legacy_store()
+    store.migrate_manifests()
+    store.put("tg_42", "Dave", b"{}")
+
+    # Другой процесс: миграция уже выполнена, манифест уже есть
+    other_process = legacy_store()
+    assert other_process.names("tg_42")[0] == ["Bob", "Carol", "Dave"]
+
+
+def test_deleted_legacy_file_is_not_resolved(legacy_store):
+    store = legacy_store()
+    store.migrate_manifests()
+    os.remove(store.path("tg_42", "Carol"))
+
+    assert store.names("tg_42")[0] == ["Bob"]
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from api import _ratelimit, import_data, settings
+from api.characters import handler
+from bench.harness import call
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1700000000.0]
+    monkeypatch.setattr(_ratelimit.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def buckets(tmp_path, monkeypatch):
+    buckets = _ratelimit.TokenBuckets(str(tmp_path / "rate_limits.bin"), slots=64)
+    monkeypatch.setattr(_ratelimit, "BUCKETS", buckets)
+    return buckets
+
+
+def test_burst_is_admitted_then_refilled_at_rate(buckets, clock):
+    assert [buckets.take("user:1", rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("user:1", rate=2, burst=3) == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert buckets.take("user:1", rate=2, burst=3) == 0
+    assert buckets.take("user:1", rate=2, burst=3) > 0
+
+    # За долгую паузу накапливается не больше burst
+    clock[0] += 60
+    assert [buckets.take("user:1", rate=2, burst=3) for _ in range(4)][-1] > 0
+
+
+def test_keys_are_independent(buckets, clock):
+    buckets.take("user:1", rate=1, burst=1)
+
+    assert buckets.take("user:1", rate=1, burst=1) > 0
+    assert buckets.take("user:2", rate=1, burst=1) == 0
+
+
+def test_buckets_are_shared_through_the_file(buckets, clock):
+    # Второй экземпляр на том же файле — как другой воркер api.serve
+    other_worker = _ratelimit.TokenBuckets(buckets.path, slots=buckets.slots)
+    buckets.take("user:1", rate=1, burst=2)
+    other_worker.take("user:1", rate=1, burst=2)
+
+    assert buckets.take("user:1", rate=1, burst=2) > 0
+
+
+def test_full_neighbourhood_evicts_least_recently_used(buckets, clock):
+    # Больше ключей, чем ячеек: корзины вытесняются, но каждый ключ обслуживается
+    for index in range(buckets.slots * 2):
+        clock[0] += 0.001
+        assert buckets.take(f"user:{index}", rate=1, burst=1) == 0
+
+
+def test_admit_answers_429_before_reading_body(buckets, clock, monkeypatch):
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_USER_RATE", 1.0)
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_USER_BURST", 2.0)
+    body = json.dumps({"name": "Limited"}).encode('utf-8')
+
+    statuses = [call(handler, "POST", "/api/characters?user_id=limited", body)[0] for _ in range(2)]
+    status, headers, response = call(handler, "POST", "/api/characters?user_id=limited", body)
+
+    assert statuses == [200, 200]
+    assert status == 429
+    assert headers["Retry-After"] == "1"
+    assert headers["Connection"] == "close"
+    assert json.loads(response)["retry_after"] == pytest.approx(1.0)
+    # Лимит пользователя не задевает других пользователей с того же IP
+    assert call(handler, "POST", "/api/characters?user_id=other", body)[0] == 200
+
+
+def test_ip_limit_applies_across_users(buckets, clock, monkeypatch):
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_IP_RATE", 1.0)
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_IP_BURST", 1.0)
+    body = b'{"name": "Limited"}'
+
+    assert call(handler, "POST", "/api/characters?user_id=a", body, client_ip="10.0.0.1")[0] == 200
+    assert call(handler, "POST", "/api/characters?user_id=b", body, client_ip="10.0.0.1")[0] == 429
+    assert call(handler, "POST", "/api/characters?user_id=b", body, client_ip="10.0.0.2")[0] == 200
+
+
+SETTINGS_BODY = json.dumps(settings.DEFAULT_SETTINGS).encode('utf-8')
+IMPORT_BODY = b'{"type": "character", "data": {"name": "Imported"}}\n'
+
+
+@pytest.mark.parametrize("handler_class, method, path, body", [
+    (settings.handler, "POST", "/api/settings?user_id={user_id}", SETTINGS_BODY),
+    (settings.handler, "PATCH", "/api/settings?user_id={user_id}", b'{"top_k": 3}'),
+    (import_data.handler, "POST", "/api/import?user_id={user_id}", IMPORT_BODY),
+])
+def test_write_endpoints_are_admitted(buckets, clock, monkeypatch, handler_class, method, path, body):
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_USER_RATE", 1.0)
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_USER_BURST", 2.0)
+    user_path = path.format(user_id=f"limited-{method}-{handler_class.__module__}")
+
+    statuses = [call(handler_class, method, user_path, body)[0] for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    assert call(handler_class, method, path.format(user_id="other-writer"), body)[0] == 200
+    # Запрос сверх лимита ничего не записал
+    if handler_class is settings.handler:
+        _, _, response = call(settings.handler, "GET", user_path)
+        assert json.loads(response)["data"]["version"] == 2
+
+
+def test_unavailable_limiter_admits(monkeypatch):
+    monkeypatch.setattr(_ratelimit, "RATE_LIMIT_USER_RATE", 1.0)
+
+    class Broken:
+        def take(self, key, rate, burst):
+            raise OSError("read-only file system")
+
+    monkeypatch.setattr(_ratelimit, "BUCKETS", Broken())
+
+    status, _, _ = call(handler, "POST", "/api/characters?user_id=broken", b'{"name": "Admitted"}')
+    assert status == 200
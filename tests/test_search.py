@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from api._search import SearchIndex, build_index
+
+CHARACTERS = [
+    ("Алиса", {"description": "Любопытная девочка из Страны чудес", "greeting": "Привет!"}),
+    ("Шерлок", {"description": "Консультирующий детектив с Бейкер-стрит", "greeting": "Вы были в Афганистане"}),
+    ("悟空", {"description": "美猴王，齐天大圣", "greeting": "俺老孙来也"}),
+    ("Captain", {"description": "Commands the starship Enterprise", "greeting": "Make it so"}),
+]
+
+
+def _build(characters):
+    # Имя индексируется из данных персонажа, как они лежат в хранилище
+    return build_index((name, dict(data, name=name)) for name, data in characters)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return _build(CHARACTERS)
+
+
+def _names(index, query):
+    return [name for name, _ in index.search(query, 10)]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Алиса", "Алиса"),
+    ("Алса", "Алиса"),       # пропущен символ
+    ("Алисса", "Алиса"),     # лишний символ
+    ("Олиса", "Алиса"),      # замена символа
+    ("детиктив", "Шерлок"),  # опечатка в описании
+    ("страна", "Алиса"),
+    ("大圣", "悟空"),          # два иероглифа из описания
+    ("starshp", "Captain"),
+    ("Enterprize", "Captain"),
+])
+def test_query_with_one_typo_finds_character(index, query, expected):
+    assert _names(index, query)[:1] == [expected]
+
+
+def test_single_typo_is_always_tolerated():
+    # Случайное слово описания с одной случайной правкой находится всегда
+    rng = random.Random(3)
+    alphabet = "абвгдежзиклмнопрстуфхцчшщыэюя"
+    characters = [(f"c{index}", {"description": " ".join("".join(rng.choice(alphabet) for _ in range(rng.randrange(4, 12)))
+                                                         for _ in range(8))})
+                  for index in range(60)]
+    index = _build(characters)
+    for _ in range(300):
+        name, character = rng.choice(characters)
+        word = rng.choice(character["description"].split())
+        position = rng.randrange(len(word))
+        edit = rng.randrange(3)
+        if edit == 0:
+            query = word[:position] + word[position + 1:]
+        elif edit == 1:
+            query = word[:position] + rng.choice(alphabet) + word[position:]
+        else:
+            query = word[:position] + rng.choice(alphabet) + word[position + 1:]
+        if len(query) < 2:
+            continue
+        assert name in [found for found, _ in index.search(query, len(characters))], query
+
+
+def test_exact_match_ranks_above_typo():
+    index = _build([("Мария", {}), ("Марина", {})])
+
+    assert _names(index, "Мария")[0] == "Мария"
+    assert _names(index, "Марина")[0] == "Марина"
+
+
+def test_snapshot_round_trip(index):
+    restored = SearchIndex.from_bytes(index.to_bytes("u"), "u")
+
+    assert restored.search("Алса", 5) == index.search("Алса", 5)
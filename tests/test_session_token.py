@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytest
+
+from api import _session_token, handler
+from bench.harness import call
+
+
+@pytest.fixture
+def secrets(monkeypatch):
+    monkeypatch.setattr(_session_token, "SESSION_TOKEN_SECRETS", [b"current", b"previous"])
+
+
+def _resign(token, secret):
+    # Тот же токен, подписанный другим ключом
+    signed = token.rpartition(".")[0]
+    return f"{signed}.{_session_token._encode(_session_token._signature(secret, signed))}"
+
+
+def test_issue_and_read_round_trip(secrets):
+    payload = json.dumps({"user": "42", "text": "привет"}).encode('utf-8')
+    token = _session_token.issue(payload, 1700000000)
+
+    assert _session_token.is_token(token)
+    assert _session_token.read(token) == (payload, 1700000000)
+    assert _session_token.expires_at(token) == 1700000000
+
+
+def test_previous_secret_still_verifies(secrets):
+    token = _resign(_session_token.issue(b"{}", 1700000000), b"previous")
+
+    assert _session_token.read(token) == (b"{}", 1700000000)
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda token: _resign(token, b"unknown"),
+    # Срок действия подписан вместе с данными
+    lambda token: token.replace(".1700000000.", ".1900000000.", 1),
+    lambda token: token[:-2] + ("AA" if not token.endswith("AA") else "BB"),
+    lambda token: token.rpartition(".")[0] + ".",
+    lambda token: "s1.garbage",
+])
+def test_tampered_token_is_rejected(secrets, tamper):
+    token = tamper(_session_token.issue(b'{"a": 1}', 1700000000))
+
+    with pytest.raises(_session_token.InvalidToken):
+        _session_token.read(token)
+    with pytest.raises(_session_token.InvalidToken):
+        _session_token.expires_at(token)
+
+
+def test_issue_without_secret_or_over_limit(monkeypatch):
+    monkeypatch.setattr(_session_token, "SESSION_TOKEN_SECRETS", [])
+    assert _session_token.issue(b"{}", 1700000000) is None
+
+    monkeypatch.setattr(_session_token, "SESSION_TOKEN_SECRETS", [b"current"])
+    monkeypatch.setattr(_session_token, "SESSION_TOKEN_MAX_LENGTH", 64)
+    assert _session_token.issue(bytes(range(256)) * 4, 1700000000) is None
+
+
+def test_init_returns_token_that_get_serves(secrets):
+    status, _, body = call(handler, "POST", "/api/init", b'{"chat_id": 7}')
+    session_id = json.loads(body)["session_id"]
+
+    assert status == 200
+    assert _session_token.is_token(session_id)
+
+    status, _, body = call(handler, "GET", f"/api/init/{session_id}")
+    assert status == 200
+    assert json.loads(body)["data"]["chat_id"] == 7
+
+
+def test_expired_token_is_gone(secrets):
+    expired = int(time.time()) - 10
+    payload = json.dumps({"chat_id": 7, "created_at": expired - 60, "expires_at": expired}).encode('utf-8')
+    token = _session_token.issue(payload, expired)
+
+    status, _, _ = call(handler, "GET", f"/api/init/{token}")
+    assert status == 410
+
+
+def test_forged_token_is_not_found(secrets):
+    token = _resign(_session_token.issue(b'{"chat_id": 7}', int(time.time()) + 60), b"unknown")
+
+    status, _, _ = call(handler, "GET", f"/api/init/{token}")
+    assert status == 404
@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from api import settings
+from bench.harness import call
+
+
+def _patch(user_id, changes, if_match=None):
+    headers = {"If-Match": if_match} if if_match is not None else {}
+    status, response_headers, body = call(settings.handler, "PATCH", f"/api/settings?user_id={user_id}",
+                                          json.dumps(changes).encode('utf-8'), headers)
+    return status, response_headers.get("ETag"), json.loads(body)
+
+
+def _get(user_id):
+    status, headers, body = call(settings.handler, "GET", f"/api/settings?user_id={user_id}")
+    assert status == 200
+    return headers["ETag"], json.loads(body)["data"]
+
+
+def test_patch_with_current_version_applies_and_bumps_it():
+    status, _, body = _patch("patch-version", {"temperature": 0.3}, '"0"')
+    assert status == 200
+    assert body["data"]["version"] == 1
+    assert body["data"]["temperature"] == 0.3
+
+    status, _, body = _patch("patch-version", {"top_k": 5}, "1")
+    assert status == 200
+    assert body["data"]["version"] == 2
+    # Предыдущее изменение сохранилось
+    assert body["data"]["temperature"] == 0.3
+
+
+def test_stale_version_gets_409_with_current_settings():
+    _patch("patch-conflict", {"temperature": 0.3})
+    _patch("patch-conflict", {"temperature": 0.4})
+
+    status, _, body = _patch("patch-conflict", {"top_k": 9}, '"1"')
+
+    assert status == 409
+    assert body["success"] is False
+    assert body["data"]["version"] == 2
+    assert body["data"]["temperature"] == 0.4
+    _, data = _get("patch-conflict")
+    assert data["top_k"] == settings.DEFAULT_SETTINGS["top_k"]
+
+
+def test_etag_from_get_and_patch_is_accepted_in_if_match():
+    etag, data = _get("patch-etag")
+    assert data["version"] == 0
+
+    status, patch_etag, body = _patch("patch-etag", {"top_p": 0.5}, etag)
+    assert status == 200
+    assert patch_etag == _get("patch-etag")[0]
+
+    # ETag до изменения устарел, ETag из ответа PATCH — нет
+    assert _patch("patch-etag", {"top_p": 0.6}, etag)[0] == 409
+    assert _patch("patch-etag", {"top_p": 0.6}, f"W/{patch_etag}")[0] == 200
+
+
+def test_encoded_representation_etag_matches():
+    etag, _ = _get("patch-encoded")
+
+    assert _patch("patch-encoded", {"top_k": 2}, f'{etag[:-1]}-gzip"')[0] == 200
+
+
+def test_without_if_match_last_writer_wins():
+    _patch("patch-blind", {"top_k": 2})
+
+    status, _, body = _patch("patch-blind", {"top_k": 3})
+    assert status == 200
+    assert body["data"]["version"] == 2
+
+
+@pytest.mark.parametrize("header", ["abc", '"', "1.5"])
+def test_malformed_if_match_is_400(header):
+    assert _patch("patch-malformed", {"top_k": 2}, header)[0] == 400
+
+
+def test_null_restores_default_and_only_overrides_are_stored():
+    _patch("patch-null", {"temperature": 0.3, "top_k": 4})
+    status, _, body = _patch("patch-null", {"temperature": None})
+
+    assert status == 200
+    assert body["data"]["temperature"] == settings.DEFAULT_SETTINGS["temperature"]
+    stored = json.loads(settings.SETTINGS_STORE.get("patch-null").payload)
+    assert stored["overrides"] == {"top_k": 4}
+
+
+def _post(user_id, **changes):
+    body = dict(settings.DEFAULT_SETTINGS, **changes)
+    status, _, _ = call(settings.handler, "POST", f"/api/settings?user_id={user_id}",
+                        json.dumps(body).encode('utf-8'))
+    assert status == 200
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    # Запись откладывается надолго, чтобы тест сам решал, когда её сбросить
+    monkeypatch.setattr(settings, "SETTINGS_WRITE_DELAY", 30.0)
+    yield
+    settings.flush_pending_settings()
+
+
+def test_write_behind_version_and_etag_survive_flush(write_behind):
+    _post("patch-delayed", temperature=0.1)
+    _post("patch-delayed", temperature=0.2)
+    pending_etag, pending = _get("patch-delayed")
+    assert pending["version"] == 2
+
+    settings.flush_pending_settings()
+    flushed_etag, flushed = _get("patch-delayed")
+    assert flushed["version"] == 2
+    assert flushed_etag == pending_etag
+    assert json.loads(settings.SETTINGS_STORE.get("patch-delayed").payload)["version"] == 2
+
+
+def test_patch_after_delayed_posts_accepts_acknowledged_version(write_behind):
+    _post("patch-delayed-match", temperature=0.1)
+    _post("patch-delayed-match", temperature=0.2)
+    _post("patch-delayed-match", temperature=0.3)
+    etag, data = _get("patch-delayed-match")
+
+    status, _, body = _patch("patch-delayed-match", {"top_k": 7}, str(data["version"]))
+    assert status == 200
+    assert body["data"]["version"] == data["version"] + 1
+    assert body["data"]["temperature"] == 0.3
+
+    _post("patch-delayed-match", temperature=0.4)
+    etag, _ = _get("patch-delayed-match")
+    assert _patch("patch-delayed-match", {"top_k": 8}, etag)[0] == 200
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from api import get_data, store_data
+from bench.harness import call
+
+
+def _store(body):
+    status, _, response = call(store_data.handler, "POST", "/api/store_data", json.dumps(body).encode('utf-8'))
+    return status, json.loads(response)
+
+
+def _get(data_id):
+    status, _, response = call(get_data.handler, "GET", f"/api/get_data/{data_id}")
+    return status, json.loads(response)
+
+
+@pytest.mark.parametrize("meta", [5, [], "x", None, True])
+def test_non_object_meta_is_400(meta):
+    status, body = _store({"text": "hi", "meta": meta})
+
+    assert status == 400
+    assert body["success"] is False
+
+
+@pytest.mark.parametrize("body", [{"text": "hi", "meta": {"source": "bot"}}, {"text": "hi"}, {}])
+def test_stored_data_gets_lifetime_in_meta(body):
+    status, stored = _store(body)
+    assert status == 200
+
+    status, response = _get(stored["id"])
+    assert status == 200
+    data = response["data"]
+    assert data["meta"]["expires_at"] - data["meta"]["created_at"] == store_data.DATA_TTL
+    if "meta" in body:
+        assert data["meta"]["source"] == "bot"